@@ -0,0 +1,156 @@
+import os
+import re
+import asyncio
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+from pydantic import ValidationError
+from langchain_core.exceptions import OutputParserException
+from utils.db_utils import add_expenses
+from utils.expense_fields import repair_expense
+from utils.expense_parser import parse_confident_expense, money_amounts
+import agents.data_entry_agent as data_entry_agent
+
+# Pasted blocks with at least this many entries are ingested in bulk
+BULK_MIN_ENTRIES = int(os.getenv("BULK_MIN_ENTRIES", "3"))
+# Entries sent to the LLM per call, and how many calls may run at once
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "25"))
+BULK_MAX_CONCURRENCY = int(os.getenv("BULK_MAX_CONCURRENCY", "8"))
+# Extra attempts for a batch whose structured output could not be parsed. Provider
+# failures (429s, 5xx, timeouts) are already retried by the LLM gateway.
+BULK_MAX_RETRIES = int(os.getenv("BULK_MAX_RETRIES", "2"))
+MALFORMED_OUTPUT = (OutputParserException, ValidationError)
+
+BULLET = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+")
+
+def split_entries(text):
+    """One entry per non-empty line, with list bullets and numbering removed"""
+    entries = []
+    for line in text.splitlines():
+        line = BULLET.sub("", line).strip()
+        if line:
+            entries.append(line)
+    return entries
+
+def looks_like_statement(text):
+    # Several lines, nearly all of which mention a money-shaped amount ("Day 2 Kyoto" does not);
+    # anything less clear-cut goes to the router
+    entries = split_entries(text)
+    if len(entries) < BULK_MIN_ENTRIES:
+        return False
+    with_amounts = sum(1 for entry in entries if money_amounts(entry))
+    return with_amounts >= 0.8 * len(entries)
+
+def plan_batches(entries, today):
+    # Entries the local parser is sure about need no LLM call at all
+    records, pending = {}, []
+    for index, entry in enumerate(entries):
+        record = parse_confident_expense(entry, today)
+        if record is not None:
+            records[index] = [record]
+        else:
+            pending.append(index)
+    batches = [pending[i:i + BULK_BATCH_SIZE] for i in range(0, len(pending), BULK_BATCH_SIZE)]
+    return records, batches
+
+def batch_input(entries, batch):
+    numbered = "\n".join(f"{n}. {entries[index]}" for n, index in enumerate(batch, start=1))
+    return f"Each numbered line is a separate transaction note; set source_line to its number.\n{numbered}"
+
+def assign_batch_results(extracted, batch, today, records, errors, entries):
+    found = {}
+    for expense in extracted.expenses if extracted else []:
+        line = expense.source_line
+        if line is None or not 1 <= line <= len(batch):
+            continue
+        index = batch[line - 1]
+        record, notes = repair_expense(expense.model_dump(), today)
+        if record is None:
+            errors.append({"line": index + 1, "text": entries[index], "error": "; ".join(notes)})
+        else:
+            found.setdefault(index, []).append(record)
+    for index in batch:
+        if index in found:
+            records[index] = found[index]
+        elif not any(error["line"] == index + 1 for error in errors):
+            errors.append({"line": index + 1, "text": entries[index], "error": "no expense found"})
+
+def batch_failed(batch, entries, errors, exc):
+    for index in batch:
+        errors.append({"line": index + 1, "text": entries[index], "error": f"extraction failed: {exc}"})
+
+def commit_report(user_id, entries, records, errors, llm_calls):
+    # All parsed entries are written in a single transaction, in paste order
+    ordered = [record for index in sorted(records) for record in records[index]]
+    added = add_expenses(user_id, ordered) if user_id is not None else 0
+    return {
+        "entries": len(entries),
+        "added": added,
+        "records": ordered,
+        "errors": sorted(errors, key=lambda error: error["line"]),
+        "llm_calls": llm_calls,
+    }
+
+def _extract_with_retries(payload):
+    for attempt in range(BULK_MAX_RETRIES + 1):
+        try:
+            return data_entry_agent.expense_extractor.invoke(payload)
+        except MALFORMED_OUTPUT:
+            if attempt == BULK_MAX_RETRIES:
+                raise
+
+async def _aextract_with_retries(payload):
+    for attempt in range(BULK_MAX_RETRIES + 1):
+        try:
+            return await data_entry_agent.expense_extractor.ainvoke(payload)
+        except MALFORMED_OUTPUT:
+            if attempt == BULK_MAX_RETRIES:
+                raise
+
+def ingest_statement(user_id, text):
+    """Parse a pasted block of transaction notes with bounded parallel LLM calls and save it"""
+    today = date.today()
+    entries = split_entries(text)
+    records, batches = plan_batches(entries, today)
+    errors = []
+    if batches:
+        payloads = [{"user_input": batch_input(entries, batch), "today": today.isoformat()} for batch in batches]
+        with ThreadPoolExecutor(max_workers=min(BULK_MAX_CONCURRENCY, len(batches))) as pool:
+            futures = [pool.submit(_extract_with_retries, payload) for payload in payloads]
+            for batch, future in zip(batches, futures):
+                try:
+                    assign_batch_results(future.result(), batch, today, records, errors, entries)
+                except Exception as exc:
+                    batch_failed(batch, entries, errors, exc)
+    return commit_report(user_id, entries, records, errors, len(batches))
+
+async def aingest_statement(user_id, text):
+    today = date.today()
+    entries = split_entries(text)
+    records, batches = plan_batches(entries, today)
+    errors = []
+    limiter = asyncio.Semaphore(BULK_MAX_CONCURRENCY)
+
+    async def run_batch(batch):
+        async with limiter:
+            return await _aextract_with_retries({"user_input": batch_input(entries, batch), "today": today.isoformat()})
+
+    results = await asyncio.gather(*(run_batch(batch) for batch in batches), return_exceptions=True)
+    for batch, result in zip(batches, results):
+        if isinstance(result, Exception):
+            batch_failed(batch, entries, errors, result)
+        else:
+            assign_batch_results(result, batch, today, records, errors, entries)
+    return await asyncio.to_thread(commit_report, user_id, entries, records, errors, len(batches))
+
+def format_report(report):
+    if not report["records"]:
+        response = f"I couldn't find any expenses in those {report['entries']} lines."
+    else:
+        response = f"Imported {len(report['records'])} transactions from {report['entries']} lines."
+    if report["errors"]:
+        response += f"\n{len(report['errors'])} line(s) could not be imported:"
+        for error in report["errors"][:10]:
+            response += f"\n- line {error['line']} ({error['text']}): {error['error']}"
+        if len(report["errors"]) > 10:
+            response += f"\n- ...and {len(report['errors']) - 10} more"
+    return response
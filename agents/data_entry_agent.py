@@ -1,36 +1,67 @@
-import os
-from dotenv import load_dotenv
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
-from langchain_openai import ChatOpenAI
-
-load_dotenv()
-os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-
-prompt = PromptTemplate(
-    input_variables=["user_input"],
-    template="""
-You are a helpful assistant that converts natural language expense entries into valid SQL INSERT statements
-for a SQLite database called `expense_tracker.db`.
-
-The `expenses` table has the following columns:
-- expense_id (INTEGER, PRIMARY KEY)
-- user_id (INTEGER)
-- amount (REAL)
-- category (TEXT)
-- date (TEXT)
-- description (TEXT)
-- recurring (BOOLEAN)
-- location (TEXT)
-- payment_method (TEXT)
-
-Assume user_id is 1. Today's date is CURRENT_DATE.
-Every time you must start your response with: "Here is the SQL statement:"
-
-Input: {user_input}
-Output: SQL INSERT statement:
-"""
-)
-
-sql_chain = LLMChain(llm=llm, prompt=prompt)
\ No newline at end of file
+import os
+from datetime import date
+from typing import List, Optional, Union
+from dotenv import load_dotenv
+from pydantic import BaseModel, Field
+from langchain_core.prompts import ChatPromptTemplate
+from utils.llm_limits import LimitedChatOpenAI
+from utils.telemetry import telemetry_callbacks
+from utils.expense_fields import EXPENSE_CATEGORIES, PAYMENT_METHODS, repair_expense
+
+load_dotenv()
+os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
+llm = LimitedChatOpenAI(model="gpt-4o-mini", temperature=0, callbacks=telemetry_callbacks, metadata={"agent": "insertion"})
+
+# Field types are deliberately loose: bad values are repaired per field after
+# extraction instead of failing validation for the whole message.
+class ExtractedExpense(BaseModel):
+    """One expense mentioned by the user."""
+    amount: Optional[Union[float, str]] = Field(description="Amount spent as a number, without currency symbols")
+    category: Optional[str] = Field(None, description=f"One of: {', '.join(EXPENSE_CATEGORIES)}")
+    date: Optional[str] = Field(None, description="Date of the expense as YYYY-MM-DD")
+    description: Optional[str] = Field(None, description="Short note about what was bought")
+    recurring: Optional[Union[bool, str]] = Field(None, description="True if the expense repeats (e.g. monthly)")
+    location: Optional[str] = Field(None, description="Where the expense happened, if mentioned")
+    payment_method: Optional[str] = Field(None, description=f"One of: {', '.join(PAYMENT_METHODS)}")
+    source_line: Optional[int] = Field(None, description="Number of the input line this expense came from, when the input lines are numbered")
+
+class ExtractedExpenses(BaseModel):
+    """Every expense contained in the user's current message."""
+    expenses: List[ExtractedExpense]
+
+prompt = ChatPromptTemplate.from_messages([
+    ("system", """
+You extract expense entries from natural language so they can be saved to the user's expense tracker.
+
+- Return one entry per expense in the CURRENT user input. A message such as "coffee 4, lunch 12, uber 18" contains three expenses.
+- Use the previous conversation only to resolve references (e.g. "same as yesterday"); never re-extract expenses from it.
+- Today's date is {today}. Convert relative dates ("today", "yesterday", "last Friday") to YYYY-MM-DD. If no date is given, use today.
+- Leave fields you cannot infer empty.
+"""),
+    ("human", "{user_input}"),
+])
+
+def build_expense_extractor(model):
+    return prompt | model.with_structured_output(ExtractedExpenses)
+
+expense_extractor = build_expense_extractor(llm)
+
+def repair_extracted(extracted: ExtractedExpenses, today=None):
+    """Returns (records, notes) after repairing every extracted expense field by field"""
+    records, notes = [], []
+    for expense in extracted.expenses if extracted else []:
+        record, record_notes = repair_expense(expense.model_dump(), today)
+        notes.extend(record_notes)
+        if record is not None:
+            records.append(record)
+    return records, notes
+
+def extract_expenses(user_input: str):
+    today = date.today()
+    extracted = expense_extractor.invoke({"user_input": user_input, "today": today.isoformat()})
+    return repair_extracted(extracted, today)
+
+async def aextract_expenses(user_input: str):
+    today = date.today()
+    extracted = await expense_extractor.ainvoke({"user_input": user_input, "today": today.isoformat()})
+    return repair_extracted(extracted, today)
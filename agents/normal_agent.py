@@ -1,27 +1,215 @@
-import os
-from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from langchain_community.utilities.sql_database import SQLDatabase
-from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_openai import ChatOpenAI
-from langchain.agents import create_sql_agent
-
-load_dotenv()
-
-engine = create_engine("sqlite:///utils/expense_tracker.db", connect_args={"check_same_thread": False})
-db = SQLDatabase(engine)
-
-#os.environ["GEMINI_API_KEY"] = os.getenv("GEMINI_2")
-#llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", temperature=0)
-os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-toolkit = SQLDatabaseToolkit(db=db, llm=llm)
-tools = toolkit.get_tools()
-
-agent = create_sql_agent(
-    llm=llm,
-    toolkit=toolkit,
-    verbose=False,
-    handle_tool_error=True
-)
\ No newline at end of file
+import os
+import asyncio
+import threading
+from contextvars import ContextVar
+from datetime import date
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+from langchain_community.utilities.sql_database import SQLDatabase
+from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
+from langchain_community.tools.sql_database.tool import QuerySQLDataBaseTool
+from langchain_google_genai import ChatGoogleGenerativeAI
+from utils.llm_limits import LimitedChatOpenAI
+from utils.telemetry import telemetry_callbacks
+from langchain.agents import create_sql_agent
+from utils.db_utils import DB_PATH, init_db, get_data_version
+from utils.sql_sandbox import run_for_agent, run_query
+from utils.llm_cache import get_sql_answer, set_sql_answer, count_lookup
+# Follow-ups depend on the earlier conversation, so their answers are never cached
+from utils.query_templates import FOLLOW_UP
+
+load_dotenv()
+
+# Only these tables are visible to the agent; `users` (credentials) never is
+SCOPED_TABLES = ["expenses", "budget_settings"]
+
+# SQLDatabase checks that the scoped tables exist, so make sure they do
+init_db()
+engine = create_engine(f"sqlite:///{DB_PATH}", connect_args={"check_same_thread": False})
+db = SQLDatabase(engine, include_tables=SCOPED_TABLES, sample_rows_in_table_info=0)
+
+#os.environ["GEMINI_API_KEY"] = os.getenv("GEMINI_2")
+#llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", temperature=0)
+os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
+llm = LimitedChatOpenAI(model="gpt-4o-mini", temperature=0, callbacks=telemetry_callbacks, metadata={"agent": "query"})
+
+# The logged-in user whose rows the current agent run may read
+current_user_id = ContextVar("current_user_id", default=None)
+
+class UserScopedQueryTool(QuerySQLDataBaseTool):
+    """Runs the agent's query against the current user's rows only"""
+
+    def _run(self, query, run_manager=None):
+        user_id = current_user_id.get()
+        if user_id is None:
+            return "Error: no logged-in user, so personal data cannot be queried."
+        # Runs on a read-only connection with time, row and size limits, where
+        # SQLite itself only lets the query read the user's rows of SCOPED_TABLES
+        return run_for_agent(query, user_id=user_id, tables=SCOPED_TABLES)
+
+class ScopedSQLDatabaseToolkit(SQLDatabaseToolkit):
+    # The schema is already in the prompt, so the agent only needs the query tool
+    # (no list-tables / schema / checker round trips)
+    def get_tools(self):
+        query_tool = UserScopedQueryTool(
+            db=self.db,
+            description=(
+                "Input to this tool is a detailed and correct SQL query, output is a result from the database. "
+                "If the query is not correct, an error message will be returned. "
+                "If an error is returned, rewrite the query and try again."
+            ),
+        )
+        query_tool.callbacks = telemetry_callbacks
+        return [query_tool]
+
+toolkit = ScopedSQLDatabaseToolkit(db=db, llm=llm)
+tools = toolkit.get_tools()
+
+SCOPED_SQL_PREFIX = """You are an agent designed to answer questions about the user's personal expenses stored in a {dialect} database.
+Given an input question, create a syntactically correct {dialect} query to run, then look at the results of the query and return the answer.
+Unless the user specifies a specific number of examples they wish to obtain, always limit your query to at most {top_k} results.
+Only ask for the relevant columns given the question; never use SELECT *.
+If you get an error while executing a query, rewrite the query and try again.
+DO NOT make any DML statements (INSERT, UPDATE, DELETE, DROP etc.) to the database.
+Queries only ever see the current user's rows, so there is no need to filter by user_id.
+Dates are stored as TEXT in YYYY-MM-DD format. Today's date is <today>.
+
+These are the only tables, with their columns:
+<schema>
+
+If the question does not seem related to the database, just return "I don't know" as the answer.
+"""
+
+SCOPED_SQL_SUFFIX = """Begin!
+
+Question: {input}
+Thought: The schema is listed above, so I can write the query directly.
+{agent_scratchpad}"""
+
+_schema_lock = threading.Lock()
+_schema_cache = {"version": None, "context": None}
+_agent_cache = {"key": None, "agent": None}
+
+def schema_version():
+    # SQLite bumps this counter on every schema change (CREATE/ALTER/DROP)
+    with engine.connect() as conn:
+        return conn.execute(text("PRAGMA schema_version")).scalar()
+
+def get_schema_context():
+    """Compact description of the scoped tables, rebuilt only after a schema migration"""
+    version = schema_version()
+    with _schema_lock:
+        if _schema_cache["version"] != version:
+            lines = []
+            with engine.connect() as conn:
+                for table in SCOPED_TABLES:
+                    columns = conn.execute(text(f"PRAGMA table_info({table})")).fetchall()
+                    described = ", ".join(
+                        f"{name} {col_type}{' PRIMARY KEY' if pk else ''}"
+                        for _, name, col_type, _, _, pk in columns
+                        if name != "user_id"
+                    )
+                    lines.append(f"- {table}({described})")
+            _schema_cache.update(version=version, context="\n".join(lines))
+        return version, _schema_cache["context"]
+
+def get_agent():
+    version, schema = get_schema_context()
+    key = (version, date.today(), id(llm))
+    with _schema_lock:
+        if _agent_cache["key"] != key:
+            prefix = SCOPED_SQL_PREFIX.replace("<schema>", schema).replace("<today>", date.today().isoformat())
+            _agent_cache["agent"] = create_sql_agent(
+                llm=llm,
+                toolkit=toolkit,
+                prefix=prefix,
+                suffix=SCOPED_SQL_SUFFIX,
+                verbose=False,
+                handle_tool_error=True,
+                agent_executor_kwargs={"handle_parsing_errors": True, "return_intermediate_steps": True},
+            )
+            _agent_cache["key"] = key
+        return _agent_cache["agent"]
+
+
+def last_query(steps):
+    # The last query the agent ran successfully is the one its answer is based on
+    for action, observation in reversed(steps):
+        if action.tool == "sql_db_query" and not str(observation).startswith("Error"):
+            query = action.tool_input if isinstance(action.tool_input, str) else action.tool_input.get("query")
+            return query, str(observation)
+    return None, None
+
+def format_rows(columns, rows, truncated):
+    if not rows:
+        return "With your latest data, that query returns no results."
+    if len(rows) == 1 and len(columns) == 1:
+        return f"With your latest data, {columns[0]} is {rows[0][0]}."
+    lines = "\n".join("- " + ", ".join(f"{column}: {value}" for column, value in zip(columns, row)) for row in rows)
+    more = "\n(more rows not shown)" if truncated else ""
+    return f"With your latest data:\n{lines}{more}"
+
+def cached_answer(question, user_id):
+    """Answer a repeated question without the LLM, or None when the agent has to run"""
+    if question is None or user_id is None or FOLLOW_UP.search(question):
+        return None
+    entry = get_sql_answer(user_id, question)
+    version = get_data_version(user_id)
+    # "This month", "last week" and the SQL's date literals were resolved against the day the
+    # answer was made, so answers from an earlier day are neither reused nor re-run
+    if entry is not None and date.fromtimestamp(entry["created_at"]) != date.today():
+        entry = None
+    if entry is None or (entry["data_version"] != version and not entry["sql"]):
+        count_lookup("query", False)
+        return None
+    if entry["data_version"] == version:
+        count_lookup("query", True)
+        return entry["answer"]
+
+    # The user's data changed: re-run the cached SQL on fresh data instead of the agent
+    try:
+        columns, rows, truncated = run_query(entry["sql"], user_id=user_id, tables=SCOPED_TABLES)
+    except Exception:
+        count_lookup("query", False)
+        return None
+    result = str(rows) if rows else ""
+    answer = entry["answer"] if result == entry["result"] else format_rows(columns, rows, truncated)
+    set_sql_answer(user_id, question, version, answer, entry["sql"], result)
+    count_lookup("query", True)
+    return answer
+
+def remember_answer(question, user_id, version, output):
+    if question is None or user_id is None or FOLLOW_UP.search(question):
+        return
+    if output["output"].startswith("Agent stopped"):
+        return
+    sql, result = last_query(output.get("intermediate_steps", []))
+    set_sql_answer(user_id, question, version, output["output"], sql, result)
+
+def run_for_user(agent_input, user_id, question=None):
+    """Answer agent_input for the user; question (the bare latest message) enables the answer cache"""
+    answer = cached_answer(question, user_id)
+    if answer is not None:
+        return answer
+    # Read the version first, so writes during the run invalidate this answer
+    version = get_data_version(user_id)
+    token = current_user_id.set(user_id)
+    try:
+        output = get_agent().invoke({"input": agent_input})
+    finally:
+        current_user_id.reset(token)
+    remember_answer(question, user_id, version, output)
+    return output["output"]
+
+async def arun_for_user(agent_input, user_id, question=None):
+    answer = await asyncio.to_thread(cached_answer, question, user_id)
+    if answer is not None:
+        return answer
+    version = await asyncio.to_thread(get_data_version, user_id)
+    token = current_user_id.set(user_id)
+    try:
+        output = await get_agent().ainvoke({"input": agent_input})
+    finally:
+        current_user_id.reset(token)
+    await asyncio.to_thread(remember_answer, question, user_id, version, output)
+    return output["output"]
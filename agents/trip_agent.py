@@ -1,82 +1,251 @@
-import os
-from dotenv import load_dotenv
-from typing import Annotated, TypedDict
-from langgraph.graph import StateGraph, add_messages, END
-from langgraph.checkpoint.memory import MemorySaver
-from langgraph.prebuilt import ToolNode
-from langchain_core.messages import SystemMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_openai import ChatOpenAI
-from langchain_community.tools import DuckDuckGoSearchRun
-
-load_dotenv()
-
-class BasicChatState(TypedDict):
-    messages: Annotated[list, add_messages]
-
-#os.environ["GOOGLE_API_KEY"] = os.getenv("GOOGLE_API_KEY")
-#llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", temperature=0.3)
-os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-
-search_tool = DuckDuckGoSearchRun()
-tools = [search_tool]
-tool_node = ToolNode(tools=tools)
-llm_with_tools = llm.bind_tools(tools=tools)
-memory = MemorySaver()
-
-system_message = """
-You are a helpful, detail-oriented, and friendly AI travel assistant. Your role is to assist users in planning their trips by generating personalized travel itineraries.
-
-You must follow these rules:
-
-1. Always respond in a structured format, dividing the response into clear sections:
-   - Overview
-   - Daily Itinerary
-   - Recommended Places to Visit
-   - Where to Stay
-   - How to Get Around
-   - Additional Tips
-
-2. Assume the user is looking for a well-balanced travel experience, including cultural attractions, food recommendations, nature spots, and leisure time.
-
-3. Use precise and engaging language. Your tone should be professional yet friendly.
-
-4. You have access to a web search tool (DuckDuckGo) and can use it to retrieve up-to-date and location-specific information like popular hotels, current events, or tourist advisories.
-
-5. You do **not** fabricate information. If you're unsure or the search didn't return results, say so honestly and suggest alternatives.
-
-6. Consider the user’s query carefully. If they mention:
-   - **Dates**: Plan according to them.
-   - **Duration**: Distribute activities evenly.
-   - **Location**: Focus only on the location mentioned.
-   - **Preferences** (e.g., budget, solo travel, beach holiday): Adapt your suggestions accordingly.
-
-7. Do **not** repeat information. Avoid overloading users with too many options; prioritize quality over quantity.
-
-8. Use clear bullet points or numbered lists for readability.
-
-Your goal is to make the user feel confident and excited about their upcoming trip.
-"""
-
-def chatbot(state: BasicChatState):
-    messages = state["messages"]
-    if not messages or not isinstance(messages[0], SystemMessage):
-        messages = [SystemMessage(content=system_message)] + messages
-    response = llm_with_tools.invoke(messages)
-    return {"messages": [response]}
-
-def tools_router(state: BasicChatState):
-    last_message = state["messages"][-1]
-    if hasattr(last_message, "tool_calls") and len(last_message.tool_calls) > 0:
-        return "tool_node"
-    else:
-        return END
-
-graph = StateGraph(BasicChatState)
-graph.add_node("chatbot", chatbot)
-graph.add_node("tool_node", tool_node)
-graph.set_entry_point("chatbot")
-graph.add_conditional_edges("chatbot", tools_router)
-graph.add_edge("tool_node", "chatbot")
-app = graph.compile(checkpointer=memory)
\ No newline at end of file
+import os
+import re
+from dotenv import load_dotenv
+from typing import Annotated, List, Optional, TypedDict
+from pydantic import BaseModel, Field
+from langgraph.graph import StateGraph, add_messages, END
+from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.messages import SystemMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+from langchain_google_genai import ChatGoogleGenerativeAI
+from utils.llm_limits import LimitedChatOpenAI
+from utils.telemetry import telemetry_callbacks
+from utils.tool_executor import build_tool_executor
+from utils.tool_registry import register_tool, cached_run
+from langchain_community.tools import DuckDuckGoSearchRun
+from langchain.tools import tool
+
+load_dotenv()
+
+class BasicChatState(TypedDict):
+    messages: Annotated[list, add_messages]
+
+#os.environ["GOOGLE_API_KEY"] = os.getenv("GOOGLE_API_KEY")
+#llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", temperature=0.3)
+os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
+llm = LimitedChatOpenAI(model="gpt-4o-mini", temperature=0, callbacks=telemetry_callbacks, metadata={"agent": "trip"})
+
+# Search results are cached per query, so destinations seen before are not searched again
+register_tool("travel_search", DuckDuckGoSearchRun)
+
+@tool
+def search_travel_info(query: str) -> str:
+    """
+    Search the web for up-to-date travel information about a destination:
+    popular hotels, attractions, current events, local transport and tourist advisories.
+    
+    Args:
+        query: What to look up, including the destination name
+    
+    Returns:
+        String containing search results
+    """
+    return cached_run("travel_search", query)
+
+search_tool = search_travel_info
+search_tool.callbacks = telemetry_callbacks
+tools = [search_tool]
+# Runs the turn's tool calls concurrently, each with its own deadline
+tool_node = build_tool_executor(tools)
+llm_with_tools = llm.bind_tools(tools=tools)
+memory = MemorySaver()
+
+system_message = """
+You are a helpful, detail-oriented, and friendly AI travel assistant. Your role is to assist users in planning their trips by generating personalized travel itineraries.
+
+You must follow these rules:
+
+1. Always respond in a structured format, dividing the response into clear sections:
+   - Overview
+   - Daily Itinerary
+   - Recommended Places to Visit
+   - Where to Stay
+   - How to Get Around
+   - Additional Tips
+   Start each section with a markdown heading carrying exactly that name (e.g. "## Where to Stay").
+
+2. Assume the user is looking for a well-balanced travel experience, including cultural attractions, food recommendations, nature spots, and leisure time.
+
+3. Use precise and engaging language. Your tone should be professional yet friendly.
+
+4. You have access to a web search tool (DuckDuckGo) and can use it to retrieve up-to-date and location-specific information like popular hotels, current events, or tourist advisories.
+
+5. You do **not** fabricate information. If you're unsure or the search didn't return results, say so honestly and suggest alternatives.
+
+6. Consider the user’s query carefully. If they mention:
+   - **Dates**: Plan according to them.
+   - **Duration**: Distribute activities evenly.
+   - **Location**: Focus only on the location mentioned.
+   - **Preferences** (e.g., budget, solo travel, beach holiday): Adapt your suggestions accordingly.
+
+7. Do **not** repeat information. Avoid overloading users with too many options; prioritize quality over quantity.
+
+8. Use clear bullet points or numbered lists for readability.
+
+Your goal is to make the user feel confident and excited about their upcoming trip.
+"""
+
+def chatbot(state: BasicChatState):
+    messages = state["messages"]
+    if not messages or not isinstance(messages[0], SystemMessage):
+        messages = [SystemMessage(content=system_message)] + messages
+    response = llm_with_tools.invoke(messages)
+    return {"messages": [response]}
+
+async def achatbot(state: BasicChatState):
+    messages = state["messages"]
+    if not messages or not isinstance(messages[0], SystemMessage):
+        messages = [SystemMessage(content=system_message)] + messages
+    response = await llm_with_tools.ainvoke(messages)
+    return {"messages": [response]}
+
+def tools_router(state: BasicChatState):
+    last_message = state["messages"][-1]
+    if hasattr(last_message, "tool_calls") and len(last_message.tool_calls) > 0:
+        return "tool_node"
+    else:
+        return END
+
+graph = StateGraph(BasicChatState)
+graph.add_node("chatbot", RunnableLambda(chatbot, afunc=achatbot))
+graph.add_node("tool_node", tool_node)
+graph.set_entry_point("chatbot")
+graph.add_conditional_edges("chatbot", tools_router)
+graph.add_edge("tool_node", "chatbot")
+app = graph.compile(checkpointer=memory)
+
+
+############################ Itinerary follow-ups ############################
+# The last full answer is kept as a structured itinerary, so follow-ups like
+# "swap day 2 for a beach day" regenerate only the sections they touch.
+ITINERARY_SECTIONS = [
+    "Overview",
+    "Daily Itinerary",
+    "Recommended Places to Visit",
+    "Where to Stay",
+    "How to Get Around",
+    "Additional Tips",
+]
+SECTION_HEADING = re.compile(
+    r"^[ \t]*(?:#{1,6}[ \t]*)?(?:\d+[.)][ \t]*)?(?:\*\*)?[ \t]*("
+    + "|".join(re.escape(name) for name in ITINERARY_SECTIONS)
+    + r")[ \t]*:?[ \t]*(?:\*\*)?[ \t]*:?[ \t]*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+# "trip to Lisbon", "3 days in New York", "Welcome to Rio de Janeiro"
+DESTINATION = re.compile(
+    r"(?:(?i:\bvisit(?:ing)?|\bexplor(?:e|ing))\s+|(?i:\b(?:trip|travel|travelling|traveling|itinerary|vacation|"
+    r"holiday|getaway|days?|weeks?|nights?|weekend|welcome|going|fly|flying))\s+(?i:to|in|around|through)\s+)"
+    r"([A-Z][\w-]*(?:\s+(?:(?:de|del|da|do|la|le|of|the)\s+)?[A-Z][\w-]*)*)"
+)
+# Requests that edit the plan rather than ask for a new one
+FOLLOW_UP_EDIT = re.compile(
+    r"\b(change|swap|replace|instead|add|remove|drop|skip|move|switch|update|modify|adjust|tweak|shorten|extend|"
+    r"cheaper|budget|more|less|fewer|extra|rather|day \d+|day (one|two|three|four|five|six|seven))\b"
+    r"|" + "|".join(re.escape(name.lower()) for name in ITINERARY_SECTIONS),
+    re.IGNORECASE,
+)
+NEW_TRIP = re.compile(r"\b(plan (a|an|my)|(new|another|different) (trip|itinerary|plan|destination))\b", re.IGNORECASE)
+
+def guess_destination(*texts):
+    """The first place named as a destination in any of texts, or None"""
+    for text in texts:
+        match = DESTINATION.search(text or "")
+        if match:
+            return match.group(1).strip()
+    return None
+
+def is_follow_up(itinerary, request):
+    # Cheap check before the patcher LLM runs: an edit of the stored plan, not a new trip
+    if NEW_TRIP.search(request) or not FOLLOW_UP_EDIT.search(request):
+        return False
+    destination = guess_destination(request)
+    known = itinerary.get("destination")
+    return destination is None or known is None or destination.lower() == known.lower()
+
+def parse_itinerary(text, destination=None):
+    """Split a full trip answer into its sections, or None if it is not an itinerary"""
+    matches = list(SECTION_HEADING.finditer(text or ""))
+    if len(matches) < 3:
+        return None
+    canonical = {name.lower(): name for name in ITINERARY_SECTIONS}
+    sections = {}
+    for match, following in zip(matches, matches[1:] + [None]):
+        end = following.start() if following else len(text)
+        sections[canonical[match.group(1).lower()]] = text[match.end():end].strip()
+    destination = destination or guess_destination(sections.get("Overview"), text)
+    return {"destination": destination, "sections": sections}
+
+def render_itinerary(itinerary):
+    return "\n\n".join(
+        f"## {name}\n{itinerary['sections'][name]}"
+        for name in ITINERARY_SECTIONS
+        if name in itinerary["sections"]
+    )
+
+class SectionUpdate(BaseModel):
+    """New content for one itinerary section."""
+    section: str = Field(description=f"One of: {', '.join(ITINERARY_SECTIONS)}")
+    content: str = Field(description="The complete new text of the section, without its heading")
+
+class ItineraryPatch(BaseModel):
+    """Changes to apply to the current itinerary."""
+    new_trip: bool = Field(description="True if the user wants a different destination or a completely new plan")
+    destination: Optional[str] = Field(None, description="The destination of the itinerary")
+    updates: List[SectionUpdate] = Field(default_factory=list, description="Only the sections that must change")
+
+patch_prompt = ChatPromptTemplate.from_messages([
+    ("system", """
+You update an existing travel itinerary after a follow-up request.
+
+- Return ONLY the sections that have to change, each with its complete new text. Leave every other section out.
+- Keep the style of the existing itinerary: bullet points, concise, no repetition.
+- If the request is for a different destination or a completely new trip, set new_trip to true and return no updates.
+
+Current itinerary:
+{itinerary}
+"""),
+    ("human", "{request}"),
+])
+
+def build_itinerary_patcher(model):
+    return patch_prompt | model.with_structured_output(ItineraryPatch)
+
+itinerary_patcher = build_itinerary_patcher(llm)
+
+def apply_patch(itinerary, patch):
+    """Returns (itinerary, changed section names), or None when a full plan is needed"""
+    if patch is None or patch.new_trip:
+        return None
+    canonical = {name.lower(): name for name in ITINERARY_SECTIONS}
+    sections = dict(itinerary["sections"])
+    changed = []
+    for update in patch.updates:
+        name = canonical.get(update.section.strip().lower())
+        if name and update.content.strip():
+            sections[name] = update.content.strip()
+            changed.append(name)
+    if not changed:
+        return None
+    return {"destination": patch.destination or itinerary.get("destination"), "sections": sections}, changed
+
+def patch_itinerary(itinerary, request):
+    if not is_follow_up(itinerary, request):
+        return None
+    try:
+        patch = itinerary_patcher.invoke({"itinerary": render_itinerary(itinerary), "request": request})
+    except Exception:
+        # A malformed patch just means the full agent answers instead
+        return None
+    return apply_patch(itinerary, patch)
+
+async def apatch_itinerary(itinerary, request):
+    if not is_follow_up(itinerary, request):
+        return None
+    try:
+        patch = await itinerary_patcher.ainvoke({"itinerary": render_itinerary(itinerary), "request": request})
+    except Exception:
+        return None
+    return apply_patch(itinerary, patch)
@@ -0,0 +1,241 @@
+"""Headless HTTP API over the expense store and the multi-agent chat.
+
+    uvicorn api:api --host 0.0.0.0 --port 8000
+
+Every route is async: database calls run on worker threads (each reusing its
+pooled SQLite connection) and chat turns use the graph's async path, so one
+process serves many clients at once. Run the chat routes in a single worker:
+conversation history lives in the graph's in-memory checkpointer and turns
+are serialised per user by in-process locks, so a user whose turns reached
+different workers would lose their history and could run two turns at once.
+
+Tokens are signed rather than stored, so any worker can verify them; API_SECRET
+must be set (to the same value everywhere it runs), and tokens expire after
+API_TOKEN_TTL seconds (rotating API_SECRET revokes every issued token).
+"""
+import os
+import hmac
+import secrets
+import json
+import time
+import asyncio
+import hashlib
+from datetime import date
+from contextlib import asynccontextmanager
+from typing import Optional, Union
+from dotenv import load_dotenv
+from fastapi import FastAPI, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from langchain_core.messages import HumanMessage, AIMessageChunk
+
+from multiagent import app as chatbot_responder
+
+from utils.db_utils import (
+    init_db, authenticate_user, register_user, add_expense, update_budget_settings,
+    get_expenses_page, get_dashboard_snapshot, add_chat_message, get_spending_alerts,
+)
+from utils.expense_fields import repair_expense
+from utils.forecast import get_month_end_forecast
+
+load_dotenv()
+# Shared by every worker/instance so a token issued by one is accepted by all
+API_SECRET = os.getenv("API_SECRET")
+if not API_SECRET:
+    raise RuntimeError(f"Set API_SECRET (e.g. {secrets.token_hex(32)}) to the same value on every API worker")
+# Seconds a login token stays valid
+API_TOKEN_TTL = int(os.getenv("API_TOKEN_TTL", str(7 * 24 * 3600)))
+MAX_PAGE_SIZE = 100
+# Agents whose answers are streamed token by token; the others arrive in one piece
+STREAMED_AGENTS = ("finance", "trip")
+
+init_db()
+api = FastAPI(title="AI Finance Tracker API")
+
+class Credentials(BaseModel):
+    email: str
+    password: str
+
+class Registration(Credentials):
+    first_name: str
+    last_name: str
+
+class ExpenseIn(BaseModel):
+    amount: Union[float, str]
+    category: Optional[str] = None
+    date: Optional[str] = None
+    description: Optional[str] = None
+    recurring: Optional[Union[bool, str]] = None
+    location: Optional[str] = None
+    payment_method: Optional[str] = None
+
+class BudgetIn(BaseModel):
+    monthly_budget: float
+    savings_goal: float
+    actual_savings: float
+
+class ChatIn(BaseModel):
+    message: str
+
+def _sign(user_id, issued_at):
+    return hmac.new(API_SECRET.encode(), f"{user_id}.{issued_at}".encode(), hashlib.sha256).hexdigest()
+
+def issue_token(user_id):
+    issued_at = int(time.time())
+    return f"{user_id}.{issued_at}.{_sign(user_id, issued_at)}", issued_at + API_TOKEN_TTL
+
+def current_user(authorization):
+    # "Authorization: Bearer <user_id>.<issued_at>.<signature>"
+    token = (authorization or "").removeprefix("Bearer ").strip()
+    user_id, issued_at, signature = (token.split(".") + ["", ""])[:3]
+    if not user_id.isdigit() or not issued_at.isdigit() or not hmac.compare_digest(signature, _sign(user_id, issued_at)):
+        raise HTTPException(status_code=401, detail="invalid or missing token")
+    if int(issued_at) + API_TOKEN_TTL < time.time():
+        raise HTTPException(status_code=401, detail="token expired")
+    return int(user_id)
+
+EXPENSE_COLUMNS = ("expense_id", "amount", "category", "date", "description", "recurring", "location", "payment_method")
+WEEKLY_COLUMNS = ("expense_id", "amount", "category", "date", "description", "location", "payment_method")
+TOP_COLUMNS = ("amount", "category", "date", "description", "location")
+ALERT_COLUMNS = ("alert_id", "kind", "category", "amount", "message", "created_at")
+
+def _rows(columns, rows):
+    return [dict(zip(columns, row)) for row in rows]
+
+@api.post("/register", status_code=201)
+async def register(body: Registration):
+    if not await asyncio.to_thread(register_user, body.first_name, body.last_name, body.email, body.password):
+        raise HTTPException(status_code=409, detail="email already registered")
+    return {"registered": True}
+
+@api.post("/login")
+async def login(body: Credentials):
+    user = await asyncio.to_thread(authenticate_user, body.email, body.password)
+    if not user:
+        raise HTTPException(status_code=401, detail="invalid email or password")
+    user_id, first_name, last_name = user
+    token, expires_at = issue_token(user_id)
+    return {"token": token, "expires_at": expires_at, "user_id": user_id, "first_name": first_name, "last_name": last_name}
+
+@api.get("/dashboard")
+async def dashboard(authorization: str = Header(None)):
+    user_id = current_user(authorization)
+    snapshot = await asyncio.to_thread(get_dashboard_snapshot, user_id)
+    alerts = await asyncio.to_thread(get_spending_alerts, user_id)
+    forecast = await asyncio.to_thread(get_month_end_forecast, user_id)
+    return {
+        "monthly_budget": snapshot["monthly_budget"],
+        "savings_goal": snapshot["savings_goal"],
+        "actual_savings": snapshot["actual_savings"],
+        "total_expenses": snapshot["total_expenses"],
+        "remaining_budget": snapshot["monthly_budget"] - snapshot["total_expenses"],
+        "weekly_expenses": _rows(WEEKLY_COLUMNS, snapshot["weekly_expenses"]),
+        "weekly_categories": _rows(("category", "total_amount", "count"), snapshot["weekly_categories"]),
+        "top_weekly_expenses": _rows(TOP_COLUMNS, snapshot["top_weekly_expenses"]),
+        "alerts": _rows(ALERT_COLUMNS, alerts),
+        "forecast": forecast,
+    }
+
+@api.get("/expenses")
+async def list_expenses(
+    authorization: str = Header(None),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+):
+    user_id = current_user(authorization)
+    after = None
+    if cursor:
+        # The cursor is "<date>:<expense_id>" of the previous page's last row
+        after_date, _, after_id = cursor.rpartition(":")
+        if not after_id.isdigit():
+            raise HTTPException(status_code=400, detail="invalid cursor")
+        after = (after_date, int(after_id))
+    rows = await asyncio.to_thread(get_expenses_page, user_id, limit, after)
+    items = _rows(EXPENSE_COLUMNS, rows)
+    next_cursor = f"{items[-1]['date']}:{items[-1]['expense_id']}" if len(items) == limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
+@api.post("/expenses", status_code=201)
+async def create_expense(body: ExpenseIn, authorization: str = Header(None)):
+    user_id = current_user(authorization)
+    record, notes = repair_expense(body.model_dump(), date.today())
+    if record is None:
+        raise HTTPException(status_code=422, detail="; ".join(notes))
+    await asyncio.to_thread(
+        add_expense, user_id, record["amount"], record["category"], record["date"], record["description"],
+        record["recurring"], record["location"], record["payment_method"],
+    )
+    return {"expense": record, "notes": notes}
+
+@api.put("/budget")
+async def set_budget(body: BudgetIn, authorization: str = Header(None)):
+    user_id = current_user(authorization)
+    await asyncio.to_thread(update_budget_settings, user_id, body.monthly_budget, body.savings_goal, body.actual_savings)
+    return body
+
+# One chat turn at a time per user, so concurrent requests do not race on the checkpoint.
+# Entries are [lock, turns holding or awaiting it] and are dropped once no turn needs them.
+_turn_locks = {}
+
+@asynccontextmanager
+async def turn_lock(user_id):
+    entry = _turn_locks.setdefault(user_id, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _turn_locks[user_id]
+
+def _turn(user_id, message):
+    config = {"configurable": {"thread_id": f"user-{user_id}"}}
+    state = {
+        "messages": [HumanMessage(content=message)],
+        "current_agent": "none",
+        "agent_context": {"user_id": user_id},
+    }
+    return state, config
+
+@api.post("/chat")
+async def chat(body: ChatIn, authorization: str = Header(None)):
+    user_id = current_user(authorization)
+    await asyncio.to_thread(add_chat_message, user_id, "user", body.message)
+    state, config = _turn(user_id, body.message)
+    async with turn_lock(user_id):
+        result = await chatbot_responder.ainvoke(state, config=config)
+    response = result["messages"][-1].content
+    await asyncio.to_thread(add_chat_message, user_id, "system", response)
+    return {"response": response, "agent": result.get("current_agent")}
+
+def _event(name, data):
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+@api.post("/chat/stream")
+async def chat_stream(body: ChatIn, authorization: str = Header(None)):
+    """Server-sent events: "token" events while an agent writes, then one "done" (or "error") event"""
+    user_id = current_user(authorization)
+    await asyncio.to_thread(add_chat_message, user_id, "user", body.message)
+    state, config = _turn(user_id, body.message)
+
+    async def events():
+        final = None
+        try:
+            async with turn_lock(user_id):
+                async for mode, chunk in chatbot_responder.astream(state, config=config, stream_mode=["messages", "values"]):
+                    if mode == "values":
+                        final = chunk
+                        continue
+                    message, metadata = chunk
+                    if isinstance(message, AIMessageChunk) and message.content and metadata.get("agent") in STREAMED_AGENTS:
+                        yield _event("token", {"text": message.content})
+        except Exception as e:
+            # The client has already had a 200, so the failure has to arrive as an event
+            yield _event("error", {"detail": f"chat turn failed: {type(e).__name__}"})
+            return
+        response = final["messages"][-1].content
+        await asyncio.to_thread(add_chat_message, user_id, "system", response)
+        yield _event("done", {"response": response, "agent": final.get("current_agent")})
+
+    return StreamingResponse(events(), media_type="text/event-stream")
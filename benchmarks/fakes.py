@@ -0,0 +1,255 @@
+"""Deterministic offline stand-ins for the LLM and the search/market-data tools.
+
+Import this module (or call install_offline_env) before importing multiagent so
+the agents can be constructed without real API keys.
+"""
+import os
+import re
+import time
+import asyncio
+import random
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import deque
+from datetime import date, timedelta
+from typing import Any
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, SystemMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from utils.expense_fields import parse_amount, normalize_category, normalize_payment_method
+from utils.llm_gateway import GatewayMixin
+
+def install_offline_env():
+    # The agent modules copy these into os.environ at import time
+    for key in ("OPENAI_API_KEY", "GEMINI_2", "FMP_API_KEY"):
+        os.environ.setdefault(key, "offline")
+
+def use_scratch_database(source="utils/expense_tracker.db"):
+    """Point the app at a temporary copy of the expense DB so benchmarks never write real data"""
+    scratch = os.path.join(tempfile.mkdtemp(), "expense_tracker.db")
+    if os.path.exists(source):
+        shutil.copyfile(source, scratch)
+    os.environ["EXPENSE_DB_PATH"] = scratch
+    return scratch
+
+install_offline_env()
+
+ROUTE_KEYWORDS = [
+    ("insertion", ("add ", "log ", "record ", "save ", "insert ")),
+    ("trip", ("trip", "travel", "visit", "itinerary", "vacation", "hotel", "flight", "beach", "swap day")),
+    ("finance", ("stock", "market", "invest", "news", "price", "shares", "fund")),
+]
+
+def fake_route(text):
+    text = text.lower()
+    for route, keywords in ROUTE_KEYWORDS:
+        if any(keyword in text for keyword in keywords):
+            return route
+    return "query"
+
+def fake_expenses(text):
+    # One expense per comma/"and" separated chunk that contains a number
+    current = text.split("Current user input:", 1)[-1]
+    expenses = []
+    for chunk in re.split(r",|\band\b|\n", current):
+        amount = parse_amount(chunk)
+        if amount is not None:
+            expenses.append({
+                "amount": amount,
+                "category": normalize_category(chunk) or "Other",
+                "description": chunk.strip()[:60],
+                "payment_method": normalize_payment_method(chunk),
+            })
+    return expenses
+
+def _text(message):
+    return message.content if isinstance(message.content, str) else str(message.content)
+
+def _first_arg_name(tool):
+    properties = tool["function"].get("parameters", {}).get("properties", {})
+    return next(iter(properties), "query")
+
+def fake_response(messages, tools=None):
+    """Pick a plausible, deterministic reply for whichever agent prompt is being served"""
+    system = next((_text(m) for m in messages if isinstance(m, SystemMessage)), "")
+    last = messages[-1]
+    last_text = _text(last)
+    prompt_text = "\n".join(_text(m) for m in messages)
+
+    tool_names = [t["function"]["name"] for t in tools or []]
+    if "ExtractedExpenses" in tool_names:
+        return AIMessage(content="", tool_calls=[{
+            "name": "ExtractedExpenses", "args": {"expenses": fake_expenses(last_text)}, "id": "call_extract",
+        }])
+    if "ItineraryPatch" in tool_names:
+        return AIMessage(content="", tool_calls=[{
+            "name": "ItineraryPatch",
+            "args": {"new_trip": False, "updates": [{"section": "Daily Itinerary", "content": f"- Offline update: {last_text[:80]}"}]},
+            "id": "call_patch",
+        }])
+    if "route_to_agent" in tool_names:
+        # Single-call router: start the finance agent directly, otherwise just name the route
+        route = fake_route(last_text.split("Current user input:", 1)[-1])
+        if route == "finance":
+            tool = next(t for t in tools if t["function"]["name"] != "route_to_agent")
+            return AIMessage(content="", tool_calls=[{
+                "name": tool["function"]["name"], "args": {_first_arg_name(tool): last_text[-120:]}, "id": "call_route",
+            }])
+        return AIMessage(content="", tool_calls=[{"name": "route_to_agent", "args": {"agent": route}, "id": "call_route"}])
+    if tools:
+        if isinstance(last, ToolMessage) and "travel assistant" in system:
+            return AIMessage(content="\n\n".join(f"## {section}\n- Offline {section.lower()} based on: {last_text[:60]}" for section in (
+                "Overview", "Daily Itinerary", "Recommended Places to Visit", "Where to Stay", "How to Get Around", "Additional Tips")))
+        if isinstance(last, ToolMessage):
+            return AIMessage(content=f"Based on live data: {last_text[:200]}")
+        tool = tools[0]
+        digest = hashlib.md5(last_text.encode("utf-8")).hexdigest()[:8]
+        return AIMessage(content="", tool_calls=[{
+            "name": tool["function"]["name"],
+            "args": {_first_arg_name(tool): last_text[-120:]},
+            "id": f"call_{digest}",
+        }])
+    if "routing assistant" in system:
+        current = last_text.split("Current user input:", 1)[-1]
+        return AIMessage(content=fake_route(current))
+    if "Final Answer" in prompt_text:
+        return AIMessage(content="Thought: I now know the final answer\nFinal Answer: You spent $0.00 in that period.")
+    return AIMessage(content=f"Offline answer to: {last_text[:120]}")
+
+class FakeRateLimitError(Exception):
+    """What the fake provider raises past its request budget, like an HTTP 429"""
+    status_code = 429
+
+# Start times of recent requests to the fake provider, shared by every fake model
+_provider_window = deque()
+_provider_lock = threading.Lock()
+
+def fake_provider_admit(rpm):
+    """Refuse the request when the fake provider already started rpm requests in the last minute"""
+    if not rpm:
+        return
+    now = time.monotonic()
+    with _provider_lock:
+        while _provider_window and now - _provider_window[0] > 60:
+            _provider_window.popleft()
+        if len(_provider_window) >= rpm:
+            raise FakeRateLimitError("rate limit exceeded")
+        _provider_window.append(now)
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that sleeps for `latency` seconds and answers with fake_response"""
+    latency: float = 0.2
+    model_name: str = "fake-chat"
+    responder: Any = None
+    calls: int = 0
+    # Requests per minute the fake provider accepts before answering 429 (0: unlimited)
+    provider_rpm: float = 0
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def _reply(self, messages, kwargs):
+        self.calls += 1
+        responder = self.responder or fake_response
+        message = responder(messages, kwargs.get("tools"))
+        prompt_chars = sum(len(_text(m)) for m in messages)
+        message.usage_metadata = {
+            "input_tokens": prompt_chars // 4,
+            "output_tokens": len(_text(message)) // 4,
+            "total_tokens": (prompt_chars + len(_text(message))) // 4,
+        }
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        fake_provider_admit(self.provider_rpm)
+        time.sleep(self.latency)
+        return self._reply(messages, kwargs)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        fake_provider_admit(self.provider_rpm)
+        await asyncio.sleep(self.latency)
+        return self._reply(messages, kwargs)
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+class GatewayFakeChatModel(GatewayMixin, FakeChatModel):
+    """FakeChatModel whose requests go through utils.llm_gateway like the real agents' models"""
+    limit_provider: str = "openai"
+
+class FakeTool:
+    """Stand-in for DuckDuckGoSearchRun / FMPDataTool / YahooFinanceNewsTool and their API wrappers"""
+
+    def __init__(self, source, latency=0.1):
+        self.source = source
+        self.latency = latency
+        self.calls = 0
+
+    def run(self, query, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        return f"[{self.source}] offline result for '{query}'"
+
+class FakePriceSource:
+    """Stand-in for the yfinance price source: a deterministic random walk per symbol"""
+
+    def __init__(self, latency=0.1):
+        self.latency = latency
+        self.calls = 0
+
+    def fetch(self, symbol, start, end):
+        self.calls += 1
+        time.sleep(self.latency)
+        rng = random.Random(symbol)
+        price, rows, day = 100.0, [], date(2000, 1, 1)
+        while day <= end:
+            if day.weekday() < 5:
+                price *= 1 + rng.gauss(0.0003, 0.015)
+                if day >= start:
+                    rows.append((day.isoformat(), price, price * 1.01, price * 0.99, price, 1_000_000))
+            day += timedelta(days=1)
+        return rows
+
+def install_fakes(llm_latency=0.2, tool_latency=0.1, responder=None, gateway=False, provider_rpm=0):
+    """Swap every LLM and external tool used by multiagent.app for offline stand-ins.
+
+    With gateway=True each agent gets its own fake model (tagged with the
+    agent's name, like the real ones) behind utils.llm_gateway, and the fake
+    provider answers 429 past provider_rpm requests per minute.
+    """
+    import multiagent
+    from agents import finance_agent, trip_agent, normal_agent, data_entry_agent
+    from utils import tool_registry, market_data
+
+    fake_llm = FakeChatModel(latency=llm_latency, responder=responder)
+    agent_llms = dict.fromkeys(("router", "finance", "trip", "insertion", "query"), fake_llm)
+    if gateway:
+        agent_llms = {
+            agent: GatewayFakeChatModel(latency=llm_latency, responder=responder, provider_rpm=provider_rpm,
+                                        metadata={"agent": agent})
+            for agent in agent_llms
+        }
+        fake_llm = agent_llms["router"]
+    fake_tools = {
+        "duckduckgo": FakeTool("duckduckgo", tool_latency),
+        "fmp": FakeTool("fmp", tool_latency),
+        "yahoo": FakeTool("yahoo", tool_latency),
+    }
+
+    multiagent.llm_router = agent_llms["router"]
+    finance_agent.llm_with_tools = agent_llms["finance"].bind_tools(finance_agent.tools)
+    trip_agent.llm_with_tools = agent_llms["trip"].bind_tools(trip_agent.tools)
+    data_entry_agent.expense_extractor = data_entry_agent.build_expense_extractor(agent_llms["insertion"])
+    normal_agent.llm = agent_llms["query"]
+
+    tool_registry.set_client("web_search", fake_tools["duckduckgo"])
+    tool_registry.set_client("stock_data", fake_tools["fmp"])
+    tool_registry.set_client("finance_news", fake_tools["yahoo"])
+    market_data.set_price_source(FakePriceSource(tool_latency))
+    tool_registry.set_client("travel_search", fake_tools["duckduckgo"])
+    trip_agent.itinerary_patcher = trip_agent.build_itinerary_patcher(agent_llms["trip"])
+    return fake_llm, fake_tools
@@ -0,0 +1,261 @@
+"""Simulate many users driving the app at once, fully offline.
+
+    python -m benchmarks.load_test --users 50 --arrival-rate 5 --max-concurrency 32
+
+Each simulated user registers and logs in, adds expenses, loads the dashboard,
+pages through their history and chats with the agents, calling the same
+db_utils functions and multiagent.app that chatbot.py uses. Users arrive as
+a Poisson process at --arrival-rate per second. The report gives throughput
+and tail latency per operation, plus how long writers waited for SQLite's
+write lock. With --gateway the LLM calls go through utils.llm_gateway and
+--provider-rpm makes the fake provider answer 429s, so queueing, coalescing
+and retries show up in the report.
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import threading
+from datetime import date, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.replay import load_conversations, percentile
+
+WRITE_SQL = ("insert", "update", "delete", "replace")
+
+class LockTimer:
+    """Collects the time every write transaction waited to acquire the write lock"""
+
+    def __init__(self):
+        self.waits = []
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self.waits.append(seconds)
+
+    def report(self):
+        with self._lock:
+            waits = list(self.waits)
+        return {
+            "write_transactions": len(waits),
+            "waited_over_1ms": sum(1 for wait in waits if wait > 0.001),
+            "p50_ms": percentile(waits, 0.50) * 1000,
+            "p95_ms": percentile(waits, 0.95) * 1000,
+            "p99_ms": percentile(waits, 0.99) * 1000,
+            "max_ms": max(waits, default=0.0) * 1000,
+        }
+
+def timed_cursor_class(timer):
+    class TimedCursor(sqlite3.Cursor):
+        # The first write of a transaction starts it with BEGIN IMMEDIATE, which
+        # blocks until the write lock is free: exactly the wait we want to measure
+        def _begin_if_writing(self, sql):
+            if not self.connection.in_transaction and sql.lstrip().lower().startswith(WRITE_SQL):
+                start = time.perf_counter()
+                super().execute("BEGIN IMMEDIATE")
+                timer.add(time.perf_counter() - start)
+
+        def execute(self, sql, parameters=()):
+            self._begin_if_writing(sql)
+            return super().execute(sql, parameters)
+
+        def executemany(self, sql, seq_of_parameters):
+            self._begin_if_writing(sql)
+            return super().executemany(sql, seq_of_parameters)
+    return TimedCursor
+
+def install_lock_timing(timer):
+    """Route every app DB connection through cursors that time write-lock waits"""
+    from utils import db_utils, query_templates
+    cursor_class = timed_cursor_class(timer)
+
+    class TimedConnection(sqlite3.Connection):
+        def cursor(self, factory=None):
+            return super().cursor(factory or cursor_class)
+
+        def execute(self, sql, parameters=()):
+            return self.cursor().execute(sql, parameters)
+
+    local = threading.local()
+
+    def get_conn():
+        conn = getattr(local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(db_utils.DB_PATH, check_same_thread=False, timeout=30, factory=TimedConnection)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            local.conn = conn
+        return conn
+
+    db_utils.get_conn = get_conn
+    query_templates.get_conn = get_conn
+
+class Recorder:
+    def __init__(self):
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def time(self, op, fn, *args):
+        start = time.perf_counter()
+        error = False
+        try:
+            return fn(*args)
+        except Exception:
+            error = True
+            return None
+        finally:
+            with self._lock:
+                self.samples.append((op, time.perf_counter() - start, error))
+
+def simulate_user(index, run_id, recorder, chat_turns, args, rng):
+    from langchain_core.messages import HumanMessage
+    from utils import db_utils
+    from utils.expense_fields import EXPENSE_CATEGORIES, PAYMENT_METHODS
+    import multiagent
+
+    def think():
+        time.sleep(rng.uniform(0, args.think_time * 2))
+
+    email = f"load-{run_id}-{index}@example.com"
+    recorder.time("register", db_utils.register_user, "Load", f"User{index}", email, "secret")
+    user = recorder.time("login", db_utils.authenticate_user, email, "secret")
+    if not user:
+        return
+    user_id = user[0]
+
+    for _ in range(args.expenses_per_user):
+        think()
+        day = (date.today() - timedelta(days=rng.randint(0, 60))).isoformat()
+        recorder.time("add_expense", db_utils.add_expense, user_id, round(rng.uniform(2, 200), 2),
+                      rng.choice(EXPENSE_CATEGORIES), day, "load test", False, None,
+                      rng.choice(PAYMENT_METHODS))
+
+    think()
+    recorder.time("dashboard", db_utils.get_dashboard_snapshot, user_id)
+
+    after = None
+    for _ in range(args.pages_per_user):
+        think()
+        rows = recorder.time("page_history", db_utils.get_expenses_page, user_id, 10, after)
+        if not rows or len(rows) < 10:
+            break
+        after = (rows[-1][3], rows[-1][0])
+
+    config = {"configurable": {"thread_id": f"load-{run_id}-{index}"}}
+    for text in rng.sample(chat_turns, min(args.chats_per_user, len(chat_turns))):
+        think()
+        state = {
+            "messages": [HumanMessage(content=text)],
+            "current_agent": "none",
+            "agent_context": {"user_id": user_id},
+        }
+        recorder.time("chat", multiagent.app.invoke, state, config)
+        recorder.time("add_chat_message", db_utils.add_chat_message, user_id, "user", text)
+
+def summarize_ops(samples, wall_seconds):
+    by_op = {}
+    for op, latency, error in samples:
+        by_op.setdefault(op, []).append((latency, error))
+    report = {}
+    for op, entries in sorted(by_op.items()):
+        latencies = [latency for latency, _ in entries]
+        report[op] = {
+            "count": len(entries),
+            "errors": sum(1 for _, error in entries if error),
+            "throughput_per_s": len(entries) / wall_seconds if wall_seconds else 0.0,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "max_ms": max(latencies) * 1000,
+        }
+    return report
+
+def print_report(report, locks, wall_seconds, users):
+    print(f"{'operation':<18} {'count':>6} {'errors':>6} {'ops/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for op, row in report.items():
+        print(f"{op:<18} {row['count']:>6} {row['errors']:>6} {row['throughput_per_s']:>8.2f} {row['p50_ms']:>9.1f} "
+              f"{row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f} {row['max_ms']:>9.1f}")
+    print(f"\nSQLite write-lock waits: {locks['write_transactions']} transactions, {locks['waited_over_1ms']} waited >1ms, "
+          f"p50 {locks['p50_ms']:.2f} ms, p95 {locks['p95_ms']:.2f} ms, p99 {locks['p99_ms']:.2f} ms, max {locks['max_ms']:.2f} ms")
+    print(f"{users} users in {wall_seconds:.2f}s")
+
+def run_load(args):
+    from benchmarks.fakes import install_fakes
+    install_fakes(llm_latency=args.llm_latency, tool_latency=args.tool_latency,
+                  gateway=args.gateway, provider_rpm=args.provider_rpm)
+    from utils.db_utils import init_db
+    init_db()
+
+    timer = LockTimer()
+    install_lock_timing(timer)
+    recorder = Recorder()
+    chat_turns = [turn for conversation in load_conversations(args.conversations) for turn in conversation["turns"]]
+    run_id = int(time.time())
+    rng = random.Random(args.seed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.max_concurrency) as pool:
+        futures = []
+        for index in range(args.users):
+            # Poisson arrivals: exponential gaps between users
+            if index:
+                time.sleep(rng.expovariate(args.arrival_rate))
+            futures.append(pool.submit(simulate_user, index, run_id, recorder, chat_turns, args,
+                                       random.Random(rng.random())))
+        for future in futures:
+            future.result()
+    wall_seconds = time.perf_counter() - start
+    return summarize_ops(recorder.samples, wall_seconds), timer.report(), wall_seconds
+
+def gateway_report():
+    """Gateway counters and queue wait per lane, from telemetry's llm_queue events"""
+    from utils.llm_gateway import gateway_stats
+    from utils.telemetry import snapshot
+    lanes = {
+        row["name"]: {"count": row["count"], "mean_ms": row["mean_ms"], "p95_ms": row["p95_ms"], "max_ms": row["max_ms"]}
+        for row in snapshot() if row["kind"] == "llm_queue"
+    }
+    return dict(gateway_stats(), queue_wait_by_lane=lanes)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--arrival-rate", type=float, default=2.0, help="new users per second")
+    parser.add_argument("--max-concurrency", type=int, default=16, help="users active at the same time")
+    parser.add_argument("--expenses-per-user", type=int, default=5)
+    parser.add_argument("--pages-per-user", type=int, default=3)
+    parser.add_argument("--chats-per-user", type=int, default=2)
+    parser.add_argument("--think-time", type=float, default=0.2, help="mean seconds between a user's actions")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="seconds per fake LLM call")
+    parser.add_argument("--tool-latency", type=float, default=0.1, help="seconds per fake tool call")
+    parser.add_argument("--gateway", action="store_true", help="send the fake LLM calls through utils.llm_gateway")
+    parser.add_argument("--provider-rpm", type=float, default=0, help="fake provider answers 429 past this many requests per minute")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--conversations", default=os.path.join(os.path.dirname(__file__), "conversations.jsonl"))
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    # Fresh stores so runs are comparable and never touch real data
+    os.environ["LLM_CACHE_DB"] = os.path.join(tempfile.mkdtemp(), "llm_cache.db")
+    os.environ["MARKET_DATA_DB"] = os.path.join(tempfile.mkdtemp(), "market_data.db")
+    from benchmarks.fakes import use_scratch_database
+    use_scratch_database()
+
+    report, locks, wall_seconds = run_load(args)
+    gateway = gateway_report() if args.gateway else None
+    if args.json:
+        json.dump({"wall_seconds": wall_seconds, "operations": report, "lock_waits": locks, "gateway": gateway},
+                  sys.stdout, indent=2)
+        print()
+    else:
+        print_report(report, locks, wall_seconds, args.users)
+        if gateway:
+            print("\nLLM gateway: " + json.dumps(gateway, indent=2))
+
+if __name__ == "__main__":
+    main()
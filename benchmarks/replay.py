@@ -0,0 +1,140 @@
+"""Replay recorded conversations through multiagent.app with offline stand-ins.
+
+    python -m benchmarks.replay --concurrency 16 --repeat 5 --llm-latency 0.3
+
+Reports per-route throughput and latency so orchestration overhead can be
+measured without network access.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+def load_conversations(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(samples, wall_seconds):
+    """samples: list of (route, latency_seconds)"""
+    by_route = {}
+    for route, latency in samples:
+        by_route.setdefault(route, []).append(latency)
+    by_route["all"] = [latency for _, latency in samples]
+    report = {}
+    for route, latencies in sorted(by_route.items()):
+        report[route] = {
+            "turns": len(latencies),
+            "throughput_per_s": len(latencies) / wall_seconds if wall_seconds else 0.0,
+            "mean_ms": statistics.mean(latencies) * 1000,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "max_ms": max(latencies) * 1000,
+        }
+    return report
+
+def print_report(report, wall_seconds):
+    print(f"{'route':<10} {'turns':>6} {'turns/s':>9} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for route, row in report.items():
+        print(f"{route:<10} {row['turns']:>6} {row['throughput_per_s']:>9.2f} {row['mean_ms']:>9.1f} "
+              f"{row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['max_ms']:>9.1f}")
+    print(f"wall time: {wall_seconds:.2f}s")
+
+def turn_state(text, user_id):
+    from langchain_core.messages import HumanMessage
+    return {
+        "messages": [HumanMessage(content=text)],
+        "current_agent": "none",
+        "agent_context": {"user_id": user_id}
+    }
+
+async def replay_async(app, conversations, concurrency, thread_prefix="replay"):
+    limiter = asyncio.Semaphore(concurrency)
+    samples = []
+
+    async def run_conversation(index, conversation):
+        config = {"configurable": {"thread_id": f"{thread_prefix}-{index}-{conversation['conversation_id']}"}}
+        async with limiter:
+            for text in conversation["turns"]:
+                start = time.perf_counter()
+                result = await app.ainvoke(turn_state(text, 1), config=config)
+                samples.append((result.get("current_agent", "unknown"), time.perf_counter() - start))
+
+    await asyncio.gather(*(run_conversation(i, c) for i, c in enumerate(conversations)))
+    return samples
+
+def replay_sync(app, conversations, concurrency):
+    samples = []
+
+    def run_conversation(index, conversation):
+        config = {"configurable": {"thread_id": f"replay-{index}-{conversation['conversation_id']}"}}
+        for text in conversation["turns"]:
+            start = time.perf_counter()
+            result = app.invoke(turn_state(text, 1), config=config)
+            samples.append((result.get("current_agent", "unknown"), time.perf_counter() - start))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda item: run_conversation(*item), enumerate(conversations)))
+    return samples
+
+def run_benchmark(conversations, concurrency, mode="async", llm_latency=0.2, tool_latency=0.1):
+    from benchmarks.fakes import install_fakes
+    install_fakes(llm_latency=llm_latency, tool_latency=tool_latency)
+    import multiagent
+
+    start = time.perf_counter()
+    if mode == "async":
+        samples = asyncio.run(replay_async(multiagent.app, conversations, concurrency))
+    else:
+        samples = replay_sync(multiagent.app, conversations, concurrency)
+    wall_seconds = time.perf_counter() - start
+    return summarize(samples, wall_seconds), wall_seconds
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", default=os.path.join(os.path.dirname(__file__), "conversations.jsonl"))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=1, help="replay the recorded set this many times")
+    parser.add_argument("--mode", choices=["async", "sync"], default="async")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds per fake LLM call")
+    parser.add_argument("--tool-latency", type=float, default=0.1, help="seconds per fake tool call")
+    parser.add_argument("--keep-cache", action="store_true", help="use the real LLM response cache and price store instead of fresh ones")
+    parser.add_argument("--telemetry-out", help="write the telemetry snapshot to this file")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    if not args.keep_cache:
+        os.environ["LLM_CACHE_DB"] = os.path.join(tempfile.mkdtemp(), "llm_cache.db")
+        os.environ["MARKET_DATA_DB"] = os.path.join(tempfile.mkdtemp(), "market_data.db")
+    from benchmarks.fakes import use_scratch_database
+    use_scratch_database()
+
+    conversations = load_conversations(args.conversations) * args.repeat
+    report, wall_seconds = run_benchmark(conversations, args.concurrency, args.mode, args.llm_latency, args.tool_latency)
+
+    from utils.tool_registry import tool_stats
+    if args.json:
+        json.dump({"wall_seconds": wall_seconds, "routes": report, "tool_cache": tool_stats()}, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(report, wall_seconds)
+        for name, counts in tool_stats().items():
+            print(f"tool cache {name}: {counts['hits']} hits, {counts['coalesced']} coalesced, "
+                  f"{counts['misses']} misses ({counts['hit_rate']:.0%})")
+    if args.telemetry_out:
+        from utils.telemetry import export_snapshot
+        export_snapshot(args.telemetry_out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Compare the two-hop router (route, then agent) with single-call routing.
+
+    python -m benchmarks.single_call --llm-latency 0.5 --concurrency 4
+
+Both modes replay the same recorded conversations against the offline fakes,
+each on its own threads with an empty response cache, tool cache and
+checkpointer, and report LLM calls per turn and latency.
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+
+from benchmarks.replay import load_conversations, replay_async, summarize, print_report
+
+def run_mode(label, single_call, conversations, concurrency, fake_llm):
+    import multiagent
+    from langgraph.checkpoint.memory import MemorySaver
+    from utils import llm_cache
+    from utils.tool_registry import clear_cache
+
+    multiagent.SINGLE_CALL_ROUTING = single_call
+    llm_cache.CACHE_DB_PATH = os.path.join(tempfile.mkdtemp(), "llm_cache.db")
+    clear_cache()
+    # A fresh checkpointer, so neither mode resumes the other's conversations
+    app = multiagent.workflow.compile(checkpointer=MemorySaver())
+    calls_before = fake_llm.calls
+
+    start = time.perf_counter()
+    samples = asyncio.run(replay_async(app, conversations, concurrency, thread_prefix=label))
+    wall_seconds = time.perf_counter() - start
+    return summarize(samples, wall_seconds), wall_seconds, (fake_llm.calls - calls_before) / len(samples)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", default=os.path.join(os.path.dirname(__file__), "conversations.jsonl"))
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--tool-latency", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    from benchmarks.fakes import install_fakes, use_scratch_database
+    use_scratch_database()
+    fake_llm, _ = install_fakes(llm_latency=args.llm_latency, tool_latency=args.tool_latency)
+    conversations = load_conversations(args.conversations) * args.repeat
+
+    for label, single_call in (("two-hop", False), ("single-call", True)):
+        report, wall_seconds, calls_per_turn = run_mode(label, single_call, conversations, args.concurrency, fake_llm)
+        print(f"\n== {label} routing: {calls_per_turn:.2f} LLM calls per turn ==")
+        print_report(report, wall_seconds)
+
+if __name__ == "__main__":
+    main()
@@ -1,267 +1,504 @@
-import os
-from typing import Annotated, Literal, TypedDict, Union
-from langgraph.graph import StateGraph, add_messages, END
-from langgraph.checkpoint.memory import MemorySaver
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
-from langchain_core.runnables import Runnable
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_openai import ChatOpenAI
-from langgraph.prebuilt import ToolNode
-
-from agents.trip_agent import app as trip_agent_app
-from agents.finance_agent import app as finance_agent_app
-from agents.normal_agent import agent as normal_agent_llm
-from agents.data_entry_agent import sql_chain
-
-# Define the conversation state with additional context tracking
-class GraphState(TypedDict):
-    messages: Annotated[list, add_messages]
-    current_agent: str  # Track which agent is currently handling the conversation
-    agent_context: dict  # Store agent-specific context
-
-# Initialize LLM-based router model
-#llm_router = ChatGoogleGenerativeAI(model="gemini-1.5-flash", temperature=0)
-llm_router = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-
-# Enhanced routing node using LLM with conversation history
-SYSTEM_ROUTER_PROMPT = """
-You are an intelligent routing assistant that decides which specialized agent should handle a user's input in a multi-turn conversation. Your task is to read the user input along with the conversation history and respond with the name of the most appropriate agent from a list of four.
-
-IMPORTANT: Consider the conversation context and current agent when making routing decisions. If the user is continuing a conversation with the same agent and their new message is related to the previous topic, you should generally route to the same agent to maintain continuity.
-
-However, if the user clearly switches topics or asks for a completely different type of assistance, route to the appropriate new agent.
-
-Only respond with the agent's name mentioned in the brackets as defined below — do not add explanations or extra text.
-
-There are four agents, each with a specific role:
-
----
-
-1. **Trip Advisor Agent** (trip) 
-- Use this agent when the user asks for help planning a trip or vacation.  
-- Relevant inputs may include destinations, itineraries, flights, hotels, best times to visit, local attractions, or travel advice.
-
-**Examples:**  
-- "Plan a 3-day trip to Tokyo."  
-- "What are the best places to visit in Italy?"  
-- "Help me book a beach vacation in July."
-
----
-
-2. **Financial Advisor Agent** (finance)
-- Use this agent for financial advice, stock market news, investment trends, budgeting help, or anything related to general finance or economics available online.  
-- It does **not** interact with the user's personal data or transactions.
-
-**Examples:**  
-- "What's the latest news on Tesla stock?"  
-- "How do I start investing in mutual funds?"  
-- "Give me a summary of current market trends."
-
----
-
-3. **Database Query Agent** (query)
-- Use this agent when the user wants to **retrieve information from their personal database**.  
-- These inputs typically start with **how much**, **what did I**, **show me**, **list**, or **did I spend**.  
-- It queries the user's historical data (e.g., spending, habits, logs).
-
-**Examples:**  
-- "How much money did I spend on food last month?"  
-- "What were my top 5 expenses in June?"  
-- "Show me all transactions from last week."
-
----
-
-4. **Data Insertion Agent** (insertion)
-- Use this agent when the user wants to **add a new entry or transaction** to their personal database.  
-- Look for language like **add**, **record**, **log**, **save**, or **insert** — typically includes a value, category, and sometimes a payment method.
-
-**Examples:**  
-- "Add $45.99 for groceries today paid by debit card."  
-- "Log 12 dollars spent on Uber."  
-- "Record 20.50 lunch with description coffee, paid by card."
-
----
-
-### RULES:
-- **Only return one of the following four strings** exactly:  
-  `trip`, `finance`, `query`, or `insertion`.
-- **Do not explain** your choice.
-- If the input is ambiguous, choose the most likely intent based on the context.
-- Consider conversation continuity: if the user is asking follow-up questions or providing clarifications to the same agent, route to that agent.
-"""
-
-def llm_route_decision(state: GraphState) -> Literal["trip", "finance", "query", "insertion"]:
-    # Get the full conversation history for context
-    conversation_history = state['messages']
-    current_agent = state.get('current_agent', 'none')
-    
-    # Prepare the context for the router
-    context_messages = []
-    
-    # Add system prompt
-    context_messages.append(SystemMessage(content=SYSTEM_ROUTER_PROMPT))
-    
-    # Add conversation history context if available
-    if len(conversation_history) > 1:
-        history_context = f"Previous conversation context:\nCurrent agent handling conversation: {current_agent}\n"
-        history_context += "Recent messages:\n"
-        
-        # Include last few messages for context (limit to avoid token overflow)
-        recent_messages = conversation_history[-3:]  # Last 3 messages
-        for msg in recent_messages[:-1]:  # Exclude the current message
-            if isinstance(msg, HumanMessage):
-                history_context += f"User: {msg.content}\n"
-            elif isinstance(msg, AIMessage):
-                history_context += f"Assistant: {msg.content}\n"
-        
-        context_messages.append(HumanMessage(content=history_context))
-    
-    # Add the current user input
-    current_input = f"Current user input: {conversation_history[-1].content}"
-    context_messages.append(HumanMessage(content=current_input))
-    
-    response = llm_router.invoke(context_messages)
-    route = response.content.strip().lower()
-    
-    if route in ["trip", "finance", "query", "insertion"]:
-        return route
-    else:
-        return "query"
-    
-def router_node(state: GraphState) -> GraphState:
-    # Pass through the state without modification
-    return state
-
-# Enhanced agent wrappers that maintain conversation context
-
-def trip_node(state: GraphState):
-    # Pass the full conversation state to the trip agent
-    result = trip_agent_app.invoke(state)
-    
-    # Update the current agent and return the result
-    updated_state = {
-        "messages": [result["messages"][-1]],
-        "current_agent": "trip",
-        "agent_context": state.get("agent_context", {})
-    }
-    
-    return updated_state
-
-def finance_node(state: GraphState):
-    # Pass the full conversation state to the finance agent
-    result = finance_agent_app.invoke(state)
-    
-    # Update the current agent and return the result
-    updated_state = {
-        "messages": [result["messages"][-1]],
-        "current_agent": "finance", 
-        "agent_context": state.get("agent_context", {})
-    }
-    
-    return updated_state
-
-def normal_node(state: GraphState):
-    # For the normal agent, we need to handle conversation history manually
-    # since it might not be designed for multi-turn conversations
-    
-    # Get conversation history
-    conversation_history = state["messages"]
-    
-    # Prepare context for the normal agent
-    context = "Previous conversation:\n"
-    for msg in conversation_history[:-1]:  # Exclude current message
-        if isinstance(msg, HumanMessage):
-            context += f"User: {msg.content}\n"
-        elif isinstance(msg, AIMessage):
-            context += f"Assistant: {msg.content}\n"
-    
-    # Current user message
-    current_msg = conversation_history[-1].content
-    
-    # Combine context with current message
-    enhanced_input = f"{context}\nCurrent user input: {current_msg}"
-    
-    # Run the normal agent with enhanced context
-    result = normal_agent_llm.run(enhanced_input)
-    
-    updated_state = {
-        "messages": [AIMessage(content=result)],
-        "current_agent": "query",
-        "agent_context": state.get("agent_context", {})
-    }
-    
-    return updated_state
-
-def data_node(state: GraphState):
-    # For data insertion, we might need conversation context to understand references
-    conversation_history = state["messages"]
-    
-    # Prepare context for the data agent
-    context = "Previous conversation context:\n"
-    for msg in conversation_history[:-1]:
-        if isinstance(msg, HumanMessage):
-            context += f"User: {msg.content}\n"
-        elif isinstance(msg, AIMessage):
-            context += f"Assistant: {msg.content}\n"
-    
-    current_msg = conversation_history[-1].content
-    enhanced_input = f"{context}\nCurrent user input: {current_msg}"
-    
-    # Run the SQL chain with enhanced context
-    sql_query = sql_chain.run(enhanced_input)
-    
-    updated_state = {
-        "messages": [AIMessage(content=f"Here is the SQL statement:\n{sql_query}")],
-        "current_agent": "insertion",
-        "agent_context": state.get("agent_context", {})
-    }
-    
-    return updated_state
-
-# Memory to track turns
-memory = MemorySaver()
-
-# Build the LangGraph with enhanced state handling
-workflow = StateGraph(GraphState)
-workflow.add_node("trip", trip_node)
-workflow.add_node("finance", finance_node)
-workflow.add_node("query", normal_node)
-workflow.add_node("insertion", data_node)
-workflow.add_node("router", router_node)
-workflow.set_entry_point("router")
-
-# Edges for routing
-workflow.add_conditional_edges("router", llm_route_decision)
-workflow.add_edge("trip", END)
-workflow.add_edge("finance", END)
-workflow.add_edge("query", END)
-workflow.add_edge("insertion", END)
-
-# Compile final app
-app = workflow.compile(checkpointer=memory)
-
-# Enhanced chatbot loop with better state initialization
-# if __name__ == "__main__":
-#     config = {"configurable": {"thread_id": "multi-agent-thread-1"}}
-
-#     print("\n💬 Multi-Agent Chatbot (Multi-Turn Support) Ready! Type 'exit' to quit.\n")
-    
-#     while True:
-#         user_input = input("User: ")
-#         if user_input.lower() in ("exit", "quit"):
-#             print("👋 Exiting...")
-#             break
-
-#         # Initialize state with proper structure if it's the first message
-#         initial_state = {
-#             "messages": [HumanMessage(content=user_input)],
-#             "current_agent": "none",
-#             "agent_context": {}
-#         }
-        
-#         result = app.invoke(initial_state, config=config)
-#         print("Bot:", result["messages"][-1].content)
-        
-#         # Optional: Display current agent for debugging
-#         current_agent = result.get("current_agent", "unknown")
+import os
+from typing import Annotated, Literal, Optional, TypedDict, Union
+from langgraph.graph import StateGraph, add_messages, END
+from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+from langchain_core.runnables import Runnable, RunnableLambda
+from langchain_google_genai import ChatGoogleGenerativeAI
+from utils.llm_limits import LimitedChatOpenAI
+from utils.telemetry import telemetry_callbacks, instrument_node
+from langgraph.prebuilt import ToolNode
+from langchain.tools import tool
+
+import asyncio
+
+from agents.trip_agent import app as trip_agent_app, llm as trip_llm, tools as trip_tools
+from agents.trip_agent import parse_itinerary, render_itinerary, patch_itinerary, apatch_itinerary, guess_destination
+from agents.finance_agent import app as finance_agent_app, llm as finance_llm, tools as finance_tools
+from agents.normal_agent import run_for_user, arun_for_user
+from agents.data_entry_agent import extract_expenses, aextract_expenses
+from agents.bulk_entry_agent import looks_like_statement, ingest_statement, aingest_statement, format_report as format_bulk_report
+from utils.db_utils import add_expenses
+from utils.expense_fields import describe_expense
+from utils.expense_parser import parse_confident_expense
+from utils.query_templates import answer_from_templates
+from utils.llm_cache import get_cached, set_cached
+
+# Define the conversation state with additional context tracking
+class GraphState(TypedDict):
+    messages: Annotated[list, add_messages]
+    current_agent: str  # Track which agent is currently handling the conversation
+    agent_context: dict  # Store agent-specific context
+    route: str  # Agent chosen by the router for the current turn
+    prefetched_step: Optional[AIMessage]  # First agent step returned by a single-call router
+    parsed_expenses: Optional[list]  # Expense records parsed locally, without the LLM
+    itinerary: Optional[dict]  # Sections of the last trip plan, patched by follow-ups
+
+# Initialize LLM-based router model
+#llm_router = ChatGoogleGenerativeAI(model="gemini-1.5-flash", temperature=0)
+llm_router = LimitedChatOpenAI(model="gpt-4o-mini", temperature=0, callbacks=telemetry_callbacks, metadata={"agent": "router"})
+
+# Enhanced routing node using LLM with conversation history
+SYSTEM_ROUTER_PROMPT = """
+You are an intelligent routing assistant that decides which specialized agent should handle a user's input in a multi-turn conversation. Your task is to read the user input along with the conversation history and respond with the name of the most appropriate agent from a list of four.
+
+IMPORTANT: Consider the conversation context and current agent when making routing decisions. If the user is continuing a conversation with the same agent and their new message is related to the previous topic, you should generally route to the same agent to maintain continuity.
+
+However, if the user clearly switches topics or asks for a completely different type of assistance, route to the appropriate new agent.
+
+Only respond with the agent's name mentioned in the brackets as defined below — do not add explanations or extra text.
+
+There are four agents, each with a specific role:
+
+---
+
+1. **Trip Advisor Agent** (trip) 
+- Use this agent when the user asks for help planning a trip or vacation.  
+- Relevant inputs may include destinations, itineraries, flights, hotels, best times to visit, local attractions, or travel advice.
+
+**Examples:**  
+- "Plan a 3-day trip to Tokyo."  
+- "What are the best places to visit in Italy?"  
+- "Help me book a beach vacation in July."
+
+---
+
+2. **Financial Advisor Agent** (finance)
+- Use this agent for financial advice, stock market news, investment trends, budgeting help, or anything related to general finance or economics available online.  
+- It does **not** interact with the user's personal data or transactions.
+
+**Examples:**  
+- "What's the latest news on Tesla stock?"  
+- "How do I start investing in mutual funds?"  
+- "Give me a summary of current market trends."
+
+---
+
+3. **Database Query Agent** (query)
+- Use this agent when the user wants to **retrieve information from their personal database**.  
+- These inputs typically start with **how much**, **what did I**, **show me**, **list**, or **did I spend**.  
+- It queries the user's historical data (e.g., spending, habits, logs).
+
+**Examples:**  
+- "How much money did I spend on food last month?"  
+- "What were my top 5 expenses in June?"  
+- "Show me all transactions from last week."
+
+---
+
+4. **Data Insertion Agent** (insertion)
+- Use this agent when the user wants to **add a new entry or transaction** to their personal database.  
+- Look for language like **add**, **record**, **log**, **save**, or **insert** — typically includes a value, category, and sometimes a payment method.
+
+**Examples:**  
+- "Add $45.99 for groceries today paid by debit card."  
+- "Log 12 dollars spent on Uber."  
+- "Record 20.50 lunch with description coffee, paid by card."
+
+---
+
+### RULES:
+- **Only return one of the following four strings** exactly:  
+  `trip`, `finance`, `query`, or `insertion`.
+- **Do not explain** your choice.
+- If the input is ambiguous, choose the most likely intent based on the context.
+- Consider conversation continuity: if the user is asking follow-up questions or providing clarifications to the same agent, route to that agent.
+"""
+
+ROUTES = ["trip", "finance", "query", "insertion"]
+
+# Single-call mode: the router call also produces the first agent step when it can
+SINGLE_CALL_ROUTING = os.getenv("ROUTER_SINGLE_CALL", "0") == "1"
+
+SINGLE_CALL_ROUTER_PROMPT = SYSTEM_ROUTER_PROMPT + """
+
+### TOOL-CALL MODE:
+You must answer with a tool call instead of plain text.
+- If the request belongs to the Financial Advisor Agent and needs live market data or news, call the
+  finance tools (`get_stock_data`, `get_finance_news`, `web_search`) directly. This both routes the request
+  to the finance agent and starts its work.
+- Otherwise call `route_to_agent` with one of `trip`, `finance`, `query` or `insertion`.
+"""
+
+@tool
+def route_to_agent(agent: Literal["trip", "finance", "query", "insertion"]) -> str:
+    """Hand the user's request to the named specialist agent."""
+    return agent
+
+def build_router_messages(state: GraphState, system_prompt: str = SYSTEM_ROUTER_PROMPT) -> list:
+    # Get the full conversation history for context
+    conversation_history = state['messages']
+    current_agent = state.get('current_agent', 'none')
+    
+    # Prepare the context for the router
+    context_messages = []
+    
+    # Add system prompt
+    context_messages.append(SystemMessage(content=system_prompt))
+    
+    # Add conversation history context if available
+    if len(conversation_history) > 1:
+        history_context = f"Previous conversation context:\nCurrent agent handling conversation: {current_agent}\n"
+        history_context += "Recent messages:\n"
+        
+        # Include last few messages for context (limit to avoid token overflow)
+        recent_messages = conversation_history[-3:]  # Last 3 messages
+        for msg in recent_messages[:-1]:  # Exclude the current message
+            if isinstance(msg, HumanMessage):
+                history_context += f"User: {msg.content}\n"
+            elif isinstance(msg, AIMessage):
+                history_context += f"Assistant: {msg.content}\n"
+        
+        context_messages.append(HumanMessage(content=history_context))
+    
+    # Add the current user input
+    current_input = f"Current user input: {conversation_history[-1].content}"
+    context_messages.append(HumanMessage(content=current_input))
+    return context_messages
+
+def parse_route(response) -> Literal["trip", "finance", "query", "insertion"]:
+    route = response.content.strip().lower()
+    
+    if route in ROUTES:
+        return route
+    else:
+        return "query"
+
+def parse_single_call(response) -> tuple:
+    # Returns (route, prefetched_step); the step is only kept when the finance agent can run its tools
+    route_call = next((call for call in response.tool_calls if call["name"] == route_to_agent.name), None)
+    if route_call is not None:
+        route = route_call["args"].get("agent")
+        return (route if route in ROUTES else "query"), None
+    if response.tool_calls:
+        return "finance", response
+    return parse_route(response), None
+
+def router_cache_prompt(context_messages: list) -> str:
+    # The system prompt is constant, so only the conversation part identifies the request
+    return "\n".join(msg.content for msg in context_messages[1:])
+
+def single_call_router():
+    # Bound per call so a swapped-in llm_router (e.g. the offline benchmarks) is picked up
+    return llm_router.bind_tools([route_to_agent] + finance_tools, tool_choice="required")
+
+def llm_route_decision(state: GraphState) -> Literal["trip", "finance", "query", "insertion"]:
+    context_messages = build_router_messages(state)
+    cache_prompt = router_cache_prompt(context_messages)
+    cached_route = get_cached("router", cache_prompt, llm_router.model_name)
+    if cached_route in ROUTES:
+        return cached_route
+    
+    route = parse_route(llm_router.invoke(context_messages))
+    set_cached("router", cache_prompt, llm_router.model_name, route)
+    return route
+
+async def allm_route_decision(state: GraphState) -> Literal["trip", "finance", "query", "insertion"]:
+    context_messages = build_router_messages(state)
+    cache_prompt = router_cache_prompt(context_messages)
+    cached_route = await asyncio.to_thread(get_cached, "router", cache_prompt, llm_router.model_name)
+    if cached_route in ROUTES:
+        return cached_route
+    
+    route = parse_route(await llm_router.ainvoke(context_messages))
+    await asyncio.to_thread(set_cached, "router", cache_prompt, llm_router.model_name, route)
+    return route
+
+def single_call_route_decision(state: GraphState) -> tuple:
+    context_messages = build_router_messages(state, SINGLE_CALL_ROUTER_PROMPT)
+    cache_prompt = router_cache_prompt(context_messages)
+    cached_route = get_cached("router", cache_prompt, llm_router.model_name)
+    if cached_route in ROUTES:
+        return cached_route, None
+    
+    route, step = parse_single_call(single_call_router().invoke(context_messages))
+    set_cached("router", cache_prompt, llm_router.model_name, route)
+    return route, step
+
+async def asingle_call_route_decision(state: GraphState) -> tuple:
+    context_messages = build_router_messages(state, SINGLE_CALL_ROUTER_PROMPT)
+    cache_prompt = router_cache_prompt(context_messages)
+    cached_route = await asyncio.to_thread(get_cached, "router", cache_prompt, llm_router.model_name)
+    if cached_route in ROUTES:
+        return cached_route, None
+    
+    route, step = parse_single_call(await single_call_router().ainvoke(context_messages))
+    await asyncio.to_thread(set_cached, "router", cache_prompt, llm_router.model_name, route)
+    return route, step
+
+def route_update(route, step=None, parsed_expenses=None):
+    update = {"route": route, "prefetched_step": step, "parsed_expenses": parsed_expenses}
+    # Leaving the trip agent ends the stored plan, so a later trip request starts fresh
+    if route != "trip":
+        update["itinerary"] = None
+    return update
+
+def local_insertion_route(state: GraphState):
+    # Simple logging messages ("Log 12 dollars spent on Uber") are parsed locally,
+    # which skips both the router and the extraction LLM calls
+    if state.get("current_agent") in ("trip", "finance"):
+        # "Add a dinner cruise on day 4" continues a plan; the router decides
+        return None
+    current_msg = state["messages"][-1].content
+    if looks_like_statement(current_msg):
+        # Pasted transaction notes go to bulk ingestion in the insertion node
+        return route_update("insertion")
+    record = parse_confident_expense(current_msg)
+    if record is None:
+        return None
+    return route_update("insertion", parsed_expenses=[record])
+
+@instrument_node("router", kind="router")
+def router_node(state: GraphState):
+    # Decide the route once and keep it (and any prefetched agent step) in the state
+    local_route = local_insertion_route(state)
+    if local_route is not None:
+        return local_route
+    if SINGLE_CALL_ROUTING:
+        route, step = single_call_route_decision(state)
+    else:
+        route, step = llm_route_decision(state), None
+    return route_update(route, step)
+
+@instrument_node("router", kind="router")
+async def arouter_node(state: GraphState):
+    local_route = local_insertion_route(state)
+    if local_route is not None:
+        return local_route
+    if SINGLE_CALL_ROUTING:
+        route, step = await asingle_call_route_decision(state)
+    else:
+        route, step = await allm_route_decision(state), None
+    return route_update(route, step)
+
+def select_route(state: GraphState) -> Literal["trip", "finance", "query", "insertion"]:
+    return state.get("route") or "query"
+
+# Enhanced agent wrappers that maintain conversation context
+
+def build_enhanced_input(state: GraphState, header: str) -> str:
+    # Flatten the earlier turns into text for agents that are not multi-turn aware
+    conversation_history = state["messages"]
+    
+    context = header
+    for msg in conversation_history[:-1]:  # Exclude current message
+        if isinstance(msg, HumanMessage):
+            context += f"User: {msg.content}\n"
+        elif isinstance(msg, AIMessage):
+            context += f"Assistant: {msg.content}\n"
+    
+    # Combine context with the current user message
+    current_msg = conversation_history[-1].content
+    return f"{context}\nCurrent user input: {current_msg}"
+
+def agent_update(state: GraphState, message, agent_name: str):
+    # Update the current agent and return the result
+    return {
+        "messages": [message],
+        "current_agent": agent_name,
+        "agent_context": state.get("agent_context", {})
+    }
+
+def agent_cache_args(state: GraphState, agent_name: str, agent_llm, agent_tools) -> tuple:
+    # Key answers on the same recent-message window the router looks at,
+    # plus the model and the tools the agent could call
+    recent_messages = [msg for msg in state["messages"][-3:] if isinstance(msg, (HumanMessage, AIMessage))]
+    prompt = "\n".join(f"{msg.type}: {msg.content}" for msg in recent_messages)
+    tool_context = ",".join(sorted(t.name for t in agent_tools))
+    return agent_name, prompt, agent_llm.model_name, tool_context
+
+def run_cached_agent(state: GraphState, agent_name: str, agent_app, agent_llm, agent_tools):
+    agent, prompt, model, tool_context = agent_cache_args(state, agent_name, agent_llm, agent_tools)
+    cached = get_cached(agent, prompt, model, tool_context)
+    if cached is not None:
+        return agent_update(state, AIMessage(content=cached), agent_name)
+    
+    # Pass the full conversation state to the agent
+    result = agent_app.invoke(state)
+    set_cached(agent, prompt, model, result["messages"][-1].content, tool_context)
+    return agent_update(state, result["messages"][-1], agent_name)
+
+async def arun_cached_agent(state: GraphState, agent_name: str, agent_app, agent_llm, agent_tools):
+    agent, prompt, model, tool_context = agent_cache_args(state, agent_name, agent_llm, agent_tools)
+    cached = await asyncio.to_thread(get_cached, agent, prompt, model, tool_context)
+    if cached is not None:
+        return agent_update(state, AIMessage(content=cached), agent_name)
+    
+    result = await agent_app.ainvoke(state)
+    await asyncio.to_thread(set_cached, agent, prompt, model, result["messages"][-1].content, tool_context)
+    return agent_update(state, result["messages"][-1], agent_name)
+
+def itinerary_update(state: GraphState, itinerary: dict, changed: list):
+    response = f"I updated {', '.join(changed)}. Here is your revised plan:\n\n{render_itinerary(itinerary)}"
+    return dict(agent_update(state, AIMessage(content=response), "trip"), itinerary=itinerary)
+
+@instrument_node("trip")
+def trip_node(state: GraphState):
+    # Follow-ups on an existing plan only regenerate the sections they change
+    itinerary = state.get("itinerary")
+    if itinerary:
+        patched = patch_itinerary(itinerary, state["messages"][-1].content)
+        if patched is not None:
+            return itinerary_update(state, *patched)
+    update = run_cached_agent(state, "trip", trip_agent_app, trip_llm, trip_tools)
+    update["itinerary"] = parse_itinerary(update["messages"][-1].content, guess_destination(state["messages"][-1].content))
+    return update
+
+@instrument_node("trip")
+async def atrip_node(state: GraphState):
+    itinerary = state.get("itinerary")
+    if itinerary:
+        patched = await apatch_itinerary(itinerary, state["messages"][-1].content)
+        if patched is not None:
+            return itinerary_update(state, *patched)
+    update = await arun_cached_agent(state, "trip", trip_agent_app, trip_llm, trip_tools)
+    update["itinerary"] = parse_itinerary(update["messages"][-1].content, guess_destination(state["messages"][-1].content))
+    return update
+
+@instrument_node("finance")
+def finance_node(state: GraphState):
+    prefetched_step = state.get("prefetched_step")
+    if prefetched_step is not None:
+        # The router already made the first finance call; the agent continues from its tool calls
+        result = finance_agent_app.invoke({"messages": state["messages"] + [prefetched_step]})
+        return agent_update(state, result["messages"][-1], "finance")
+    return run_cached_agent(state, "finance", finance_agent_app, finance_llm, finance_tools)
+
+@instrument_node("finance")
+async def afinance_node(state: GraphState):
+    prefetched_step = state.get("prefetched_step")
+    if prefetched_step is not None:
+        result = await finance_agent_app.ainvoke({"messages": state["messages"] + [prefetched_step]})
+        return agent_update(state, result["messages"][-1], "finance")
+    return await arun_cached_agent(state, "finance", finance_agent_app, finance_llm, finance_tools)
+
+def follows_query(state: GraphState) -> bool:
+    # current_agent still names the agent that answered the previous turn
+    return state.get("current_agent") == "query" and len(state["messages"]) > 1
+
+@instrument_node("query")
+def normal_node(state: GraphState):
+    # Common spending questions are answered straight from precompiled SQL templates
+    user_id = state.get("agent_context", {}).get("user_id")
+    answer = answer_from_templates(state["messages"][-1].content, user_id, follows_query=follows_query(state))
+    if answer is not None:
+        return agent_update(state, AIMessage(content=answer), "query")
+    
+    # The normal agent is not designed for multi-turn conversations,
+    # so the conversation history is passed in as text
+    enhanced_input = build_enhanced_input(state, "Previous conversation:\n")
+    result = run_for_user(enhanced_input, user_id, question=state["messages"][-1].content)
+    return agent_update(state, AIMessage(content=result), "query")
+
+@instrument_node("query")
+async def anormal_node(state: GraphState):
+    user_id = state.get("agent_context", {}).get("user_id")
+    answer = await asyncio.to_thread(answer_from_templates, state["messages"][-1].content, user_id,
+                                     follows_query=follows_query(state))
+    if answer is not None:
+        return agent_update(state, AIMessage(content=answer), "query")
+    
+    enhanced_input = build_enhanced_input(state, "Previous conversation:\n")
+    result = await arun_for_user(enhanced_input, user_id, question=state["messages"][-1].content)
+    return agent_update(state, AIMessage(content=result), "query")
+
+def save_extracted_expenses(state: GraphState, records: list, notes: list) -> str:
+    # Write every extracted expense in one batch and summarise what happened
+    user_id = state.get("agent_context", {}).get("user_id")
+    if not records:
+        return "I couldn't find an expense with a valid amount in that message. " + "; ".join(notes)
+    if user_id is None:
+        return "Please log in before adding transactions."
+    
+    add_expenses(user_id, records)
+    summary = "\n".join(f"- {describe_expense(record)}" for record in records)
+    response = f"Added {len(records)} transaction{'s' if len(records) > 1 else ''}:\n{summary}"
+    if notes:
+        response += "\nNotes: " + "; ".join(notes)
+    return response
+
+def bulk_ingest_response(report) -> str:
+    if report is None:
+        return "Please log in before adding transactions."
+    return format_bulk_report(report)
+
+@instrument_node("insertion")
+def data_node(state: GraphState):
+    current_msg = state["messages"][-1].content
+    user_id = state.get("agent_context", {}).get("user_id")
+    if looks_like_statement(current_msg):
+        report = ingest_statement(user_id, current_msg) if user_id is not None else None
+        return agent_update(state, AIMessage(content=bulk_ingest_response(report)), "insertion")
+    if state.get("parsed_expenses"):
+        # Already parsed locally by the router
+        records, notes = state["parsed_expenses"], []
+    else:
+        # For data insertion, we might need conversation context to understand references
+        enhanced_input = build_enhanced_input(state, "Previous conversation context:\n")
+        records, notes = extract_expenses(enhanced_input)
+    return agent_update(state, AIMessage(content=save_extracted_expenses(state, records, notes)), "insertion")
+
+@instrument_node("insertion")
+async def adata_node(state: GraphState):
+    current_msg = state["messages"][-1].content
+    user_id = state.get("agent_context", {}).get("user_id")
+    if looks_like_statement(current_msg):
+        report = await aingest_statement(user_id, current_msg) if user_id is not None else None
+        return agent_update(state, AIMessage(content=bulk_ingest_response(report)), "insertion")
+    if state.get("parsed_expenses"):
+        records, notes = state["parsed_expenses"], []
+    else:
+        enhanced_input = build_enhanced_input(state, "Previous conversation context:\n")
+        records, notes = await aextract_expenses(enhanced_input)
+    response = await asyncio.to_thread(save_extracted_expenses, state, records, notes)
+    return agent_update(state, AIMessage(content=response), "insertion")
+
+# Memory to track turns
+memory = MemorySaver()
+
+# Build the LangGraph with enhanced state handling.
+# Every node has a sync and an async implementation, so the same graph serves
+# app.invoke (one thread per chat) and app.ainvoke / app.astream (event loop).
+workflow = StateGraph(GraphState)
+workflow.add_node("trip", RunnableLambda(trip_node, afunc=atrip_node))
+workflow.add_node("finance", RunnableLambda(finance_node, afunc=afinance_node))
+workflow.add_node("query", RunnableLambda(normal_node, afunc=anormal_node))
+workflow.add_node("insertion", RunnableLambda(data_node, afunc=adata_node))
+workflow.add_node("router", RunnableLambda(router_node, afunc=arouter_node))
+workflow.set_entry_point("router")
+
+# Edges for routing
+workflow.add_conditional_edges("router", select_route, ROUTES)
+workflow.add_edge("trip", END)
+workflow.add_edge("finance", END)
+workflow.add_edge("query", END)
+workflow.add_edge("insertion", END)
+
+# Compile final app
+app = workflow.compile(checkpointer=memory)
+
+# Enhanced chatbot loop with better state initialization
+# if __name__ == "__main__":
+#     config = {"configurable": {"thread_id": "multi-agent-thread-1"}}
+
+#     print("\n💬 Multi-Agent Chatbot (Multi-Turn Support) Ready! Type 'exit' to quit.\n")
+    
+#     while True:
+#         user_input = input("User: ")
+#         if user_input.lower() in ("exit", "quit"):
+#             print("👋 Exiting...")
+#             break
+
+#         # Initialize state with proper structure if it's the first message
+#         initial_state = {
+#             "messages": [HumanMessage(content=user_input)],
+#             "current_agent": "none",
+#             "agent_context": {}
+#         }
+        
+#         result = app.invoke(initial_state, config=config)
+#         print("Bot:", result["messages"][-1].content)
+        
+#         # Optional: Display current agent for debugging
+#         current_agent = result.get("current_agent", "unknown")
 #         print(f"🤖 (Handled by: {current_agent} agent)\n")
\ No newline at end of file
@@ -0,0 +1,43 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import db_utils
+
+@pytest.fixture
+def expense_db(tmp_path, monkeypatch):
+    """A fresh expense database for the test, used by every module that reads DB_PATH"""
+    from utils import sql_sandbox
+    path = str(tmp_path / "expense_tracker.db")
+    monkeypatch.setattr(db_utils, "DB_PATH", path)
+    monkeypatch.setattr(sql_sandbox, "DB_PATH", path)
+    db_utils._local.conn = None
+    db_utils.init_db()
+    yield path
+    db_utils.get_conn().close()
+    db_utils._local.conn = None
+
+@pytest.fixture
+def two_users(expense_db):
+    """(alice_id, bob_id), each with two expenses and a budget"""
+    ids = []
+    for name, amounts in (("alice", (10, 20)), ("bob", (500, 700))):
+        db_utils.register_user(name, "Test", f"{name}@example.com", "secret")
+        user_id = db_utils.authenticate_user(f"{name}@example.com", "secret")[0]
+        for amount in amounts:
+            db_utils.add_expense(user_id, amount, "Food", "2026-10-01", name, False, None, "Cash")
+        db_utils.update_budget_settings(user_id, 1000, 100, 0)
+        ids.append(user_id)
+    return tuple(ids)
+
+@pytest.fixture
+def cache_db(tmp_path, monkeypatch):
+    """A fresh LLM response cache for the test"""
+    from utils import llm_cache
+    monkeypatch.setattr(llm_cache, "CACHE_DB_PATH", str(tmp_path / "llm_cache.db"))
+    monkeypatch.setattr(llm_cache, "_stats", {})
+    llm_cache.set_embedder(None)
+    yield llm_cache
+    llm_cache.set_embedder(None)
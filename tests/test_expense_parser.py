@@ -0,0 +1,72 @@
+from datetime import date
+import pytest
+from utils.expense_parser import money_amounts, parse_confident_expense, parse_expense_text
+
+TODAY = date(2026, 10, 19)
+
+@pytest.mark.parametrize("text", [
+    "Total spent on food in 2024",
+    "Top 5 food expenses paid by credit card",
+    "Give me my top 3 transport expenses paid by cash",
+    "How much did I spend on groceries?",
+    "Show my food expenses from 2025",
+    "How many times did I pay 12 dollars for coffee",
+    "spent 40 on dinner in 2024",
+])
+def test_questions_are_not_saved(text):
+    assert parse_confident_expense(text, TODAY) is None
+
+def test_bare_year_is_not_an_amount():
+    record, _ = parse_expense_text("Log lunch 14 dollars on 2026-10-03 in 2026", TODAY)
+    assert record["amount"] == 14
+    assert record["date"] == "2026-10-03"
+
+def test_dollar_amount_that_looks_like_a_year_is_kept():
+    record, _ = parse_expense_text("Add $2024 for rent", TODAY)
+    assert record["amount"] == 2024
+
+def test_paid_alone_is_not_enough_to_save():
+    record, confidence = parse_expense_text("paid 30 for lunch", TODAY)
+    assert record is not None
+    assert parse_confident_expense("paid 30 for lunch", TODAY) is None
+
+def test_simple_logging_message_is_parsed():
+    record = parse_confident_expense("Log 12 dollars spent on Uber yesterday paid by credit card", TODAY)
+    assert record["amount"] == 12
+    assert record["category"] == "Transport"
+    assert record["date"] == "2026-10-18"
+    assert record["payment_method"] == "Credit Card"
+
+def test_several_amounts_go_to_the_llm():
+    assert parse_confident_expense("Add 12 for lunch and 30 for dinner", TODAY) is None
+
+@pytest.mark.parametrize("text", [
+    "Add a dinner cruise on day 4",
+    "Add a 2 hour food tour",
+    "I want to save 200 on groceries",
+    "I want to save $200 on groceries",
+    "Save 3 restaurants for later",
+    "Add 2 tickets for the concert",
+])
+def test_plans_and_counts_are_not_saved(text):
+    assert parse_confident_expense(text, TODAY) is None
+
+@pytest.mark.parametrize("text, amount", [
+    ("Add $18 for lunch", 18),
+    ("coffee 4.50 at Starbucks today", 4.5),
+    ("Log uber 18 yesterday", 18),
+    ("Bought groceries, paid 45 by debit card", 45),
+])
+def test_money_shaped_amounts_are_saved(text, amount):
+    record = parse_confident_expense(text, TODAY)
+    assert record is not None and record["amount"] == amount
+
+@pytest.mark.parametrize("line, amounts", [
+    ("Day 1 Tokyo", []),
+    ("3 nights in Kyoto", []),
+    ("Starbucks 4.50", [4.5]),
+    ("uber 18", [18]),
+    ("Target $23", [23]),
+])
+def test_statement_lines_need_money_shaped_amounts(line, amounts):
+    assert money_amounts(line) == amounts
@@ -0,0 +1,51 @@
+import threading
+import time
+from utils import job_runner
+
+def wait_for(job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = job_runner.collect_job(job_id)
+        if job is not None:
+            return job
+        time.sleep(0.01)
+    raise AssertionError("job did not finish")
+
+def test_same_key_in_a_session_is_deduplicated():
+    release = threading.Event()
+    first = job_runner.submit_job("dedupe", "hello", release.wait, 5)
+    assert job_runner.submit_job("dedupe", "hello", release.wait, 5) == first
+    release.set()
+    assert wait_for(first)["status"] == "done"
+
+def test_jobs_with_a_serial_key_never_overlap():
+    running, overlaps, order = [0], [], []
+    lock = threading.Lock()
+
+    def turn(name):
+        with lock:
+            running[0] += 1
+            overlaps.append(running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+            order.append(name)
+        return name
+
+    # Different messages from two tabs of the same user
+    jobs = [job_runner.submit_job(f"tab-{i % 2}", f"message {i}", turn, i, serial_key="user-1") for i in range(4)]
+    results = [wait_for(job_id) for job_id in jobs]
+    assert [job["result"] for job in results] == [0, 1, 2, 3]
+    assert order == [0, 1, 2, 3]
+    assert max(overlaps) == 1
+
+def test_failed_job_releases_its_serial_key():
+    def boom():
+        raise ValueError("boom")
+    failed = job_runner.submit_job("s", "a", boom, serial_key="user-2")
+    after = job_runner.submit_job("s", "b", lambda: "ok", serial_key="user-2")
+    assert wait_for(failed)["status"] == "failed"
+    assert wait_for(after)["result"] == "ok"
+
+def test_unknown_job_is_reported_lost():
+    assert job_runner.collect_job("missing")["status"] == "lost"
@@ -0,0 +1,46 @@
+import threading
+import pytest
+
+def test_roundtrip_ignores_case_spacing_and_punctuation(cache_db):
+    cache_db.set_cached("trip", "Plan a trip to Lisbon", "gpt-4o-mini", "Day 1: ...")
+    assert cache_db.get_cached("trip", "  plan a TRIP to lisbon?", "gpt-4o-mini") == "Day 1: ..."
+
+@pytest.mark.parametrize("agent, model, tool_context", [
+    ("finance", "gpt-4o-mini", ""),
+    ("trip", "gpt-4o", ""),
+    ("trip", "gpt-4o-mini", "search_travel_info"),
+])
+def test_entries_are_scoped_by_agent_model_and_tools(cache_db, agent, model, tool_context):
+    cache_db.set_cached("trip", "Plan a trip to Lisbon", "gpt-4o-mini", "Day 1: ...")
+    assert cache_db.get_cached(agent, "Plan a trip to Lisbon", model, tool_context) is None
+
+def test_expired_entries_miss(cache_db):
+    cache_db.set_cached("finance", "AAPL price", "gpt-4o-mini", "$200", ttl=-1)
+    assert cache_db.get_cached("finance", "AAPL price", "gpt-4o-mini") is None
+
+def test_empty_responses_are_not_cached(cache_db):
+    cache_db.set_cached("router", "hello", "gpt-4o-mini", "")
+    assert cache_db.get_cached("router", "hello", "gpt-4o-mini") is None
+
+def test_semantic_lookup_needs_a_close_enough_prompt(cache_db):
+    vectors = {"best time to visit rome": [1.0, 0.0], "when should i visit rome": [0.99, 0.05], "tokyo food": [0.0, 1.0]}
+    cache_db.set_embedder(lambda text: vectors[text])
+    cache_db.set_cached("trip", "Best time to visit Rome", "gpt-4o-mini", "Spring")
+    assert cache_db.get_cached("trip", "When should I visit Rome?", "gpt-4o-mini") == "Spring"
+    assert cache_db.get_cached("trip", "Tokyo food", "gpt-4o-mini") is None
+    stats = cache_db.cache_stats()["trip"]
+    assert (stats["semantic_hits"], stats["misses"]) == (1, 1)
+
+def test_sql_answers_are_per_user(cache_db):
+    cache_db.set_sql_answer(1, "How much on food?", 3, "$30", "SELECT 1", "[(30,)]")
+    entry = cache_db.get_sql_answer(1, "how much on food")
+    assert (entry["data_version"], entry["answer"], entry["sql"], entry["result"]) == (3, "$30", "SELECT 1", "[(30,)]")
+    assert cache_db.get_sql_answer(2, "How much on food?") is None
+
+def test_one_connection_per_thread(cache_db):
+    assert cache_db.get_cache_conn() is cache_db.get_cache_conn()
+    other = []
+    thread = threading.Thread(target=lambda: other.append(cache_db.get_cache_conn()))
+    thread.start()
+    thread.join()
+    assert other[0] is not cache_db.get_cache_conn()
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+import pytest
+from utils import llm_gateway
+
+class RateLimited(Exception):
+    status_code = 429
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    # A 429 pauses the model's bucket, so a high rate keeps that pause short
+    monkeypatch.setattr(llm_gateway, "RETRY_BASE_DELAY", 0.001)
+    monkeypatch.setattr(llm_gateway, "DEFAULT_RPM", 60000)
+
+def flaky(failures, exc=RateLimited):
+    attempts = []
+
+    def fn():
+        attempts.append(1)
+        if len(attempts) <= failures:
+            raise exc()
+        return "answer"
+    return fn, attempts
+
+def test_retryable_errors_are_retried():
+    fn, attempts = flaky(2)
+    assert llm_gateway.call("test-retry", "model-a", "query", fn) == "answer"
+    assert len(attempts) == 3
+
+def test_other_errors_fail_at_once():
+    fn, attempts = flaky(1, ValueError)
+    with pytest.raises(ValueError):
+        llm_gateway.call("test-fail", "model-f", "query", fn)
+    assert len(attempts) == 1
+
+def test_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_MAX_RETRIES", 2)
+    fn, attempts = flaky(10)
+    with pytest.raises(RateLimited):
+        llm_gateway.call("test-give-up", "model-g", "query", fn)
+    assert len(attempts) == 3
+
+def test_provider_limit_bounds_concurrency(monkeypatch):
+    monkeypatch.setitem(llm_gateway.PROVIDER_LIMITS, "test-limit", 2)
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def fn():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return "ok"
+
+    threads = [threading.Thread(target=llm_gateway.call, args=("test-limit", "model-b", "trip", fn)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 2
+
+def test_identical_requests_share_one_call():
+    calls, results = [], []
+
+    def fn():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"text": "answer"}
+
+    threads = [threading.Thread(target=lambda: results.append(llm_gateway.call("test-coalesce", "model-c", "router", fn, key="same")))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == [{"text": "answer"}] * 4
+    # Followers get copies, so one caller mutating its result cannot affect the others
+    assert len({id(result) for result in results}) == 4
+
+def test_async_calls_retry_too():
+    attempts = []
+
+    async def fn():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RateLimited()
+        return "answer"
+
+    assert asyncio.run(llm_gateway.acall("test-async", "model-d", "query", fn)) == "answer"
+    assert len(attempts) == 2
+
+def test_streams_are_not_retried_after_the_first_chunk():
+    starts = []
+
+    def start():
+        starts.append(1)
+        yield "first"
+        raise RateLimited()
+
+    chunks = []
+    with pytest.raises(RateLimited):
+        for chunk in llm_gateway.stream("test-stream", "model-e", "finance", start):
+            chunks.append(chunk)
+    assert chunks == ["first"]
+    assert len(starts) == 1
+
+def test_token_bucket_waits_once_empty():
+    bucket = llm_gateway.TokenBucket(rate_per_minute=60, burst=2)
+    now = time.monotonic()
+    assert bucket.try_take(now) == 0
+    assert bucket.try_take(now) == 0
+    assert bucket.try_take(now) == pytest.approx(1.0)
+    assert bucket.try_take(now + 1.0) == 0
@@ -0,0 +1,37 @@
+from datetime import date, timedelta
+import pytest
+from utils import market_data
+
+class FakeSource:
+    def __init__(self):
+        self.fetches = []
+
+    def fetch(self, symbol, start, end):
+        self.fetches.append((symbol, start, end))
+        days = (end - start).days + 1
+        return [((start + timedelta(days=i)).isoformat(), 1.0, 1.0, 1.0, 100.0 + i, 1000) for i in range(days)]
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    monkeypatch.setattr(market_data, "MARKET_DB_PATH", str(tmp_path / "market_data.db"))
+    fake = FakeSource()
+    market_data.set_price_source(fake)
+    yield fake
+    market_data.set_price_source(None)
+
+def test_only_missing_days_are_fetched(source, monkeypatch):
+    monkeypatch.setattr(market_data, "MARKET_REFRESH_SECONDS", 3600)
+    market_data.get_closes("aapl", date(2026, 1, 1), date(2026, 1, 10))
+    dates, closes = market_data.get_closes("AAPL", date(2025, 12, 30), date(2026, 1, 10))
+    assert source.fetches == [("AAPL", date(2026, 1, 1), date(2026, 1, 10)),
+                              ("AAPL", date(2025, 12, 30), date(2025, 12, 31))]
+    assert len(dates) == 12 and closes[-1] == 109.0
+
+def test_one_connection_per_thread_and_schema_created_once(source):
+    conn = market_data.get_market_conn()
+    assert market_data.get_market_conn() is conn
+    assert market_data.MARKET_DB_PATH in market_data._schema_ready
+
+def test_moving_average():
+    assert list(market_data.moving_average([1.0, 2.0, 3.0, 4.0], 2)) == [1.5, 2.5, 3.5]
+    assert market_data.moving_average([1.0], 2) is None
@@ -0,0 +1,67 @@
+from datetime import date
+import pytest
+from utils.query_templates import answer_from_templates, extract_intent, find_periods
+
+TODAY = date(2026, 10, 19)
+
+@pytest.mark.parametrize("question", [
+    "What category did I spend the most on last month?",
+    "Did I spend more on food or transport last month?",
+    "How much did I spend between March 1 and March 15?",
+    "How much did I spend on March 3rd?",
+    "How much did I spend on 2026-03-01?",
+    "How much did I spend since March?",
+    "How many times did I spend on coffee",
+    "How much did I spend on coffee this month?",
+    "Which payment method did I use least?",
+    "How much did I spend with cash or credit card?",
+    "How much did I spend on Monday?",
+    "What was my average daily spend this month?",
+    "How much was that in total?",
+    "total for transport same period?",
+    "And what about food?",
+    "How much did I earn last month?",
+    "How much is Tesla stock worth?",
+    "How much is my portfolio worth this year?",
+    "How much rain fell last month?",
+])
+def test_partly_understood_questions_fall_back_to_the_agent(question):
+    assert extract_intent(question, TODAY) is None
+
+def test_bare_year_is_a_period():
+    intent, slots = extract_intent("How much did I spend in 2024?", TODAY)
+    assert intent == "total_spend"
+    assert slots["period"] == (date(2024, 1, 1), date(2025, 1, 1), "2024")
+
+def test_month_with_year_is_not_also_a_bare_year():
+    assert find_periods("food in March 2024", TODAY) == [(date(2024, 3, 1), date(2024, 4, 1), "March 2024")]
+
+def test_category_named_directly_is_a_slot():
+    intent, slots = extract_intent("Total spent on food last month with credit card", TODAY)
+    assert intent == "total_spend"
+    assert slots["category"] == "Food"
+    assert slots["payment_method"] == "Credit Card"
+    assert slots["period"][2] == "last month"
+
+def test_top_expenses_with_count():
+    intent, slots = extract_intent("Show my top 3 most expensive purchases this year", TODAY)
+    assert intent == "top_expenses"
+    assert slots["limit"] == 3
+
+def test_compare_two_periods():
+    intent, slots = extract_intent("Compare this month vs last month", TODAY)
+    assert intent == "compare_periods"
+    assert [period[2] for period in slots["periods"]] == ["this month", "last month"]
+
+def test_answer_uses_only_the_users_rows(two_users):
+    alice, bob = two_users
+    assert answer_from_templates("How much did I spend on food in October 2026?", alice, TODAY) == \
+        "You spent $30.00 on Food (October 2026) across 2 transactions."
+    assert answer_from_templates("How much did I spend in 2024?", bob, TODAY) == \
+        "You spent $0.00 (2024) across 0 transactions."
+
+def test_question_without_a_period_after_a_query_goes_to_the_agent(two_users):
+    alice, _ = two_users
+    assert answer_from_templates("Total for transport?", alice, TODAY, follows_query=True) is None
+    assert answer_from_templates("Total spent on transport in October 2026?", alice, TODAY, follows_query=True) == \
+        "You spent $0.00 on Transport (October 2026) across 0 transactions."
@@ -0,0 +1,38 @@
+import statistics
+from datetime import date
+from utils import db_utils, spending_stats
+
+def expense(amount, day=None, category="Food"):
+    return {"amount": amount, "category": category, "date": day or date.today().isoformat(), "payment_method": "Cash"}
+
+def test_welford_matches_the_batch_statistics():
+    values = [12.5, 7.0, 30.25, 18.0, 9.75]
+    count, mean, m2 = 0, 0.0, 0.0
+    for value in values:
+        count, mean, m2 = spending_stats.welford_update(count, mean, m2, value)
+    assert mean == statistics.mean(values)
+    assert abs(m2 / (count - 1) - statistics.variance(values)) < 1e-9
+
+def test_unusual_charge_raises_an_alert(two_users):
+    alice, _ = two_users
+    db_utils.add_expenses(alice, [expense(amount) for amount in (11, 9, 12, 10)])
+    assert not [alert for alert in db_utils.get_spending_alerts(alice) if alert[1] == "anomaly"]
+    db_utils.add_expenses(alice, [expense(400)])
+    anomalies = [alert for alert in db_utils.get_spending_alerts(alice) if alert[1] == "anomaly"]
+    assert len(anomalies) == 1 and anomalies[0][2:4] == ("Food", 400)
+
+def test_budget_thresholds_alert_once_each(two_users):
+    alice, _ = two_users
+    # 30 of 1000 spent so far
+    db_utils.add_expenses(alice, [expense(500, category="Bills")])
+    db_utils.add_expenses(alice, [expense(10, category="Bills")])
+    db_utils.add_expenses(alice, [expense(500, category="Bills")])
+    messages = [alert[4] for alert in db_utils.get_spending_alerts(alice) if alert[1] == "budget"]
+    assert len(messages) == 3
+    assert messages[0].startswith("You are over this month's budget")
+    assert "50%" in messages[2] and "80%" in messages[1]
+
+def test_past_months_do_not_touch_the_budget(two_users):
+    alice, _ = two_users
+    db_utils.add_expenses(alice, [expense(5000, day="2025-01-15", category="Bills")])
+    assert not [alert for alert in db_utils.get_spending_alerts(alice) if alert[1] == "budget"]
@@ -0,0 +1,88 @@
+import pytest
+from utils.sql_sandbox import QueryKilled, add_default_limit, run_for_agent, run_query
+
+SCOPED = ("expenses", "budget_settings")
+
+def test_unqualified_tables_only_show_the_users_rows(two_users):
+    alice, bob = two_users
+    _, rows, _ = run_query("SELECT SUM(amount) FROM expenses", user_id=alice, tables=SCOPED)
+    assert rows == [(30.0,)]
+    _, rows, _ = run_query("SELECT COUNT(*) FROM budget_settings", user_id=bob, tables=SCOPED)
+    assert rows == [(1,)]
+
+@pytest.mark.parametrize("query", [
+    "SELECT * FROM main.expenses",
+    'SELECT * FROM "main".expenses',
+    "SELECT * FROM [main].expenses",
+    "SELECT * FROM `main`.expenses",
+    "SELECT * FROM main/**/.expenses",
+    "SELECT * FROM main . expenses",
+    "WITH expenses AS (SELECT * FROM main.expenses) SELECT * FROM expenses",
+    "SELECT * FROM expenses UNION ALL SELECT * FROM main.expenses",
+    "SELECT * FROM users",
+    "SELECT * FROM data_versions",
+    "SELECT * FROM sqlite_master",
+    "SELECT * FROM temp.sqlite_master",
+])
+def test_scope_cannot_be_bypassed(two_users, query):
+    alice, _ = two_users
+    with pytest.raises(QueryKilled) as killed:
+        run_query(query, user_id=alice, tables=SCOPED)
+    assert killed.value.reason == "forbidden"
+
+def test_joins_and_subqueries_over_scoped_tables_work(two_users):
+    alice, _ = two_users
+    query = """
+        SELECT e.amount, b.monthly_budget FROM expenses e
+        JOIN budget_settings b ON b.user_id = e.user_id
+        WHERE e.amount > (SELECT MIN(amount) FROM expenses)
+    """
+    _, rows, _ = run_query(query, user_id=alice, tables=SCOPED)
+    assert rows == [(20.0, 1000.0)]
+
+def test_agent_gets_a_readable_error(two_users):
+    alice, _ = two_users
+    result = run_for_agent('SELECT * FROM "main".expenses', user_id=alice, tables=SCOPED)
+    assert result.startswith("Error: only the tables expenses, budget_settings")
+
+def test_writes_are_refused(two_users):
+    alice, _ = two_users
+    with pytest.raises(QueryKilled) as killed:
+        run_query("DELETE FROM expenses", user_id=alice, tables=SCOPED)
+    assert killed.value.reason == "not_read_only"
+
+def test_row_limit_truncates(two_users, monkeypatch):
+    from utils import sql_sandbox
+    alice, _ = two_users
+    monkeypatch.setattr(sql_sandbox, "SQL_MAX_ROWS", 1)
+    _, rows, truncated = run_query("SELECT amount FROM expenses", user_id=alice, tables=SCOPED)
+    assert len(rows) == 1 and truncated
+
+def test_slow_query_times_out(two_users):
+    alice, _ = two_users
+    query = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT COUNT(*) FROM n"
+    with pytest.raises(QueryKilled) as killed:
+        run_query(query, timeout_ms=50, user_id=alice, tables=SCOPED)
+    assert killed.value.reason == "timeout"
+
+def test_default_limit_is_added_once():
+    assert add_default_limit("SELECT 1;", 5) == "SELECT 1\nLIMIT 5"
+    assert add_default_limit("SELECT 1 LIMIT 3") == "SELECT 1 LIMIT 3"
+
+@pytest.mark.parametrize("query, expected", [
+    ("SELECT 1 -- every row", "SELECT 1\nLIMIT 5"),
+    ("SELECT 1; -- done\n-- really", "SELECT 1\nLIMIT 5"),
+    ("SELECT 1 /* all */", "SELECT 1\nLIMIT 5"),
+    ("SELECT 1 /* unterminated", "SELECT 1\nLIMIT 5"),
+    ("SELECT 1 LIMIT 3 -- top three", "SELECT 1 LIMIT 3"),
+    ("SELECT '--' AS dashes", "SELECT '--' AS dashes\nLIMIT 5"),
+])
+def test_trailing_comments_cannot_hide_the_limit(query, expected):
+    assert add_default_limit(query, 5) == expected
+
+def test_query_without_limit_is_capped_at_max_rows(two_users, monkeypatch):
+    from utils import sql_sandbox
+    alice, _ = two_users
+    monkeypatch.setattr(sql_sandbox, "SQL_MAX_ROWS", 1)
+    _, rows, truncated = run_query("SELECT amount FROM expenses -- all of them", user_id=alice, tables=SCOPED)
+    assert len(rows) == 1 and truncated
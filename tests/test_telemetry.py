@@ -0,0 +1,34 @@
+import uuid
+import pytest
+from langchain_core.outputs import LLMResult
+from utils import telemetry
+
+@pytest.fixture(autouse=True)
+def fresh_metrics():
+    telemetry.reset()
+    yield
+    telemetry.reset()
+
+def by_name():
+    return {(row["kind"], row["name"]): row for row in telemetry.snapshot()}
+
+def test_llm_call_is_recorded_with_its_agent_and_tokens():
+    handler, run_id = telemetry.TelemetryCallbackHandler(), uuid.uuid4()
+    handler.on_chat_model_start({}, [], run_id=run_id, metadata={"agent": "trip"},
+                                invocation_params={"model": "gpt-4o-mini"})
+    handler.on_llm_end(LLMResult(generations=[], llm_output={"token_usage": {"prompt_tokens": 10, "completion_tokens": 5}}),
+                       run_id=run_id)
+    row = by_name()[("llm", "trip:gpt-4o-mini")]
+    assert (row["count"], row["tokens_in"], row["tokens_out"]) == (1, 10, 5)
+
+@pytest.mark.parametrize("finish", [
+    lambda handler, run_id: handler.on_llm_end(LLMResult(generations=[]), run_id=run_id),
+    lambda handler, run_id: handler.on_llm_error(ValueError("boom"), run_id=run_id),
+])
+def test_llm_runs_without_a_recorded_start_are_still_counted(finish):
+    finish(telemetry.TelemetryCallbackHandler(), uuid.uuid4())
+    assert by_name()[("llm", "unknown")]["count"] == 1
+
+def test_tool_runs_without_a_recorded_start_are_still_counted():
+    telemetry.TelemetryCallbackHandler().on_tool_end("result", run_id=uuid.uuid4())
+    assert by_name()[("tool", "tool")]["count"] == 1
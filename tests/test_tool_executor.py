@@ -0,0 +1,54 @@
+import asyncio
+import threading
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.tools import tool
+from utils import tool_executor
+
+release = threading.Event()
+
+@tool
+def slow(query: str) -> str:
+    """Waits until the test releases it."""
+    release.wait(5)
+    return "late"
+
+@tool
+def fast(query: str) -> str:
+    """Answers at once."""
+    return f"ok {query}"
+
+def calls(*names):
+    tool_calls = [{"name": name, "args": {"query": "x"}, "id": f"{name}-{i}"} for i, name in enumerate(names)]
+    return {"messages": [AIMessage(content="", tool_calls=tool_calls)]}
+
+@pytest.fixture
+def node(monkeypatch):
+    monkeypatch.setattr(tool_executor, "TOOL_MAX_IN_FLIGHT", 2)
+    release.clear()
+    yield tool_executor.build_tool_executor([slow, fast], timeouts={"slow": 0.05})
+    release.set()
+
+def test_timed_out_call_does_not_hold_up_the_others(node):
+    slow_message, fast_message = node.invoke(calls("slow", "fast"))["messages"]
+    assert slow_message.status == "error" and "did not respond" in slow_message.content
+    assert fast_message.content == "ok x"
+
+def test_hung_tool_is_refused_once_its_slots_are_taken(node):
+    node.invoke(calls("slow"))
+    asyncio.run(node.ainvoke(calls("slow")))
+    assert tool_executor.in_flight()["slow"] == 2
+    slow_message, fast_message = node.invoke(calls("slow", "fast"))["messages"]
+    assert "not responding to earlier requests" in slow_message.content
+    assert fast_message.content == "ok x"
+
+    release.set()
+    for _ in range(100):
+        if tool_executor.in_flight()["slow"] == 0:
+            break
+        threading.Event().wait(0.01)
+    assert tool_executor.in_flight()["slow"] == 0
+
+def test_unknown_tool_is_reported(node):
+    message, = node.invoke(calls("missing"))["messages"]
+    assert message.content == "Error: unknown tool missing"
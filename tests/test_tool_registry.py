@@ -0,0 +1,75 @@
+import threading
+import time
+import pytest
+from utils import tool_registry
+
+class FakeClient:
+    def __init__(self, delay=0.0, fail=False):
+        self.queries = []
+        self.delay = delay
+        self.fail = fail
+
+    def run(self, query):
+        self.queries.append(query)
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("service down")
+        return f"results for {query}"
+
+@pytest.fixture
+def client(request):
+    name = f"test_{request.node.name}"
+    fake = FakeClient()
+    tool_registry.set_client(name, fake)
+    return name, fake
+
+def test_repeated_queries_reuse_the_result(client):
+    name, fake = client
+    assert tool_registry.cached_run(name, "Lisbon  hotels") == "results for Lisbon  hotels"
+    assert tool_registry.cached_run(name, "lisbon hotels") == "results for Lisbon  hotels"
+    assert len(fake.queries) == 1
+    stats = tool_registry.tool_stats()[name]
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+def test_expired_results_are_fetched_again(client, monkeypatch):
+    name, fake = client
+    monkeypatch.setitem(tool_registry.TOOL_TTLS, name, -1)
+    tool_registry.cached_run(name, "AAPL")
+    tool_registry.cached_run(name, "AAPL")
+    assert len(fake.queries) == 2
+
+def test_concurrent_identical_queries_share_one_fetch(client):
+    name, fake = client
+    fake.delay = 0.1
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(tool_registry.cached_run(name, "news"))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["results for news"] * 5
+    assert len(fake.queries) == 1
+    assert tool_registry.tool_stats()[name]["coalesced"] == 4
+
+def test_failures_are_not_cached(client):
+    name, fake = client
+    fake.fail = True
+    with pytest.raises(RuntimeError):
+        tool_registry.cached_run(name, "news")
+    fake.fail = False
+    assert tool_registry.cached_run(name, "news") == "results for news"
+    assert len(fake.queries) == 2
+
+def test_oldest_result_is_dropped_past_the_size_limit(client, monkeypatch):
+    name, fake = client
+    monkeypatch.setattr(tool_registry, "TOOL_CACHE_SIZE", 2)
+    for query in ("a", "b", "c", "a"):
+        tool_registry.cached_run(name, query)
+    assert fake.queries == ["a", "b", "c", "a"]
+
+def test_clients_are_built_once_on_first_use():
+    built = []
+    tool_registry.register_tool("test_factory", lambda: built.append(1) or FakeClient())
+    tool_registry.cached_run("test_factory", "x")
+    tool_registry.cached_run("test_factory", "y")
+    assert built == [1]
@@ -1,186 +1,365 @@
-import sqlite3
-from datetime import date, datetime
-# Database connection
-def get_conn():
-    return sqlite3.connect("utils/expense_tracker.db", check_same_thread=False)
-
-# Initialize database
-def init_db():
-    with get_conn() as conn:
-        cur = conn.cursor()
-
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                first_name TEXT NOT NULL,
-                last_name TEXT NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL
-            )
-        ''')
-
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS expenses (
-                expense_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                amount REAL NOT NULL,
-                category TEXT NOT NULL,
-                date TEXT NOT NULL,
-                description TEXT,
-                recurring BOOLEAN DEFAULT 0,
-                location TEXT,
-                payment_method TEXT NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users (user_id)
-            )
-        ''')
-
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS budget_settings (
-                setting_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                monthly_budget REAL DEFAULT 0,
-                savings_goal REAL DEFAULT 0,
-                actual_savings REAL DEFAULT 0,
-                FOREIGN KEY (user_id) REFERENCES users (user_id)
-            )
-        ''')
-        conn.commit()
-
-# User authentication functions
-def register_user(first, last, email, password):
-    try:
-        with get_conn() as conn:
-            cur = conn.cursor()
-            cur.execute("INSERT INTO users (first_name, last_name, email, password) VALUES (?, ?, ?, ?)",
-                        (first, last, email, password))
-            conn.commit()
-            return True
-    except sqlite3.IntegrityError:
-        return False
-
-def authenticate_user(email, password):
-    with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT user_id, first_name, last_name FROM users WHERE email = ? AND password = ?", (email, password))
-        user = cur.fetchone()
-        return user  # (user_id, first_name, last_name)
-
-# Budget and savings functions
-def get_budget_settings(user_id):
-    with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT monthly_budget, savings_goal, actual_savings FROM budget_settings WHERE user_id = ?", (user_id,))
-        result = cur.fetchone()
-
-        if result:
-            return result
-        else:
-            cur.execute("INSERT INTO budget_settings (user_id, monthly_budget, savings_goal, actual_savings) VALUES (?, 0, 0, 0)", (user_id,))
-            conn.commit()
-            return (0, 0, 0)
-
-def update_budget_settings(user_id, monthly_budget, savings_goal, actual_savings):
-    with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute("""
-            UPDATE budget_settings 
-            SET monthly_budget = ?, savings_goal = ?, actual_savings = ?
-            WHERE user_id = ?
-        """, (monthly_budget, savings_goal, actual_savings, user_id))
-
-        if cur.rowcount == 0:
-            cur.execute("""
-                INSERT INTO budget_settings (user_id, monthly_budget, savings_goal, actual_savings)
-                VALUES (?, ?, ?, ?)
-            """, (user_id, monthly_budget, savings_goal, actual_savings))
-        conn.commit()
-
-def get_total_expenses(user_id):
-    current_date = datetime.now()
-    current_month = current_date.strftime("%Y-%m")
-
-    with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT SUM(amount) FROM expenses 
-            WHERE user_id = ? AND date LIKE ?
-        """, (user_id, f"{current_month}%"))
-        result = cur.fetchone()
-        return result[0] if result[0] else 0
-    
-def add_expense(user_id, amount, category, date, description, recurring, location, payment_method):
-    with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO expenses (user_id, amount, category, date, description, recurring, location, payment_method)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (user_id, amount, category, date, description, recurring, location, payment_method))
-        conn.commit()
-
-def get_all_expenses(user_id, limit=50):
-    """Get all expenses for a user with limit"""
-    with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT expense_id, amount, category, date, description, recurring, location, payment_method
-            FROM expenses 
-            WHERE user_id = ?
-            ORDER BY date DESC, expense_id DESC
-            LIMIT ?
-        """, (user_id, limit))
-        return cur.fetchall()
-
-############################ Get Weekly Updates ############################
-def get_weekly_expenses(user_id):
-    """Get expenses from the last 7 days"""
-    from datetime import datetime, timedelta
-    
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=7)
-    
-    with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT expense_id, amount, category, date, description, location, payment_method
-            FROM expenses 
-            WHERE user_id = ? AND date >= ? AND date <= ?
-            ORDER BY date DESC
-        """, (user_id, start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")))
-        return cur.fetchall()
-
-def get_weekly_category_summary(user_id):
-    """Get category-wise expense summary for the last 7 days"""
-    from datetime import datetime, timedelta
-    
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=7)
-    
-    with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT category, SUM(amount) as total_amount, COUNT(*) as count
-            FROM expenses 
-            WHERE user_id = ? AND date >= ? AND date <= ?
-            GROUP BY category
-            ORDER BY total_amount DESC
-            LIMIT 5
-        """, (user_id, start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")))
-        return cur.fetchall()
-
-def get_top_weekly_expenses(user_id, limit=2):
-    """Get top expenses from the last 7 days by amount"""
-    from datetime import datetime, timedelta
-    
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=7)
-    
-    with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT amount, category, date, description, location
-            FROM expenses 
-            WHERE user_id = ? AND date >= ? AND date <= ?
-            ORDER BY amount DESC
-            LIMIT ?
-        """, (user_id, start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d"), limit))
+import os
+import sqlite3
+import threading
+from datetime import date, datetime
+from utils import spending_stats
+
+DB_PATH = os.getenv("EXPENSE_DB_PATH", "utils/expense_tracker.db")
+
+_local = threading.local()
+
+# Database connection: one per thread, reused across calls. `with conn:` commits
+# or rolls back but never closes, so the connection stays open for the next call.
+def get_conn():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=30)
+        # WAL lets readers keep going while another thread writes
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        _local.conn = conn
+    return conn
+
+# Initialize database
+def init_db():
+    with get_conn() as conn:
+        cur = conn.cursor()
+
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                first_name TEXT NOT NULL,
+                last_name TEXT NOT NULL,
+                email TEXT UNIQUE NOT NULL,
+                password TEXT NOT NULL
+            )
+        ''')
+
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS expenses (
+                expense_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                amount REAL NOT NULL,
+                category TEXT NOT NULL,
+                date TEXT NOT NULL,
+                description TEXT,
+                recurring BOOLEAN DEFAULT 0,
+                location TEXT,
+                payment_method TEXT NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users (user_id)
+            )
+        ''')
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_expenses_user_date ON expenses (user_id, date)")
+
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS budget_settings (
+                setting_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                monthly_budget REAL DEFAULT 0,
+                savings_goal REAL DEFAULT 0,
+                actual_savings REAL DEFAULT 0,
+                FOREIGN KEY (user_id) REFERENCES users (user_id)
+            )
+        ''')
+
+        # Every chat message, so the chat panel only needs to hold the latest ones in memory
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS chat_messages (
+                message_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                sender TEXT NOT NULL,
+                message TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users (user_id)
+            )
+        ''')
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_chat_messages_user ON chat_messages (user_id, message_id)")
+
+        # Bumped on every write to a user's expenses or budget, so caches of
+        # answers about that user's data know when they went stale
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS data_versions (
+                user_id INTEGER PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0,
+                FOREIGN KEY (user_id) REFERENCES users (user_id)
+            )
+        ''')
+
+        # Month-end projections from utils.forecast, valid for one data version and day
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS spend_forecasts (
+                user_id INTEGER PRIMARY KEY,
+                data_version INTEGER NOT NULL,
+                forecast_date TEXT NOT NULL,
+                month TEXT NOT NULL,
+                spent REAL NOT NULL,
+                projected REAL NOT NULL,
+                recurring_remaining REAL NOT NULL,
+                computed_at TEXT NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users (user_id)
+            )
+        ''')
+
+        # Running per-category statistics and the alerts they raise
+        spending_stats.create_tables(cur)
+        spending_stats.backfill(cur)
+        conn.commit()
+
+def bump_data_version(cur, user_id):
+    # Runs inside the caller's write transaction
+    cur.execute("""
+        INSERT INTO data_versions (user_id, version) VALUES (?, 1)
+        ON CONFLICT(user_id) DO UPDATE SET version = version + 1
+    """, (user_id,))
+
+def get_data_version(user_id):
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT version FROM data_versions WHERE user_id = ?", (user_id,))
+        row = cur.fetchone()
+        return row[0] if row else 0
+
+# User authentication functions
+def register_user(first, last, email, password):
+    try:
+        with get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute("INSERT INTO users (first_name, last_name, email, password) VALUES (?, ?, ?, ?)",
+                        (first, last, email, password))
+            conn.commit()
+            return True
+    except sqlite3.IntegrityError:
+        return False
+
+def authenticate_user(email, password):
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT user_id, first_name, last_name FROM users WHERE email = ? AND password = ?", (email, password))
+        user = cur.fetchone()
+        return user  # (user_id, first_name, last_name)
+
+# Budget and savings functions
+def get_budget_settings(user_id):
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT monthly_budget, savings_goal, actual_savings FROM budget_settings WHERE user_id = ?", (user_id,))
+        result = cur.fetchone()
+
+        if result:
+            return result
+        else:
+            cur.execute("INSERT INTO budget_settings (user_id, monthly_budget, savings_goal, actual_savings) VALUES (?, 0, 0, 0)", (user_id,))
+            conn.commit()
+            return (0, 0, 0)
+
+def update_budget_settings(user_id, monthly_budget, savings_goal, actual_savings):
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE budget_settings 
+            SET monthly_budget = ?, savings_goal = ?, actual_savings = ?
+            WHERE user_id = ?
+        """, (monthly_budget, savings_goal, actual_savings, user_id))
+
+        if cur.rowcount == 0:
+            cur.execute("""
+                INSERT INTO budget_settings (user_id, monthly_budget, savings_goal, actual_savings)
+                VALUES (?, ?, ?, ?)
+            """, (user_id, monthly_budget, savings_goal, actual_savings))
+        bump_data_version(cur, user_id)
+        conn.commit()
+
+def get_total_expenses(user_id):
+    current_date = datetime.now()
+    current_month = current_date.strftime("%Y-%m")
+
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT SUM(amount) FROM expenses 
+            WHERE user_id = ? AND date LIKE ?
+        """, (user_id, f"{current_month}%"))
+        result = cur.fetchone()
+        return result[0] if result[0] else 0
+    
+def add_expense(user_id, amount, category, date, description, recurring, location, payment_method):
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO expenses (user_id, amount, category, date, description, recurring, location, payment_method)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (user_id, amount, category, date, description, recurring, location, payment_method))
+        spending_stats.observe_expenses(cur, user_id, [{"amount": amount, "category": category, "date": date}])
+        bump_data_version(cur, user_id)
+        conn.commit()
+
+def add_expenses(user_id, expenses):
+    """Insert several expense records (dicts) in a single transaction"""
+    rows = [
+        (user_id, e["amount"], e["category"], e["date"], e.get("description"),
+         e.get("recurring", False), e.get("location"), e["payment_method"])
+        for e in expenses
+    ]
+    if not rows:
+        return 0
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.executemany("""
+            INSERT INTO expenses (user_id, amount, category, date, description, recurring, location, payment_method)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        spending_stats.observe_expenses(cur, user_id, expenses)
+        bump_data_version(cur, user_id)
+        conn.commit()
+    return len(rows)
+
+def get_all_expenses(user_id, limit=50):
+    """Get all expenses for a user with limit"""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT expense_id, amount, category, date, description, recurring, location, payment_method
+            FROM expenses 
+            WHERE user_id = ?
+            ORDER BY date DESC, expense_id DESC
+            LIMIT ?
+        """, (user_id, limit))
+        return cur.fetchall()
+
+def get_expenses_page(user_id, limit=20, after=None):
+    """One page of expenses, newest first. after is the (date, expense_id) of the
+    previous page's last row, so each page is an index range scan, not an OFFSET."""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        if after is None:
+            cur.execute("""
+                SELECT expense_id, amount, category, date, description, recurring, location, payment_method
+                FROM expenses
+                WHERE user_id = ?
+                ORDER BY date DESC, expense_id DESC
+                LIMIT ?
+            """, (user_id, limit))
+        else:
+            after_date, after_id = after
+            cur.execute("""
+                SELECT expense_id, amount, category, date, description, recurring, location, payment_method
+                FROM expenses
+                WHERE user_id = ? AND (date < ? OR (date = ? AND expense_id < ?))
+                ORDER BY date DESC, expense_id DESC
+                LIMIT ?
+            """, (user_id, after_date, after_date, after_id, limit))
+        return cur.fetchall()
+
+def get_dashboard_snapshot(user_id):
+    """Everything the dashboard shows for a user, in one call"""
+    monthly_budget, savings_goal, actual_savings = get_budget_settings(user_id)
+    return {
+        "monthly_budget": monthly_budget,
+        "savings_goal": savings_goal,
+        "actual_savings": actual_savings,
+        "total_expenses": get_total_expenses(user_id),
+        "all_expenses": get_all_expenses(user_id),
+        "weekly_expenses": get_weekly_expenses(user_id),
+        "weekly_categories": get_weekly_category_summary(user_id),
+        "top_weekly_expenses": get_top_weekly_expenses(user_id),
+    }
+
+############################ Spending Alerts ############################
+def get_spending_alerts(user_id, limit=5):
+    """The user's newest alerts they have not dismissed yet"""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT alert_id, kind, category, amount, message, created_at
+            FROM spending_alerts
+            WHERE user_id = ? AND seen = 0
+            ORDER BY alert_id DESC
+            LIMIT ?
+        """, (user_id, limit))
+        return cur.fetchall()
+
+def dismiss_spending_alerts(user_id):
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("UPDATE spending_alerts SET seen = 1 WHERE user_id = ? AND seen = 0", (user_id,))
+        conn.commit()
+
+############################ Chat History ############################
+def add_chat_message(user_id, sender, message):
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO chat_messages (user_id, sender, message, created_at)
+            VALUES (?, ?, ?, ?)
+        """, (user_id, sender, message, datetime.now().isoformat(timespec="seconds")))
+        conn.commit()
+        return cur.lastrowid
+
+def get_chat_messages(user_id, limit=20, before_id=None):
+    """The user's latest chat messages (older than before_id when given), oldest first"""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT message_id, sender, message
+            FROM chat_messages
+            WHERE user_id = ? AND (? IS NULL OR message_id < ?)
+            ORDER BY message_id DESC
+            LIMIT ?
+        """, (user_id, before_id, before_id, limit))
+        rows = cur.fetchall()
+    return [{"id": message_id, "sender": sender, "message": message} for message_id, sender, message in reversed(rows)]
+
+############################ Get Weekly Updates ############################
+def get_weekly_expenses(user_id):
+    """Get expenses from the last 7 days"""
+    from datetime import datetime, timedelta
+    
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=7)
+    
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT expense_id, amount, category, date, description, location, payment_method
+            FROM expenses 
+            WHERE user_id = ? AND date >= ? AND date <= ?
+            ORDER BY date DESC
+        """, (user_id, start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")))
+        return cur.fetchall()
+
+def get_weekly_category_summary(user_id):
+    """Get category-wise expense summary for the last 7 days"""
+    from datetime import datetime, timedelta
+    
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=7)
+    
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT category, SUM(amount) as total_amount, COUNT(*) as count
+            FROM expenses 
+            WHERE user_id = ? AND date >= ? AND date <= ?
+            GROUP BY category
+            ORDER BY total_amount DESC
+            LIMIT 5
+        """, (user_id, start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")))
+        return cur.fetchall()
+
+def get_top_weekly_expenses(user_id, limit=2):
+    """Get top expenses from the last 7 days by amount"""
+    from datetime import datetime, timedelta
+    
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=7)
+    
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT amount, category, date, description, location
+            FROM expenses 
+            WHERE user_id = ? AND date >= ? AND date <= ?
+            ORDER BY amount DESC
+            LIMIT ?
+        """, (user_id, start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d"), limit))
         return cur.fetchall()
\ No newline at end of file
@@ -0,0 +1,173 @@
+import re
+from datetime import date, datetime, timedelta
+
+# Vocabularies shared by the dashboard form and the chat insertion path
+EXPENSE_CATEGORIES = ["Food", "Transport", "Bills", "Shopping", "Entertainment", "Healthcare", "Other"]
+PAYMENT_METHODS = ["Cash", "Credit Card", "Debit Card", "Online Transfer", "Mobile Payment", "Other"]
+
+# Words that map free text onto a category
+CATEGORY_KEYWORDS = {
+    "Food": ["food", "groceries", "grocery", "lunch", "dinner", "breakfast", "brunch", "coffee", "cafe",
+             "restaurant", "snack", "pizza", "burger", "meal", "takeout", "starbucks", "drinks"],
+    "Transport": ["transport", "uber", "lyft", "taxi", "cab", "bus", "train", "metro", "subway", "fuel",
+                  "gas", "petrol", "parking", "toll", "flight", "airfare", "ride"],
+    "Bills": ["bill", "bills", "rent", "electricity", "water", "internet", "phone", "utility", "utilities",
+              "insurance", "subscription", "mortgage"],
+    "Shopping": ["shopping", "clothes", "shoes", "amazon", "electronics", "gift", "mall", "clothing"],
+    "Entertainment": ["entertainment", "movie", "movies", "cinema", "netflix", "concert", "game", "games",
+                      "spotify", "tickets", "bar"],
+    "Healthcare": ["healthcare", "health", "doctor", "pharmacy", "medicine", "hospital", "dentist", "gym",
+                   "medical", "clinic"],
+}
+
+# Phrases that map free text onto a payment method (longest phrases are checked first)
+PAYMENT_KEYWORDS = {
+    "Credit Card": ["credit card", "credit", "visa", "mastercard", "amex"],
+    "Debit Card": ["debit card", "debit"],
+    "Online Transfer": ["online transfer", "bank transfer", "wire transfer", "transfer", "netbanking"],
+    "Mobile Payment": ["mobile payment", "apple pay", "google pay", "gpay", "paypal", "venmo", "upi", "mobile"],
+    "Cash": ["cash"],
+}
+
+AMOUNT_PATTERN = re.compile(r"[-+]?\$?\s*(\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?)")
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+DATE_FORMATS = ["%Y-%m-%d", "%Y/%m/%d", "%m/%d/%Y", "%d-%m-%Y", "%B %d, %Y", "%b %d, %Y", "%B %d %Y", "%b %d %Y", "%d %B %Y"]
+
+def parse_amount(value):
+    """Return a positive float from a number or text such as '$1,234.50', else None"""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return abs(float(value)) or None
+    match = AMOUNT_PATTERN.search(str(value))
+    if not match:
+        return None
+    return abs(float(match.group(1).replace(",", ""))) or None
+
+def _keyword_match(text, keyword_map):
+    text = f" {text.lower()} "
+    candidates = [(kw, name) for name, keywords in keyword_map.items() for kw in keywords]
+    for keyword, name in sorted(candidates, key=lambda item: -len(item[0])):
+        if re.search(rf"(?<![a-z]){re.escape(keyword)}(?![a-z])", text):
+            return name
+    return None
+
+def normalize_category(value):
+    if not value:
+        return None
+    value = str(value).strip()
+    for category in EXPENSE_CATEGORIES:
+        if value.lower() == category.lower():
+            return category
+    return _keyword_match(value, CATEGORY_KEYWORDS)
+
+def normalize_payment_method(value):
+    if not value:
+        return None
+    value = str(value).strip()
+    for method in PAYMENT_METHODS:
+        if value.lower() == method.lower():
+            return method
+    return _keyword_match(value, PAYMENT_KEYWORDS)
+
+def resolve_relative_date(text, today=None):
+    """Resolve 'today', 'yesterday', 'N days ago', '(last) friday' inside text; None if absent"""
+    today = today or date.today()
+    text = text.lower()
+    if "day before yesterday" in text:
+        return today - timedelta(days=2)
+    if "yesterday" in text:
+        return today - timedelta(days=1)
+    if "today" in text or "tonight" in text or "this morning" in text:
+        return today
+    match = re.search(r"(\d+)\s+days?\s+ago", text)
+    if match:
+        return today - timedelta(days=int(match.group(1)))
+    if "last week" in text:
+        return today - timedelta(days=7)
+    for index, weekday in enumerate(WEEKDAYS):
+        if re.search(rf"\b(last|on|this past)?\s*{weekday}\b", text):
+            days_back = (today.weekday() - index) % 7
+            # "last friday" never means today
+            if days_back == 0 and re.search(rf"\blast\s+{weekday}\b", text):
+                days_back = 7
+            return today - timedelta(days=days_back)
+    return None
+
+def normalize_date(value, today=None):
+    """Return an ISO date string, or None if the value cannot be understood"""
+    today = today or date.today()
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if not value:
+        return None
+    value = str(value).strip()
+    if value.lower() in ("current_date", "now"):
+        return today.isoformat()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date().isoformat()
+        except ValueError:
+            continue
+    relative = resolve_relative_date(value, today)
+    return relative.isoformat() if relative else None
+
+def normalize_bool(value):
+    if isinstance(value, bool):
+        return value
+    if value is None:
+        return False
+    return str(value).strip().lower() in ("1", "true", "yes", "y", "recurring", "monthly", "weekly")
+
+def repair_expense(raw, today=None):
+    """Coerce one extracted expense field by field.
+
+    Returns (record, notes): record is None only when no usable amount exists;
+    notes describe every field that had to be defaulted.
+    """
+    today = today or date.today()
+    notes = []
+
+    amount = parse_amount(raw.get("amount"))
+    if amount is None:
+        return None, [f"no valid amount in {raw.get('description') or raw.get('amount')!r}"]
+
+    category = normalize_category(raw.get("category")) or normalize_category(raw.get("description"))
+    if category is None:
+        category = "Other"
+        if raw.get("category"):
+            notes.append(f"unknown category {raw.get('category')!r} saved as Other")
+
+    expense_date = normalize_date(raw.get("date"), today)
+    if expense_date is None:
+        expense_date = today.isoformat()
+        if raw.get("date"):
+            notes.append(f"unreadable date {raw.get('date')!r} saved as today")
+
+    payment_method = normalize_payment_method(raw.get("payment_method"))
+    if payment_method is None:
+        payment_method = "Other"
+        if raw.get("payment_method"):
+            notes.append(f"unknown payment method {raw.get('payment_method')!r} saved as Other")
+
+    description = (str(raw.get("description")).strip() or None) if raw.get("description") else None
+    location = (str(raw.get("location")).strip() or None) if raw.get("location") else None
+
+    record = {
+        "amount": round(amount, 2),
+        "category": category,
+        "date": expense_date,
+        "description": description,
+        "recurring": normalize_bool(raw.get("recurring")),
+        "location": location,
+        "payment_method": payment_method,
+    }
+    return record, notes
+
+def describe_expense(record):
+    text = f"${record['amount']:.2f} {record['category']}"
+    if record.get("description"):
+        text += f" ({record['description']})"
+    return f"{text} on {record['date']} via {record['payment_method']}"
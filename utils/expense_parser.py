@@ -0,0 +1,143 @@
+import os
+import re
+from datetime import date
+from utils.expense_fields import (
+    CATEGORY_KEYWORDS, parse_amount, normalize_category, normalize_payment_method, normalize_bool,
+    resolve_relative_date, normalize_date,
+)
+
+# Parses at or above this confidence are saved without asking the LLM
+LOCAL_PARSE_THRESHOLD = float(os.getenv("LOCAL_PARSE_THRESHOLD", "0.75"))
+
+# "spent" and "paid" also appear in questions ("total spent on food"), so only
+# these verbs count as asking to save something
+INSERTION_VERBS = re.compile(r"\b(log|record|insert|bought)\b", re.IGNORECASE)
+# "add a dinner cruise", "save 200 on groceries": these only mean an expense next to a currency marker
+MARKED_INSERTION_VERBS = re.compile(r"\b(add|save)\b", re.IGNORECASE)
+# Plans and goals mention money without anything having been spent
+NOT_SPENT = re.compile(
+    r"\b(want to|wants to|going to|plan to|planning to|hope to|would like|should i|budget|goal|save up|saving|afford)\b",
+    re.IGNORECASE,
+)
+QUESTION_WORDS = re.compile(
+    r"\b(how much|how many|what|show|list|did i|which|when|why|top|total|give me|expenses)\b|\?",
+    re.IGNORECASE,
+)
+
+CURRENCY = re.compile(r"\$|\b(?:usd|dollars?|bucks)\b", re.IGNORECASE)
+# Money on its own: "$45.99", "45.99 dollars", "12 usd", "20.50"
+AMOUNT_IN_TEXT = re.compile(
+    r"(?:\$|usd\s*)\s*\d[\d,]*(?:\.\d+)?|\b\d[\d,]*(?:\.\d+)?\s*(?:dollars?|bucks|usd)\b|\b\d[\d,]*\.\d{2}\b",
+    re.IGNORECASE,
+)
+# A bare number only counts right after a spend verb or a spend noun: "spent 12", "uber 18"
+SPEND_WORDS = sorted({kw for keywords in CATEGORY_KEYWORDS.values() for kw in keywords}, key=len, reverse=True)
+SPEND_AMOUNT = re.compile(
+    r"\b(?:spent|paid|cost|costs|charged|" + "|".join(re.escape(word) for word in SPEND_WORDS) + r")"
+    r"\s+(?:about\s+|around\s+)?(\d[\d,]*(?:\.\d+)?)\b"
+    r"(?!\s*(?:hours?|hrs?|minutes?|mins?|days?|nights?|weeks?|people|persons?|tickets?|items?|times?|%))",
+    re.IGNORECASE,
+)
+# Numbers that belong to a date rather than an amount
+DATE_IN_TEXT = re.compile(
+    r"\b\d{4}-\d{2}-\d{2}\b|\b\d{1,2}/\d{1,2}(?:/\d{2,4})?\b|\b\d+\s+days?\s+ago\b|"
+    r"\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?\s+\d{1,2}(?:st|nd|rd|th)?(?:,?\s+\d{4})?\b",
+    re.IGNORECASE,
+)
+# Numbers that are never an amount on their own: bare years and "top 5" style counts
+NOT_AMOUNT = re.compile(
+    r"(?<![$\d.,])\b(?:19|20)\d{2}\b(?!\s*(?:dollars?|bucks|usd)\b|\.\d)|"
+    r"\b(?:top|first|last|bottom)\s+\d+\b",
+    re.IGNORECASE,
+)
+PAYMENT_PHRASE = re.compile(r"\b(?:paid|pay|paying)?\s*(?:by|with|using|via)\s+([a-z ]+?)(?=[,.;]|$|\s+(?:at|on|for|today|yesterday)\b)", re.IGNORECASE)
+LOCATION_PHRASE = re.compile(r"\bat\s+([A-Za-z0-9'&\- ]+?)(?=[,.;]|$|\s+(?:paid|by|with|using|via|on|for|today|yesterday|last)\b)", re.IGNORECASE)
+DESCRIPTION_PHRASE = re.compile(r"\b(?:with description|description|note|for)\s+([^,.;]+?)(?=[,.;]|$|\s+(?:paid|by|with|using|via|at|on|today|yesterday|last)\b)", re.IGNORECASE)
+RECURRING_PHRASE = re.compile(r"\b(recurring|every month|monthly|every week|weekly|subscription)\b", re.IGNORECASE)
+
+def money_amounts(text):
+    """Amounts in text that are shaped like money; dates, years, counts and durations are skipped"""
+    without_dates = NOT_AMOUNT.sub(" ", DATE_IN_TEXT.sub(" ", text))
+    found = {match.start(): match.group(0) for match in AMOUNT_IN_TEXT.finditer(without_dates)}
+    taken = [(start, start + len(value)) for start, value in found.items()]
+    for match in SPEND_AMOUNT.finditer(without_dates):
+        if not any(start <= match.start(1) < end for start, end in taken):
+            found[match.start(1)] = match.group(1)
+    amounts = [parse_amount(found[start]) for start in sorted(found)]
+    return [amount for amount in amounts if amount]
+
+def _explicit_date(text, today):
+    match = DATE_IN_TEXT.search(text)
+    if not match or "ago" in match.group(0).lower():
+        return None
+    value = re.sub(r"(\d)(st|nd|rd|th)\b", r"\1", match.group(0).replace(",", ""))
+    parsed = normalize_date(value, today)
+    if parsed is None and not re.search(r"\d{4}", value):
+        # "Oct 3" / "10/3" without a year means this year
+        parsed = normalize_date(f"{value} {today.year}" if "/" not in value else f"{value}/{today.year}", today)
+    return parsed
+
+def parse_expense_text(text, today=None):
+    """Parse a single-expense logging message without the LLM.
+
+    Returns (record, confidence). record is None when the text does not look like
+    one expense; confidence is in [0, 1] and should be compared with
+    LOCAL_PARSE_THRESHOLD before trusting the record.
+    """
+    today = today or date.today()
+    text = text.strip()
+    if not text or QUESTION_WORDS.search(text) or NOT_SPENT.search(text):
+        return None, 0.0
+
+    amounts = money_amounts(text)
+    if len(amounts) != 1:
+        # No amount, or several expenses in one message: leave it to the LLM
+        return None, 0.0
+
+    confidence = 0.4
+    if INSERTION_VERBS.search(text) or (MARKED_INSERTION_VERBS.search(text) and CURRENCY.search(text)):
+        confidence += 0.2
+
+    description_match = DESCRIPTION_PHRASE.search(text)
+    description = description_match.group(1).strip() if description_match else None
+
+    category = normalize_category(text)
+    if category:
+        confidence += 0.3
+    else:
+        category = "Other"
+
+    payment_match = PAYMENT_PHRASE.search(text)
+    payment_method = normalize_payment_method(payment_match.group(1) if payment_match else text)
+    if payment_method:
+        confidence += 0.05
+    else:
+        payment_method = "Other"
+
+    expense_date = _explicit_date(text, today)
+    if expense_date is None:
+        relative = resolve_relative_date(text, today)
+        expense_date = relative.isoformat() if relative else None
+    if expense_date:
+        confidence += 0.05
+    else:
+        expense_date = today.isoformat()
+
+    location_match = LOCATION_PHRASE.search(text)
+    location = location_match.group(1).strip() if location_match else None
+
+    record = {
+        "amount": round(amounts[0], 2),
+        "category": category,
+        "date": expense_date,
+        "description": description,
+        "recurring": normalize_bool(bool(RECURRING_PHRASE.search(text))),
+        "location": location,
+        "payment_method": payment_method,
+    }
+    return record, round(min(confidence, 1.0), 2)
+
+def parse_confident_expense(text, today=None):
+    """The locally parsed record, or None when the LLM should handle the message"""
+    record, confidence = parse_expense_text(text, today)
+    return record if record is not None and confidence >= LOCAL_PARSE_THRESHOLD else None
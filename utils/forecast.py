@@ -0,0 +1,184 @@
+"""Month-end spend forecasts for every user, computed in NumPy batches.
+
+    python -m utils.forecast            # nightly: refresh every user whose forecast is stale
+
+A user's forecast is this month's spend so far, plus the variable spend
+expected for the rest of the month from a weekday profile of their last
+FORECAST_LOOKBACK_DAYS (scaled to their recent level), plus last month's
+recurring charges that have not shown up again yet. Forecasts are cached
+per user with the data version and date they were made for, so only users
+whose expenses changed (or whose forecast is from an earlier day) are
+recomputed.
+"""
+import os
+import sys
+import time
+import calendar
+import argparse
+from datetime import date, datetime, timedelta
+import numpy as np
+from utils.db_utils import get_conn
+from utils.expense_fields import normalize_bool
+
+# Days of history the weekday profile is fitted on (13 full weeks)
+FORECAST_LOOKBACK_DAYS = int(os.getenv("FORECAST_LOOKBACK_DAYS", "91"))
+# Days that set the user's recent spending level against the whole window
+FORECAST_RECENT_DAYS = int(os.getenv("FORECAST_RECENT_DAYS", "28"))
+# Users forecast per query and per matrix
+FORECAST_BATCH_SIZE = int(os.getenv("FORECAST_BATCH_SIZE", "500"))
+# The recent level may move the profile down to half or up to double
+LEVEL_CLIP = (0.5, 2.0)
+
+def stale_users(today, user_ids=None):
+    """(user_id, data_version) of users without a forecast for this data version and day"""
+    only = ""
+    parameters = [today.isoformat()]
+    if user_ids is not None:
+        only = f"AND u.user_id IN ({','.join('?' * len(user_ids))})"
+        parameters += list(user_ids)
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT u.user_id, COALESCE(v.version, 0)
+            FROM users u
+            LEFT JOIN data_versions v ON v.user_id = u.user_id
+            LEFT JOIN spend_forecasts f ON f.user_id = u.user_id
+            WHERE (f.user_id IS NULL OR f.data_version != COALESCE(v.version, 0) OR f.forecast_date != ?) {only}
+        """, parameters)
+        return cur.fetchall()
+
+def _month_bounds(today):
+    month_start = today.replace(day=1)
+    month_end = today.replace(day=calendar.monthrange(today.year, today.month)[1])
+    prev_start = (month_start - timedelta(days=1)).replace(day=1)
+    return month_start, month_end, prev_start
+
+def load_batch(user_ids, today):
+    """Daily variable spend (users x days) and recurring totals for last month and this month"""
+    month_start, _, prev_start = _month_bounds(today)
+    window_start = min(today - timedelta(days=FORECAST_LOOKBACK_DAYS), prev_start)
+    days = (today - window_start).days + 1
+    index = {user_id: i for i, user_id in enumerate(user_ids)}
+
+    with get_conn() as conn:
+        cur = conn.cursor()
+        placeholders = ",".join("?" * len(user_ids))
+        cur.execute(f"""
+            SELECT user_id, date, amount, recurring
+            FROM expenses
+            WHERE user_id IN ({placeholders}) AND date >= ? AND date <= ?
+        """, (*user_ids, window_start.isoformat(), today.isoformat()))
+        rows = cur.fetchall()
+
+    variable = np.zeros((len(user_ids), days))
+    recurring_prev = np.zeros(len(user_ids))
+    recurring_cur = np.zeros(len(user_ids))
+    spent = np.zeros(len(user_ids))
+    first_day = np.full(len(user_ids), days)
+    users, offsets, amounts = [], [], []
+    for user_id, expense_date, amount, recurring in rows:
+        try:
+            day = datetime.strptime(str(expense_date)[:10], "%Y-%m-%d").date()
+        except ValueError:
+            continue
+        u = index[user_id]
+        offset = (day - window_start).days
+        first_day[u] = min(first_day[u], offset)
+        if day >= month_start:
+            spent[u] += amount
+        if normalize_bool(recurring):
+            if day >= month_start:
+                recurring_cur[u] += amount
+            elif day >= prev_start:
+                recurring_prev[u] += amount
+        else:
+            users.append(u)
+            offsets.append(offset)
+            amounts.append(amount)
+    np.add.at(variable, (np.array(users, dtype=int), np.array(offsets, dtype=int)), np.array(amounts, dtype=float))
+    return window_start, variable, first_day, spent, recurring_prev, recurring_cur
+
+def weekday_onehot(start, days):
+    weekdays = (start.weekday() + np.arange(days)) % 7
+    return np.eye(7)[weekdays]
+
+def forecast_batch(window_start, variable, first_day, spent, recurring_prev, recurring_cur, today):
+    """Projected month-end totals for a batch of users, all at once"""
+    _, month_end, _ = _month_bounds(today)
+    days = variable.shape[1]
+    # Fit on complete days only: today is still in progress
+    fit = variable[:, :days - 1]
+    onehot = weekday_onehot(window_start, days - 1)
+    active = np.arange(days - 1)[None, :] >= first_day[:, None]
+
+    # Mean spend per weekday over the days each user has been active
+    weekday_days = active @ onehot
+    profile = (fit @ onehot) / np.maximum(weekday_days, 1)
+
+    # Scale the profile by how the last few weeks compare with the whole window
+    active_days = active.sum(axis=1)
+    recent = active[:, -FORECAST_RECENT_DAYS:]
+    recent_mean = (fit[:, -FORECAST_RECENT_DAYS:] * recent).sum(axis=1) / np.maximum(recent.sum(axis=1), 1)
+    overall_mean = fit.sum(axis=1) / np.maximum(active_days, 1)
+    level = np.where(overall_mean > 0, recent_mean / np.where(overall_mean > 0, overall_mean, 1), 1.0)
+    level = np.clip(level, *LEVEL_CLIP)
+
+    remaining = (month_end - today).days
+    remaining_weekdays = weekday_onehot(today + timedelta(days=1), remaining).sum(axis=0) if remaining else np.zeros(7)
+    variable_remaining = (profile * remaining_weekdays).sum(axis=1) * level
+    # Last month's recurring charges still to come this month
+    recurring_remaining = np.maximum(recurring_prev - recurring_cur, 0)
+    return spent + variable_remaining + recurring_remaining, spent, recurring_remaining
+
+def refresh_forecasts(user_ids=None, today=None):
+    """Recompute stale forecasts (optionally only for user_ids); returns how many were refreshed"""
+    today = today or date.today()
+    stale = stale_users(today, user_ids)
+    computed_at = datetime.now().isoformat(timespec="seconds")
+    for start in range(0, len(stale), FORECAST_BATCH_SIZE):
+        batch = stale[start:start + FORECAST_BATCH_SIZE]
+        ids = [user_id for user_id, _ in batch]
+        projected, spent, recurring = forecast_batch(*load_batch(ids, today), today)
+        rows = [
+            (user_id, version, today.isoformat(), today.strftime("%Y-%m"),
+             round(float(spent[i]), 2), round(float(projected[i]), 2), round(float(recurring[i]), 2), computed_at)
+            for i, (user_id, version) in enumerate(batch)
+        ]
+        with get_conn() as conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO spend_forecasts
+                    (user_id, data_version, forecast_date, month, spent, projected, recurring_remaining, computed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            conn.commit()
+    return len(stale)
+
+def get_month_end_forecast(user_id, today=None):
+    """The user's projected month-end spend, refreshed first if their data changed"""
+    today = today or date.today()
+    refresh_forecasts([user_id], today)
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT spent, projected, recurring_remaining, computed_at
+            FROM spend_forecasts WHERE user_id = ?
+        """, (user_id,))
+        row = cur.fetchone()
+    if row is None:
+        return None
+    spent, projected, recurring_remaining, computed_at = row
+    return {"spent": spent, "projected": projected, "recurring_remaining": recurring_remaining, "computed_at": computed_at}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--date", type=date.fromisoformat, default=None, help="forecast as of this day (default today)")
+    args = parser.parse_args(argv)
+
+    from utils.db_utils import init_db
+    init_db()
+    start = time.perf_counter()
+    refreshed = refresh_forecasts(today=args.date)
+    print(f"Refreshed {refreshed} forecasts in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import os
+import time
+import uuid
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Agent turns run on these threads so the UI thread never waits on a round trip
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Finished jobs nobody collected are dropped after this many seconds
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "3600"))
+
+_pool = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="agent-job")
+_lock = threading.Lock()
+_jobs = {}
+_by_session_key = {}
+# Jobs waiting for an earlier job with the same serial key to finish
+_serial_queues = {}
+_counters = {"submitted": 0, "deduplicated": 0, "completed": 0, "failed": 0, "busy_seconds": 0.0}
+_started_at = time.time()
+
+def _run(job_id, fn, args, kwargs):
+    with _lock:
+        job = _jobs[job_id]
+        job["status"] = "running"
+        job["started_at"] = time.time()
+    try:
+        result, error, status = fn(*args, **kwargs), None, "done"
+    except Exception as exc:
+        result, error, status = None, str(exc), "failed"
+    with _lock:
+        job.update(status=status, result=result, error=error, finished_at=time.time(), fn=None, args=(), kwargs={})
+        _counters["completed" if status == "done" else "failed"] += 1
+        _counters["busy_seconds"] += job["finished_at"] - job["started_at"]
+        next_job = _next_serial(job["serial_key"])
+    if next_job:
+        _start(next_job)
+
+def _next_serial(serial_key):
+    # Called with _lock held: the queued job to start now that serial_key is free
+    if serial_key is None:
+        return None
+    queue = _serial_queues[serial_key]
+    if queue:
+        return queue.popleft()
+    del _serial_queues[serial_key]
+    return None
+
+def _start(job):
+    _pool.submit(_run, job["id"], job["fn"], job["args"], job["kwargs"])
+
+def _prune(now):
+    for job_id, job in list(_jobs.items()):
+        if job["finished_at"] and now - job["finished_at"] > JOB_RESULT_TTL:
+            _forget(job_id)
+
+def _forget(job_id):
+    job = _jobs.pop(job_id, None)
+    if job and _by_session_key.get((job["session_id"], job["key"])) == job_id:
+        del _by_session_key[(job["session_id"], job["key"])]
+
+def find_job(session_id, key):
+    """The id of this session's uncollected job for key, if there is one"""
+    with _lock:
+        return _by_session_key.get((session_id, key))
+
+def submit_job(session_id, key, fn, *args, serial_key=None, **kwargs):
+    """Queue fn(*args, **kwargs) and return its job id without waiting.
+
+    A session submitting the same key again before collecting the first
+    result gets the existing job back instead of a second run. Jobs with the
+    same serial_key (from any session) run one at a time, in submission order.
+    """
+    with _lock:
+        now = time.time()
+        _prune(now)
+        existing = _by_session_key.get((session_id, key))
+        if existing is not None:
+            _counters["deduplicated"] += 1
+            return existing
+        job_id = uuid.uuid4().hex
+        job = _jobs[job_id] = {
+            "id": job_id, "session_id": session_id, "key": key, "status": "queued",
+            "result": None, "error": None, "serial_key": serial_key,
+            "fn": fn, "args": args, "kwargs": kwargs,
+            "submitted_at": now, "started_at": None, "finished_at": None,
+        }
+        _by_session_key[(session_id, key)] = job_id
+        _counters["submitted"] += 1
+        if serial_key is not None:
+            if serial_key in _serial_queues:
+                _serial_queues[serial_key].append(job)
+                return job_id
+            _serial_queues[serial_key] = deque()
+    _start(job)
+    return job_id
+
+def get_job(job_id):
+    with _lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job else None
+
+def collect_job(job_id):
+    """Return a finished job once and forget it; None while it is still queued or running"""
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            # Pruned, or submitted to a runner that has since restarted
+            return {"id": job_id, "status": "lost", "result": None, "error": "the request was lost, please send it again"}
+        if job["status"] in ("queued", "running"):
+            return None
+        _forget(job_id)
+        return dict(job)
+
+def runner_stats():
+    """Queue depth, busy workers and utilization since process start"""
+    with _lock:
+        queued = sum(1 for job in _jobs.values() if job["status"] == "queued")
+        running = [job for job in _jobs.values() if job["status"] == "running"]
+        now = time.time()
+        busy = _counters["busy_seconds"] + sum(now - job["started_at"] for job in running)
+        uptime = max(now - _started_at, 1e-9)
+        return dict(
+            _counters,
+            queue_depth=queued,
+            running=len(running),
+            workers=JOB_WORKERS,
+            utilization=min(busy / (uptime * JOB_WORKERS), 1.0),
+        )
@@ -0,0 +1,197 @@
+import os
+import re
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import numpy as np
+
+# Persistent response cache for agent and router LLM answers
+CACHE_DB_PATH = os.getenv("LLM_CACHE_DB", "utils/llm_cache.db")
+
+# Seconds a cached answer stays valid, per agent: market data goes stale fast, itineraries do not
+AGENT_TTLS = {
+    "router": 7 * 24 * 3600,
+    "finance": 5 * 60,
+    "trip": 7 * 24 * 3600,
+}
+DEFAULT_TTL = 3600
+
+# Cosine similarity above which a different prompt is treated as the same question
+SEMANTIC_THRESHOLD = float(os.getenv("LLM_CACHE_SIMILARITY", "0.95"))
+SEMANTIC_SCAN_LIMIT = 500
+
+_stats = {}
+_stats_lock = threading.Lock()
+_embedder = None
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+# One connection per thread, reused across calls like db_utils.get_conn. A new one is
+# opened only when CACHE_DB_PATH changes (the benchmarks point it at a scratch file).
+def get_cache_conn():
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.path != CACHE_DB_PATH:
+        if conn is not None:
+            conn.close()
+        conn = sqlite3.connect(CACHE_DB_PATH, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        _local.conn, _local.path = conn, CACHE_DB_PATH
+    with _schema_lock:
+        if CACHE_DB_PATH not in _schema_ready:
+            create_tables(conn)
+            _schema_ready.add(CACHE_DB_PATH)
+    return conn
+
+def create_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            cache_key TEXT PRIMARY KEY,
+            agent TEXT NOT NULL,
+            model TEXT NOT NULL,
+            tool_context TEXT NOT NULL,
+            prompt TEXT NOT NULL,
+            response TEXT NOT NULL,
+            embedding TEXT,
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_scope ON llm_cache (agent, model, tool_context, expires_at)")
+    # SQL agent answers about a user's own data: valid until that user's data version changes
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sql_answer_cache (
+            user_id INTEGER NOT NULL,
+            question TEXT NOT NULL,
+            data_version INTEGER NOT NULL,
+            answer TEXT NOT NULL,
+            sql TEXT,
+            result TEXT,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (user_id, question)
+        )
+    ''')
+    conn.commit()
+
+def set_embedder(embed_fn):
+    """Enable semantic lookup with a function mapping text to a vector (None disables it)"""
+    global _embedder
+    _embedder = embed_fn
+
+def get_embedder():
+    global _embedder
+    if _embedder is None and os.getenv("LLM_CACHE_SEMANTIC") == "1":
+        from langchain_openai import OpenAIEmbeddings
+        _embedder = OpenAIEmbeddings(model="text-embedding-3-small").embed_query
+    return _embedder
+
+def normalize_prompt(prompt):
+    prompt = re.sub(r"\s+", " ", prompt.strip().lower())
+    return prompt.rstrip("?.! ")
+
+def make_key(agent, prompt, model, tool_context=""):
+    raw = "\x1f".join([agent, model, tool_context, normalize_prompt(prompt)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _count(agent, outcome):
+    with _stats_lock:
+        agent_stats = _stats.setdefault(agent, {"hits": 0, "semantic_hits": 0, "misses": 0})
+        agent_stats[outcome] += 1
+
+def _cosine(a, b):
+    denom = np.linalg.norm(a) * np.linalg.norm(b)
+    return float(np.dot(a, b) / denom) if denom else 0.0
+
+def get_cached(agent, prompt, model, tool_context=""):
+    """Return a cached response for the prompt, or None on a miss"""
+    now = time.time()
+    with get_cache_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT response FROM llm_cache WHERE cache_key = ? AND expires_at > ?",
+                    (make_key(agent, prompt, model, tool_context), now))
+        row = cur.fetchone()
+        if row:
+            _count(agent, "hits")
+            return row[0]
+
+        embed = get_embedder()
+        if embed is not None:
+            query_vec = np.asarray(embed(normalize_prompt(prompt)), dtype=float)
+            cur.execute("""
+                SELECT response, embedding FROM llm_cache
+                WHERE agent = ? AND model = ? AND tool_context = ? AND expires_at > ? AND embedding IS NOT NULL
+                ORDER BY created_at DESC
+                LIMIT ?
+            """, (agent, model, tool_context, now, SEMANTIC_SCAN_LIMIT))
+            best_response, best_score = None, SEMANTIC_THRESHOLD
+            for response, embedding in cur.fetchall():
+                score = _cosine(query_vec, np.asarray(json.loads(embedding), dtype=float))
+                if score >= best_score:
+                    best_response, best_score = response, score
+            if best_response is not None:
+                _count(agent, "semantic_hits")
+                return best_response
+
+    _count(agent, "misses")
+    return None
+
+def set_cached(agent, prompt, model, response, tool_context="", ttl=None):
+    if not response:
+        return
+    ttl = AGENT_TTLS.get(agent, DEFAULT_TTL) if ttl is None else ttl
+    embed = get_embedder()
+    embedding = json.dumps(list(map(float, embed(normalize_prompt(prompt))))) if embed is not None else None
+    now = time.time()
+    with get_cache_conn() as conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO llm_cache
+                (cache_key, agent, model, tool_context, prompt, response, embedding, created_at, expires_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (make_key(agent, prompt, model, tool_context), agent, model, tool_context,
+              normalize_prompt(prompt), response, embedding, now, now + ttl))
+        conn.commit()
+
+def get_sql_answer(user_id, question):
+    """The cached answer, generated SQL and its result for this user's question, or None"""
+    with get_cache_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT data_version, answer, sql, result, created_at FROM sql_answer_cache
+            WHERE user_id = ? AND question = ?
+        """, (user_id, normalize_prompt(question)))
+        row = cur.fetchone()
+    if row is None:
+        return None
+    return {"data_version": row[0], "answer": row[1], "sql": row[2], "result": row[3], "created_at": row[4]}
+
+def set_sql_answer(user_id, question, data_version, answer, sql=None, result=None):
+    if not answer:
+        return
+    with get_cache_conn() as conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO sql_answer_cache
+                (user_id, question, data_version, answer, sql, result, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (user_id, normalize_prompt(question), data_version, answer, sql, result, time.time()))
+        conn.commit()
+
+def count_lookup(agent, hit):
+    _count(agent, "hits" if hit else "misses")
+
+def purge_expired():
+    with get_cache_conn() as conn:
+        conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+        conn.commit()
+
+def cache_stats():
+    """Hit/miss counters and hit rate per agent since process start"""
+    with _stats_lock:
+        report = {}
+        for agent, counts in _stats.items():
+            total = counts["hits"] + counts["semantic_hits"] + counts["misses"]
+            hit_rate = (counts["hits"] + counts["semantic_hits"]) / total if total else 0.0
+            report[agent] = dict(counts, hit_rate=hit_rate)
+        return report
@@ -0,0 +1,383 @@
+"""One gateway in front of every LLM request the process makes.
+
+Each request waits for a concurrency slot with its provider and a token
+from its model's rate bucket. Waiting requests are admitted by lane (the
+agent named in the model's metadata), so router and insertion calls go
+ahead of long trip plans; a request gains priority the longer it waits so
+no lane starves. Identical in-flight prompts to a deterministic model
+share one provider call, and retryable failures (429s, 5xx, connection
+errors) go back into the queue after a jittered backoff instead of
+hammering the provider.
+"""
+import os
+import copy
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+from langchain_core.messages import messages_to_dict
+from utils.telemetry import record
+
+# Maximum number of in-flight requests per LLM provider (shared by every agent in the process)
+PROVIDER_LIMITS = {
+    "openai": int(os.getenv("OPENAI_MAX_CONCURRENCY", "8")),
+    "google": int(os.getenv("GOOGLE_MAX_CONCURRENCY", "4")),
+}
+DEFAULT_LIMIT = 4
+
+# Requests per minute each model may start, and how many may start back to back
+MODEL_RPM = {
+    "gpt-4o-mini": int(os.getenv("OPENAI_RPM", "500")),
+}
+DEFAULT_RPM = int(os.getenv("LLM_DEFAULT_RPM", "60"))
+LLM_BURST = int(os.getenv("LLM_BURST", "10"))
+
+# Lower goes first: short interactive calls ahead of long generations
+LANE_PRIORITIES = {"router": 0, "insertion": 0, "query": 1, "finance": 1, "trip": 2}
+DEFAULT_PRIORITY = 1
+# A queued request moves up one priority level per this many seconds of waiting
+LANE_AGING_SECONDS = float(os.getenv("LLM_LANE_AGING_SECONDS", "5"))
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 20.0
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = ("RateLimitError", "APIConnectionError", "APITimeoutError", "InternalServerError",
+                    "ResourceExhausted", "ServiceUnavailable")
+
+_lock = threading.Lock()
+_gates = {}
+_buckets = {}
+_inflight = {}
+_seq = 0
+_stats = {"calls": 0, "coalesced": 0, "retries": 0, "rate_limited": 0, "failed": 0}
+
+class TokenBucket:
+    """Refills at rate_per_minute up to burst; one token per request"""
+
+    def __init__(self, rate_per_minute, burst):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, now):
+        """Take a token and return 0, or return the seconds until one is available"""
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def pause(self, seconds, now):
+        # The provider asked us to back off: nobody using this model starts for `seconds`
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+class _Gate:
+    def __init__(self, provider):
+        self.provider = provider
+        self.limit = PROVIDER_LIMITS.get(provider, DEFAULT_LIMIT)
+        self.in_flight = 0
+        self.waiting = []
+        self.timer = None
+
+class _Waiter:
+    def __init__(self, model, lane, wake):
+        global _seq
+        _seq += 1
+        self.seq = _seq
+        self.model = model
+        self.lane = lane
+        self.priority = LANE_PRIORITIES.get(lane, DEFAULT_PRIORITY)
+        self.queued_at = time.monotonic()
+        self.wake = wake
+        self.granted = False
+
+def _gate(provider):
+    if provider not in _gates:
+        _gates[provider] = _Gate(provider)
+    return _gates[provider]
+
+def _bucket(model):
+    if model not in _buckets:
+        _buckets[model] = TokenBucket(MODEL_RPM.get(model, DEFAULT_RPM), LLM_BURST)
+    return _buckets[model]
+
+def _dispatch(gate):
+    # Called with _lock held: admit waiters in (aged) priority order while slots and tokens last
+    now = time.monotonic()
+    while gate.waiting and gate.in_flight < gate.limit:
+        order = sorted(gate.waiting, key=lambda w: (w.priority - (now - w.queued_at) / LANE_AGING_SECONDS, w.seq))
+        admitted, retry_in = None, None
+        for waiter in order:
+            delay = _bucket(waiter.model).try_take(now)
+            if delay == 0:
+                admitted = waiter
+                break
+            retry_in = delay if retry_in is None else min(retry_in, delay)
+        if admitted is None:
+            _dispatch_later(gate, retry_in)
+            return
+        gate.waiting.remove(admitted)
+        gate.in_flight += 1
+        admitted.granted = True
+        admitted.wake()
+
+def _dispatch_later(gate, delay):
+    if gate.timer is not None:
+        return
+
+    def fire():
+        with _lock:
+            gate.timer = None
+            _dispatch(gate)
+    gate.timer = threading.Timer(delay, fire)
+    gate.timer.daemon = True
+    gate.timer.start()
+
+def _enqueue(provider, model, lane, wake):
+    with _lock:
+        gate = _gate(provider)
+        waiter = _Waiter(model, lane, wake)
+        gate.waiting.append(waiter)
+        _dispatch(gate)
+    return waiter
+
+def _release(provider):
+    with _lock:
+        gate = _gate(provider)
+        gate.in_flight -= 1
+        _dispatch(gate)
+
+@contextmanager
+def slot(provider, model, lane):
+    """Block the calling thread until the request may start, and hold its place until it ends"""
+    event = threading.Event()
+    waiter = _enqueue(provider, model, lane, event.set)
+    event.wait()
+    record("llm_queue", lane, (time.monotonic() - waiter.queued_at) * 1000)
+    try:
+        yield
+    finally:
+        _release(provider)
+
+@asynccontextmanager
+async def aslot(provider, model, lane):
+    """Wait (without holding a thread) until the request may start"""
+    loop = asyncio.get_running_loop()
+    admitted = loop.create_future()
+
+    def resolve():
+        if not admitted.done():
+            admitted.set_result(None)
+    waiter = _enqueue(provider, model, lane, lambda: loop.call_soon_threadsafe(resolve))
+    try:
+        await admitted
+    except asyncio.CancelledError:
+        with _lock:
+            gate = _gate(provider)
+            if waiter.granted:
+                gate.in_flight -= 1
+                _dispatch(gate)
+            else:
+                gate.waiting.remove(waiter)
+        raise
+    record("llm_queue", lane, (time.monotonic() - waiter.queued_at) * 1000)
+    try:
+        yield
+    finally:
+        _release(provider)
+
+def _status(exc):
+    return getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+
+def is_retryable(exc):
+    return _status(exc) in RETRYABLE_STATUS or type(exc).__name__ in RETRYABLE_ERRORS
+
+def _retry_after(exc):
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+def _backoff(model, exc, attempt):
+    """Seconds to wait before retrying: full jitter, but never sooner than Retry-After"""
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+    rate_limited = _status(exc) == 429 or type(exc).__name__ in ("RateLimitError", "ResourceExhausted")
+    with _lock:
+        _stats["retries"] += 1
+        if rate_limited:
+            _stats["rate_limited"] += 1
+            retry_after = _retry_after(exc)
+            delay = max(delay, retry_after or 0.0)
+            # Slow every caller of this model down, not just the one that got the 429
+            _bucket(model).pause(retry_after or RETRY_BASE_DELAY, time.monotonic())
+    return delay
+
+def _give_up(attempt, exc):
+    if attempt == LLM_MAX_RETRIES or not is_retryable(exc):
+        with _lock:
+            _stats["failed"] += 1
+        return True
+    return False
+
+def _call_with_retries(provider, model, lane, fn):
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        with slot(provider, model, lane):
+            try:
+                return fn()
+            except Exception as exc:
+                if _give_up(attempt, exc):
+                    raise
+                delay = _backoff(model, exc, attempt)
+        time.sleep(delay)
+
+async def _acall_with_retries(provider, model, lane, fn):
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        async with aslot(provider, model, lane):
+            try:
+                return await fn()
+            except Exception as exc:
+                if _give_up(attempt, exc):
+                    raise
+                delay = _backoff(model, exc, attempt)
+        await asyncio.sleep(delay)
+
+def _join_or_lead(key):
+    """(future, leader): followers wait on the leader's future for the same key"""
+    with _lock:
+        _stats["calls"] += 1
+        if key is None:
+            return None, True
+        future = _inflight.get(key)
+        if future is not None:
+            _stats["coalesced"] += 1
+            return future, False
+        future = _inflight[key] = Future()
+        return future, True
+
+def _finish(key, future, result=None, error=None):
+    if key is None:
+        return
+    with _lock:
+        _inflight.pop(key, None)
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+def call(provider, model, lane, fn, key=None):
+    """Run fn() through the gateway; concurrent calls with the same key share one run"""
+    future, leader = _join_or_lead(key)
+    if not leader:
+        # Callers may mutate what they get back (message ids), so each follower gets its own copy
+        return copy.deepcopy(future.result())
+    try:
+        result = _call_with_retries(provider, model, lane, fn)
+    except BaseException as exc:
+        _finish(key, future, error=exc)
+        raise
+    _finish(key, future, result)
+    return result
+
+async def acall(provider, model, lane, fn, key=None):
+    future, leader = _join_or_lead(key)
+    if not leader:
+        return copy.deepcopy(await asyncio.wrap_future(future))
+    try:
+        result = await _acall_with_retries(provider, model, lane, fn)
+    except BaseException as exc:
+        # Including cancellation, so followers are never left waiting on a leader that gave up
+        _finish(key, future, error=exc)
+        raise
+    _finish(key, future, result)
+    return result
+
+def stream(provider, model, lane, start):
+    """Yield from start() under the gateway; retried only if it fails before the first chunk"""
+    with _lock:
+        _stats["calls"] += 1
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        started = False
+        with slot(provider, model, lane):
+            try:
+                for chunk in start():
+                    started = True
+                    yield chunk
+                return
+            except Exception as exc:
+                if started or _give_up(attempt, exc):
+                    raise
+                delay = _backoff(model, exc, attempt)
+        time.sleep(delay)
+
+async def astream(provider, model, lane, start):
+    with _lock:
+        _stats["calls"] += 1
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        started = False
+        async with aslot(provider, model, lane):
+            try:
+                async for chunk in start():
+                    started = True
+                    yield chunk
+                return
+            except Exception as exc:
+                if started or _give_up(attempt, exc):
+                    raise
+                delay = _backoff(model, exc, attempt)
+        await asyncio.sleep(delay)
+
+def request_key(provider, model, params, messages, stop, kwargs):
+    payload = json.dumps([provider, model, params, messages_to_dict(messages), stop, kwargs], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def gateway_stats():
+    """Counters since process start, plus the current queue per provider"""
+    with _lock:
+        queues = {
+            provider: {"waiting": len(gate.waiting), "in_flight": gate.in_flight, "limit": gate.limit}
+            for provider, gate in _gates.items()
+        }
+        return dict(_stats, coalescing_now=len(_inflight), providers=queues)
+
+class GatewayMixin:
+    """Sends a chat model's requests through the gateway; list it before the model class.
+
+    The lane is the "agent" in the model's metadata. Only temperature-0 models
+    coalesce identical prompts, since only their answers are interchangeable.
+    """
+
+    def _gateway_route(self):
+        provider = getattr(self, "limit_provider", "openai")
+        model = getattr(self, "model_name", None) or "default"
+        lane = (self.metadata or {}).get("agent", "default")
+        return provider, model, lane
+
+    def _coalesce_key(self, messages, stop, kwargs):
+        if getattr(self, "temperature", 0) != 0:
+            return None
+        provider, model, _ = self._gateway_route()
+        return request_key(provider, model, self._identifying_params, messages, stop, kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        generate = super()._generate
+        provider, model, lane = self._gateway_route()
+        return call(provider, model, lane, lambda: generate(messages, stop=stop, run_manager=run_manager, **kwargs),
+                    key=self._coalesce_key(messages, stop, kwargs))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        agenerate = super()._agenerate
+        provider, model, lane = self._gateway_route()
+        return await acall(provider, model, lane, lambda: agenerate(messages, stop=stop, run_manager=run_manager, **kwargs),
+                           key=self._coalesce_key(messages, stop, kwargs))
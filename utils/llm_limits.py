@@ -0,0 +1,21 @@
+from typing import Optional
+from langchain_openai import ChatOpenAI
+from utils.llm_gateway import GatewayMixin, stream, astream
+
+class LimitedChatOpenAI(GatewayMixin, ChatOpenAI):
+    """ChatOpenAI whose every request goes through the shared LLM gateway"""
+    limit_provider: str = "openai"
+    # The gateway retries with jittered backoff; the client retrying as well
+    # would multiply attempts into a retry storm under 429s
+    max_retries: Optional[int] = 0
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        provider, model, lane = self._gateway_route()
+        start = super()._stream
+        yield from stream(provider, model, lane, lambda: start(messages, stop=stop, run_manager=run_manager, **kwargs))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        provider, model, lane = self._gateway_route()
+        start = super()._astream
+        async for chunk in astream(provider, model, lane, lambda: start(messages, stop=stop, run_manager=run_manager, **kwargs)):
+            yield chunk
@@ -0,0 +1,198 @@
+import os
+import time
+import sqlite3
+import threading
+from datetime import date, timedelta
+import numpy as np
+
+# Local daily price history, so historical and indicator questions never hit a remote API twice
+MARKET_DB_PATH = os.getenv("MARKET_DATA_DB", "utils/market_data.db")
+# How long the most recent prices are trusted before the tail is fetched again
+MARKET_REFRESH_SECONDS = int(os.getenv("MARKET_REFRESH_SECONDS", "900"))
+TRADING_DAYS = 252
+MOVING_AVERAGE_WINDOWS = (20, 50, 200)
+
+_symbol_locks = {}
+_locks_guard = threading.Lock()
+_source = None
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+class YFinanceSource:
+    """Daily bars from Yahoo Finance through yfinance"""
+
+    def fetch(self, symbol, start, end):
+        # Returns [(date_iso, open, high, low, close, volume)] for start <= date <= end
+        import yfinance as yf
+        frame = yf.Ticker(symbol).history(start=start.isoformat(), end=(end + timedelta(days=1)).isoformat(),
+                                          interval="1d", auto_adjust=True)
+        return [
+            (index.date().isoformat(), float(row["Open"]), float(row["High"]), float(row["Low"]),
+             float(row["Close"]), int(row["Volume"]))
+            for index, row in frame.iterrows()
+        ]
+
+def set_price_source(source):
+    """Replace the price source (e.g. with an offline stand-in)"""
+    global _source
+    _source = source
+
+def get_price_source():
+    global _source
+    if _source is None:
+        _source = YFinanceSource()
+    return _source
+
+# One connection per thread, reused across calls like db_utils.get_conn. A new one is
+# opened only when MARKET_DB_PATH changes (the benchmarks point it at a scratch file).
+def get_market_conn():
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.path != MARKET_DB_PATH:
+        if conn is not None:
+            conn.close()
+        conn = sqlite3.connect(MARKET_DB_PATH, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        _local.conn, _local.path = conn, MARKET_DB_PATH
+    with _schema_lock:
+        if MARKET_DB_PATH not in _schema_ready:
+            create_tables(conn)
+            _schema_ready.add(MARKET_DB_PATH)
+    return conn
+
+def create_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS prices (
+            symbol TEXT NOT NULL,
+            date TEXT NOT NULL,
+            open REAL,
+            high REAL,
+            low REAL,
+            close REAL NOT NULL,
+            volume INTEGER,
+            PRIMARY KEY (symbol, date)
+        )
+    ''')
+    # The date range already fetched per symbol (weekends and holidays have no rows)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS price_coverage (
+            symbol TEXT PRIMARY KEY,
+            first_date TEXT NOT NULL,
+            last_date TEXT NOT NULL,
+            refreshed_at REAL NOT NULL
+        )
+    ''')
+    conn.commit()
+
+def _symbol_lock(symbol):
+    with _locks_guard:
+        return _symbol_locks.setdefault(symbol, threading.Lock())
+
+def missing_ranges(coverage, start, end, now=None):
+    """Date ranges between start and end that are not stored yet (or whose tail is stale)"""
+    if coverage is None:
+        return [(start, end)]
+    first, last, refreshed_at = date.fromisoformat(coverage[0]), date.fromisoformat(coverage[1]), coverage[2]
+    ranges = []
+    if start < first:
+        ranges.append((start, first - timedelta(days=1)))
+    stale = (now or time.time()) - refreshed_at > MARKET_REFRESH_SECONDS
+    if end > last or (stale and end >= last):
+        # Re-fetch the last stored day too: today's bar keeps changing until the close
+        ranges.append((min(last, end), end))
+    return ranges
+
+def refresh(symbol, start, end):
+    """Fetch only the missing parts of [start, end] for symbol; returns rows fetched"""
+    symbol = symbol.strip().upper()
+    with _symbol_lock(symbol):
+        with get_market_conn() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT first_date, last_date, refreshed_at FROM price_coverage WHERE symbol = ?", (symbol,))
+            coverage = cur.fetchone()
+            ranges = missing_ranges(coverage, start, end)
+            if not ranges:
+                return 0
+            rows = []
+            for range_start, range_end in ranges:
+                rows.extend(get_price_source().fetch(symbol, range_start, range_end))
+            cur.executemany("""
+                INSERT OR REPLACE INTO prices (symbol, date, open, high, low, close, volume)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [(symbol, *row) for row in rows])
+            first = min([start] + ([date.fromisoformat(coverage[0])] if coverage else []))
+            last = max([end] + ([date.fromisoformat(coverage[1])] if coverage else []))
+            cur.execute("""
+                INSERT OR REPLACE INTO price_coverage (symbol, first_date, last_date, refreshed_at)
+                VALUES (?, ?, ?, ?)
+            """, (symbol, first.isoformat(), last.isoformat(), time.time()))
+            conn.commit()
+            return len(rows)
+
+def get_closes(symbol, start, end):
+    """(dates, closes) as NumPy arrays, refreshing the local store first"""
+    symbol = symbol.strip().upper()
+    refresh(symbol, start, end)
+    with get_market_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT date, close FROM prices
+            WHERE symbol = ? AND date >= ? AND date <= ?
+            ORDER BY date
+        """, (symbol, start.isoformat(), end.isoformat()))
+        rows = cur.fetchall()
+    dates = np.array([row[0] for row in rows], dtype="datetime64[D]")
+    closes = np.array([row[1] for row in rows], dtype=float)
+    return dates, closes
+
+def moving_average(closes, window):
+    if len(closes) < window:
+        return None
+    cumulative = np.cumsum(np.insert(closes, 0, 0.0))
+    return (cumulative[window:] - cumulative[:-window]) / window
+
+def compute_indicators(closes):
+    """Returns, moving averages, volatility and drawdown of a close-price series"""
+    if len(closes) < 2:
+        return None
+    daily_returns = np.diff(closes) / closes[:-1]
+    log_returns = np.diff(np.log(closes))
+    running_peak = np.maximum.accumulate(closes)
+    drawdowns = closes / running_peak - 1.0
+    indicators = {
+        "last_close": float(closes[-1]),
+        "total_return": float(closes[-1] / closes[0] - 1.0),
+        "mean_daily_return": float(daily_returns.mean()),
+        "annualized_volatility": float(log_returns.std(ddof=1) * np.sqrt(TRADING_DAYS)) if len(log_returns) > 1 else 0.0,
+        "max_drawdown": float(drawdowns.min()),
+        "current_drawdown": float(drawdowns[-1]),
+        "high": float(closes.max()),
+        "low": float(closes.min()),
+    }
+    for window in MOVING_AVERAGE_WINDOWS:
+        averages = moving_average(closes, window)
+        indicators[f"sma_{window}"] = float(averages[-1]) if averages is not None else None
+    return indicators
+
+def describe_history(symbol, days=365, today=None):
+    """Plain-text summary of a symbol's price history and indicators for the agent"""
+    end = today or date.today()
+    start = end - timedelta(days=days)
+    dates, closes = get_closes(symbol, start, end)
+    indicators = compute_indicators(closes)
+    if indicators is None:
+        return f"No price history found for {symbol.upper()} between {start} and {end}."
+
+    lines = [
+        f"{symbol.upper()} daily closes from {dates[0]} to {dates[-1]} ({len(closes)} trading days):",
+        f"- Last close: {indicators['last_close']:.2f} (high {indicators['high']:.2f}, low {indicators['low']:.2f})",
+        f"- Total return: {indicators['total_return']:.2%}",
+        f"- Annualized volatility: {indicators['annualized_volatility']:.2%}",
+        f"- Max drawdown: {indicators['max_drawdown']:.2%} (currently {indicators['current_drawdown']:.2%} below the peak)",
+    ]
+    for window in MOVING_AVERAGE_WINDOWS:
+        value = indicators[f"sma_{window}"]
+        if value is not None:
+            lines.append(f"- {window}-day moving average: {value:.2f}")
+    return "\n".join(lines)
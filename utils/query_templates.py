@@ -0,0 +1,295 @@
+import re
+import calendar
+from datetime import date, timedelta
+from utils.db_utils import get_conn
+from utils.expense_fields import CATEGORY_KEYWORDS, EXPENSE_CATEGORIES, PAYMENT_KEYWORDS, PAYMENT_METHODS
+
+# Parameterized queries for the most common spending questions. Every filter is
+# always bound (NULL meaning "any"), so each template is one fixed statement that
+# SQLite prepares once and serves from the (user_id, date) index.
+ALL_TIME = (date(1900, 1, 1), date(9999, 12, 31))
+
+TOTAL_SQL = """
+    SELECT COALESCE(SUM(amount), 0), COUNT(*)
+    FROM expenses
+    WHERE user_id = ? AND date >= ? AND date < ?
+      AND (? IS NULL OR category = ?)
+      AND (? IS NULL OR payment_method = ?)
+"""
+
+TOP_EXPENSES_SQL = """
+    SELECT amount, category, date, description, payment_method
+    FROM expenses
+    WHERE user_id = ? AND date >= ? AND date < ?
+      AND (? IS NULL OR category = ?)
+      AND (? IS NULL OR payment_method = ?)
+    ORDER BY amount DESC
+    LIMIT ?
+"""
+
+LIST_SQL = """
+    SELECT amount, category, date, description, payment_method
+    FROM expenses
+    WHERE user_id = ? AND date >= ? AND date < ?
+      AND (? IS NULL OR category = ?)
+      AND (? IS NULL OR payment_method = ?)
+    ORDER BY date DESC, expense_id DESC
+    LIMIT ?
+"""
+
+CATEGORY_BREAKDOWN_SQL = """
+    SELECT category, SUM(amount) AS total, COUNT(*)
+    FROM expenses
+    WHERE user_id = ? AND date >= ? AND date < ?
+      AND (? IS NULL OR payment_method = ?)
+    GROUP BY category
+    ORDER BY total DESC
+"""
+
+PAYMENT_BREAKDOWN_SQL = """
+    SELECT payment_method, SUM(amount) AS total, COUNT(*)
+    FROM expenses
+    WHERE user_id = ? AND date >= ? AND date < ?
+      AND (? IS NULL OR category = ?)
+    GROUP BY payment_method
+    ORDER BY total DESC
+"""
+
+LIST_LIMIT = 20
+MONTHS = {name.lower(): index for index, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): index for index, name in enumerate(calendar.month_abbr) if name})
+
+# Questions the templates cannot answer faithfully go to the SQL agent
+UNSUPPORTED = re.compile(
+    r"\b(average|avg|mean|per day|daily|location|where|more than|less than|over \$?\d|under \$?\d|"
+    r"recurring|budget|saving|savings|percent|%|trend|why|predict|forecast|each day|"
+    r"most(?! expensive)|least|fewest|which|how many|how often|count|number of|times)\b",
+    re.IGNORECASE,
+)
+# Follow-ups depend on the earlier conversation ("how much was that in total?")
+FOLLOW_UP = re.compile(r"^\s*(and|also|what about|how about)\b|\b(it|that|those|these|them|same|instead)\b", re.IGNORECASE)
+# Money that is not the user's spending: income, prices, holdings
+NOT_SPENDING = re.compile(
+    r"\b(earn|earned|earning|earnings|income|salary|wage|wages|paid me|received|receive|refunds?|worth|"
+    r"price|prices|priced|stocks?|shares?|crypto|bitcoin|invest|invested|investment|portfolio|balance|owe|owed|loan|tax|taxes)\b",
+    re.IGNORECASE,
+)
+# The question has to be about spending, directly or through a category or payment method
+SPENDING = re.compile(r"\b(spent|spend|spending|expenses?|purchases?|transactions?|paid|pay|cost|costs|bought)\b", re.IGNORECASE)
+# Dates finer than find_periods understands: answering with a coarser period would be wrong
+UNPARSED_DATES = re.compile(
+    r"\b(between|since|until|till|before|after|ago|quarter|weekend|"
+    r"monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b|\bfrom\b.+\b(to|through)\b|"
+    r"\b\d{4}-\d{1,2}(-\d{1,2})?\b|\b\d{1,2}/\d{1,2}\b|\b\d{1,2}(st|nd|rd|th)\b|"
+    rf"\b({'|'.join(sorted(MONTHS, key=len, reverse=True))})\.?\s+\d{{1,2}}\b|"
+    rf"\b\d{{1,2}}\s+({'|'.join(sorted(MONTHS, key=len, reverse=True))})\b",
+    re.IGNORECASE,
+)
+TOP_INTENT = re.compile(r"\b(top|biggest|largest|highest|most expensive|priciest)\b", re.IGNORECASE)
+COMPARE_INTENT = re.compile(r"\b(compare|compared|vs\.?|versus)\b", re.IGNORECASE)
+PAYMENT_INTENT = re.compile(r"\b(payment methods?|by payment|how did i pay|paid with what)\b", re.IGNORECASE)
+CATEGORY_INTENT = re.compile(r"\b(by category|per category|each category|category breakdown|breakdown|categories)\b", re.IGNORECASE)
+LIST_INTENT = re.compile(r"\b(show|list|display)\b.*\b(transactions|expenses|purchases|spending)\b", re.IGNORECASE)
+TOTAL_INTENT = re.compile(r"\b(how much|total|spent|spend|spending)\b", re.IGNORECASE)
+TOP_N = re.compile(r"\btop\s+(\d{1,3})\b", re.IGNORECASE)
+
+def _month_bounds(year, month):
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, end
+
+def find_periods(question, today=None):
+    """All periods named in the question, in order, as (start, end_exclusive, label)"""
+    today = today or date.today()
+    text = question.lower()
+    found = []
+    spans = []
+
+    def add(position, start, end, label, span_end=None):
+        found.append((position, (start, end, label)))
+        spans.append((position, span_end or position))
+
+    for match in re.finditer(r"\btoday\b", text):
+        add(match.start(), today, today + timedelta(days=1), "today")
+    for match in re.finditer(r"\byesterday\b", text):
+        add(match.start(), today - timedelta(days=1), today, "yesterday")
+    week_start = today - timedelta(days=today.weekday())
+    for match in re.finditer(r"\bthis week\b", text):
+        add(match.start(), week_start, today + timedelta(days=1), "this week")
+    for match in re.finditer(r"\blast week\b", text):
+        add(match.start(), week_start - timedelta(days=7), week_start, "last week")
+    for match in re.finditer(r"\bthis month\b", text):
+        add(match.start(), *_month_bounds(today.year, today.month), "this month")
+    for match in re.finditer(r"\blast month\b", text):
+        last = today.replace(day=1) - timedelta(days=1)
+        add(match.start(), *_month_bounds(last.year, last.month), "last month")
+    for match in re.finditer(r"\bthis year\b", text):
+        add(match.start(), date(today.year, 1, 1), date(today.year + 1, 1, 1), "this year")
+    for match in re.finditer(r"\blast year\b", text):
+        add(match.start(), date(today.year - 1, 1, 1), date(today.year, 1, 1), "last year")
+    for match in re.finditer(r"\b(?:last|past)\s+(\d{1,3})\s+days\b", text):
+        days = int(match.group(1))
+        add(match.start(), today - timedelta(days=days - 1), today + timedelta(days=1), f"the last {days} days")
+    month_names = "|".join(sorted(MONTHS, key=len, reverse=True))
+    for match in re.finditer(rf"\b(?:in|for|during|of)?\s*({month_names})\b(?:\s+(\d{{4}}))?", text):
+        month = MONTHS[match.group(1)]
+        if match.group(1) == "may" and not re.search(r"\b(in|for|during|of)\s+may\b|\bmay\s+\d{4}\b", match.group(0)):
+            continue
+        year = int(match.group(2)) if match.group(2) else (today.year if month <= today.month else today.year - 1)
+        start, end = _month_bounds(year, month)
+        add(match.start(), start, end, f"{calendar.month_name[month]} {year}", match.end())
+    # A bare year ("in 2024") that is not part of a month already found
+    for match in re.finditer(r"\b(?:19|20)\d{2}\b", text):
+        if any(start <= match.start() < end for start, end in spans):
+            continue
+        year = int(match.group(0))
+        add(match.start(), date(year, 1, 1), date(year + 1, 1, 1), str(year))
+
+    return [period for _, period in sorted(found, key=lambda item: item[0])]
+
+def _mentions(question, keyword_map, vocabulary):
+    """{value: word} for every vocabulary value the question names, directly or through a keyword"""
+    text = f" {question.lower()} "
+    found = {}
+    # The value's own name wins over a keyword for it, then longer keywords over shorter ones
+    candidates = [(value.lower(), value) for value in vocabulary if value != "Other"]
+    candidates += sorted(((kw, name) for name, keywords in keyword_map.items() for kw in keywords),
+                         key=lambda item: -len(item[0]))
+    for word, value in candidates:
+        if value not in found and re.search(rf"(?<![a-z]){re.escape(word)}(?![a-z])", text):
+            found[value] = word
+    return found
+
+def extract_intent(question, today=None):
+    """Map a question onto a template intent and its slots, or None for novel questions"""
+    if UNSUPPORTED.search(question) or UNPARSED_DATES.search(question) or FOLLOW_UP.search(question):
+        return None
+    if NOT_SPENDING.search(question):
+        return None
+    categories = _mentions(question, CATEGORY_KEYWORDS, EXPENSE_CATEGORIES)
+    payment_methods = _mentions(question, PAYMENT_KEYWORDS, PAYMENT_METHODS)
+    # Several categories or methods ("food or transport") need a comparison the templates don't do
+    if len(categories) > 1 or len(payment_methods) > 1:
+        return None
+    category = next(iter(categories), None)
+    # "coffee" narrows Food down to some of its rows; only the category's own name covers all of them
+    if category and categories[category] not in (category.lower(), CATEGORY_KEYWORDS[category][0]):
+        return None
+    periods = find_periods(question, today)
+    slots = {
+        "category": category,
+        "payment_method": next(iter(payment_methods), None),
+        "period": periods[0] if periods else (*ALL_TIME, "all time"),
+    }
+
+    if COMPARE_INTENT.search(question) and len(periods) >= 2:
+        return "compare_periods", dict(slots, periods=periods[:2])
+    if COMPARE_INTENT.search(question) and len(periods) == 1:
+        start, end, label = periods[0]
+        previous = (start - (end - start), start, f"the {(end - start).days} days before")
+        return "compare_periods", dict(slots, periods=[periods[0], previous])
+    # "How much rain fell", "the biggest city": the open-ended intents need the question to be
+    # about spending; comparisons, breakdowns and transaction lists already are
+    about_spending = bool(SPENDING.search(question) or categories or payment_methods)
+    if TOP_INTENT.search(question) and about_spending:
+        match = TOP_N.search(question)
+        return "top_expenses", dict(slots, limit=int(match.group(1)) if match else 5)
+    if PAYMENT_INTENT.search(question):
+        return "payment_breakdown", slots
+    if CATEGORY_INTENT.search(question) and slots["category"] is None:
+        return "category_breakdown", slots
+    if LIST_INTENT.search(question):
+        return "list_transactions", slots
+    if TOTAL_INTENT.search(question) and about_spending:
+        return "total_spend", slots
+    return None
+
+def _filters(user_id, period, category, payment_method):
+    start, end, _ = period
+    return (user_id, start.isoformat(), end.isoformat(), category, category, payment_method, payment_method)
+
+def _scope(slots, period=None):
+    label = (period or slots["period"])[2]
+    scope = f" on {slots['category']}" if slots.get("category") else ""
+    if slots.get("payment_method"):
+        scope += f" with {slots['payment_method']}"
+    return scope, label
+
+def _format_rows(rows):
+    return "\n".join(
+        f"- ${amount:,.2f} {category} on {day}" + (f" ({description})" if description else "") + f" via {payment}"
+        for amount, category, day, description, payment in rows
+    )
+
+def run_template(intent, slots, user_id):
+    with get_conn() as conn:
+        cur = conn.cursor()
+        if intent == "total_spend":
+            cur.execute(TOTAL_SQL, _filters(user_id, slots["period"], slots["category"], slots["payment_method"]))
+            total, count = cur.fetchone()
+            scope, label = _scope(slots)
+            return f"You spent ${total:,.2f}{scope} ({label}) across {count} transaction{'s' if count != 1 else ''}."
+
+        if intent == "top_expenses":
+            cur.execute(TOP_EXPENSES_SQL, _filters(user_id, slots["period"], slots["category"], slots["payment_method"]) + (slots["limit"],))
+            rows = cur.fetchall()
+            scope, label = _scope(slots)
+            if not rows:
+                return f"I found no expenses{scope} ({label})."
+            return f"Your top {len(rows)} expenses{scope} ({label}):\n{_format_rows(rows)}"
+
+        if intent == "list_transactions":
+            cur.execute(LIST_SQL, _filters(user_id, slots["period"], slots["category"], slots["payment_method"]) + (LIST_LIMIT,))
+            rows = cur.fetchall()
+            scope, label = _scope(slots)
+            if not rows:
+                return f"I found no transactions{scope} ({label})."
+            return f"Your most recent transactions{scope} ({label}):\n{_format_rows(rows)}"
+
+        if intent == "category_breakdown":
+            start, end, label = slots["period"]
+            cur.execute(CATEGORY_BREAKDOWN_SQL, (user_id, start.isoformat(), end.isoformat(), slots["payment_method"], slots["payment_method"]))
+            rows = cur.fetchall()
+            if not rows:
+                return f"I found no expenses ({label})."
+            lines = "\n".join(f"- {category}: ${total:,.2f} ({count})" for category, total, count in rows)
+            return f"Spending by category ({label}):\n{lines}"
+
+        if intent == "payment_breakdown":
+            start, end, label = slots["period"]
+            cur.execute(PAYMENT_BREAKDOWN_SQL, (user_id, start.isoformat(), end.isoformat(), slots["category"], slots["category"]))
+            rows = cur.fetchall()
+            if not rows:
+                return f"I found no expenses ({label})."
+            lines = "\n".join(f"- {method}: ${total:,.2f} ({count})" for method, total, count in rows)
+            return f"Spending by payment method ({label}):\n{lines}"
+
+        if intent == "compare_periods":
+            totals = []
+            for period in slots["periods"]:
+                cur.execute(TOTAL_SQL, _filters(user_id, period, slots["category"], slots["payment_method"]))
+                totals.append(cur.fetchone()[0])
+            (first, second), (first_label, second_label) = totals, [p[2] for p in slots["periods"]]
+            scope, _ = _scope(slots)
+            difference = first - second
+            direction = "more" if difference > 0 else "less"
+            change = f"${abs(difference):,.2f} {direction}" if difference else "the same amount"
+            return (f"You spent ${first:,.2f}{scope} in {first_label} and ${second:,.2f} in {second_label} "
+                    f"({change} in {first_label}).")
+    return None
+
+def answer_from_templates(question, user_id, today=None, follows_query=False):
+    """Answer a common spending question directly from SQL, or None to fall back to the agent.
+
+    follows_query: the previous turn was also a spending question. A question
+    without its own period ("total for transport?") may then mean the earlier
+    one's, which only the agent can see.
+    """
+    if user_id is None:
+        return None
+    if follows_query and not find_periods(question, today):
+        return None
+    intent = extract_intent(question, today)
+    if intent is None:
+        return None
+    return run_template(intent[0], intent[1], user_id)
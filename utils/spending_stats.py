@@ -0,0 +1,124 @@
+import os
+import math
+from datetime import date, datetime
+
+# Running per-user, per-category statistics, updated in O(1) inside every
+# expense write so anomalies and budget crossings are caught as they happen.
+
+# A charge this many standard deviations above the category mean is anomalous
+ANOMALY_Z = float(os.getenv("ANOMALY_Z", "3.0"))
+# Expenses a category needs before its statistics are trusted
+ANOMALY_MIN_HISTORY = int(os.getenv("ANOMALY_MIN_HISTORY", "5"))
+# Weight of the newest expense in the moving average
+EWMA_ALPHA = float(os.getenv("EWMA_ALPHA", "0.2"))
+# Fractions of the monthly budget that raise an alert when first crossed
+BUDGET_THRESHOLDS = (0.5, 0.8, 1.0)
+
+def create_tables(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS spending_stats (
+            user_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            mean REAL NOT NULL,
+            m2 REAL NOT NULL,
+            ewma REAL NOT NULL,
+            PRIMARY KEY (user_id, category)
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS monthly_spend (
+            user_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            total REAL NOT NULL,
+            PRIMARY KEY (user_id, month)
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS spending_alerts (
+            alert_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            category TEXT,
+            amount REAL,
+            message TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            seen INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_spending_alerts_user ON spending_alerts (user_id, seen)")
+
+def welford_update(count, mean, m2, value):
+    count += 1
+    delta = value - mean
+    mean += delta / count
+    m2 += delta * (value - mean)
+    return count, mean, m2
+
+def is_anomalous(count, mean, m2, amount):
+    if count < ANOMALY_MIN_HISTORY:
+        return False
+    std = math.sqrt(m2 / (count - 1))
+    if std == 0:
+        return amount > 2 * mean
+    return (amount - mean) / std >= ANOMALY_Z
+
+def _add_alert(cur, user_id, kind, category, amount, message):
+    cur.execute("""
+        INSERT INTO spending_alerts (user_id, kind, category, amount, message, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (user_id, kind, category, amount, message, datetime.now().isoformat(timespec="seconds")))
+
+def _observe(cur, user_id, expense, alerts=True):
+    amount, category = float(expense["amount"]), expense["category"]
+    cur.execute("SELECT count, mean, m2, ewma FROM spending_stats WHERE user_id = ? AND category = ?", (user_id, category))
+    count, mean, m2, ewma = cur.fetchone() or (0, 0.0, 0.0, amount)
+
+    # Judge the charge against the history before it becomes part of it
+    if alerts and is_anomalous(count, mean, m2, amount):
+        _add_alert(cur, user_id, "anomaly", category, amount,
+                   f"Unusual {category} charge: ${amount:,.2f} (you usually spend about ${ewma:,.2f}).")
+
+    count, mean, m2 = welford_update(count, mean, m2, amount)
+    ewma = EWMA_ALPHA * amount + (1 - EWMA_ALPHA) * ewma
+    cur.execute("""
+        INSERT OR REPLACE INTO spending_stats (user_id, category, count, mean, m2, ewma)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (user_id, category, count, mean, m2, ewma))
+
+    month = str(expense["date"])[:7]
+    cur.execute("SELECT total FROM monthly_spend WHERE user_id = ? AND month = ?", (user_id, month))
+    row = cur.fetchone()
+    before = row[0] if row else 0.0
+    after = before + amount
+    cur.execute("INSERT OR REPLACE INTO monthly_spend (user_id, month, total) VALUES (?, ?, ?)", (user_id, month, after))
+
+    # Budget crossings only matter for the month in progress
+    if not alerts or month != date.today().strftime("%Y-%m"):
+        return
+    cur.execute("SELECT monthly_budget FROM budget_settings WHERE user_id = ?", (user_id,))
+    budget_row = cur.fetchone()
+    budget = budget_row[0] if budget_row else 0
+    if not budget:
+        return
+    for threshold in BUDGET_THRESHOLDS:
+        if before < threshold * budget <= after:
+            if threshold >= 1.0:
+                message = f"You are over this month's budget: ${after:,.2f} spent of ${budget:,.2f}."
+            else:
+                message = f"You have used {threshold:.0%} of this month's budget (${after:,.2f} of ${budget:,.2f})."
+            _add_alert(cur, user_id, "budget", None, after, message)
+
+def observe_expenses(cur, user_id, expenses):
+    """Fold newly inserted expenses into the user's statistics; runs in the caller's transaction"""
+    for expense in expenses:
+        _observe(cur, user_id, expense)
+
+def backfill(cur):
+    # One-time build from existing history (no alerts) when the tables are new
+    cur.execute("SELECT COUNT(*) FROM spending_stats")
+    if cur.fetchone()[0]:
+        return
+    cur.execute("SELECT user_id, amount, category, date FROM expenses ORDER BY date, expense_id")
+    for user_id, amount, category, expense_date in cur.fetchall():
+        _observe(cur, user_id, {"amount": amount, "category": category, "date": expense_date}, alerts=False)
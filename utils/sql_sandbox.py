@@ -0,0 +1,142 @@
+import os
+import re
+import time
+import secrets
+import sqlite3
+from utils.db_utils import DB_PATH
+from utils.telemetry import record
+
+# Limits applied to every query the SQL agent writes
+SQL_TIMEOUT_MS = int(os.getenv("SQL_TIMEOUT_MS", "2000"))
+# Rows returned per query; queries without a LIMIT get one just above this, so truncation shows
+SQL_MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", "200"))
+SQL_MAX_RESULT_CHARS = int(os.getenv("SQL_MAX_RESULT_CHARS", "8000"))
+# Page cache per sandbox connection, in KiB
+SQL_CACHE_KIB = int(os.getenv("SQL_CACHE_KIB", "8192"))
+# SQLite VM instructions between two timeout checks
+PROGRESS_STEPS = 1000
+
+READ_ONLY_SQL = re.compile(r"^\s*(select|with)\b", re.IGNORECASE)
+TRAILING_LIMIT = re.compile(r"\blimit\s+\d+(\s*(,|offset)\s*\d+)?\s*$", re.IGNORECASE)
+# "-- note" or "/* note */" (possibly unterminated) at the very end, outside any string literal
+TRAILING_COMMENT = re.compile(r"(--[^'\n]*|/\*(?:(?!\*/)[^'])*(?:\*/)?)\s*$")
+
+class QueryKilled(Exception):
+    """Raised when the sandbox stops a query; reason is timeout, result_size, not_read_only or forbidden"""
+
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+def scope_to_user(conn, user_id, tables):
+    """Let the connection see only the user's rows of `tables`, enforced by SQLite itself.
+
+    Unqualified names resolve to the temp schema first, so each table is
+    shadowed by a temp view of the user's rows. That view reads the real
+    table through an inner view with a random name, and the authorizer only
+    allows reads of real tables from inside those inner views: "main".expenses,
+    [main].expenses or a CTE over main.expenses are all refused.
+    """
+    prefix = f"scope_{secrets.token_hex(8)}"
+    inner_views = set()
+    for table in tables:
+        inner = f"{prefix}_{table}"
+        conn.execute(f"CREATE TEMP VIEW {inner} AS SELECT * FROM main.{table} WHERE user_id = {int(user_id)}")
+        conn.execute(f"CREATE TEMP VIEW {table} AS SELECT * FROM temp.{inner}")
+        inner_views.add(inner)
+    visible = set(tables) | inner_views
+
+    def authorize(action, name, column, database, source):
+        if action in (sqlite3.SQLITE_SELECT, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE):
+            return sqlite3.SQLITE_OK
+        if action == sqlite3.SQLITE_READ:
+            # No database: a CTE or subquery, not a stored table
+            if database is None or (database == "temp" and name in visible):
+                return sqlite3.SQLITE_OK
+            if database == "main" and source in inner_views:
+                return sqlite3.SQLITE_OK
+        return sqlite3.SQLITE_DENY
+    return authorize
+
+def readonly_conn(user_id=None, tables=()):
+    # mode=ro makes SQLite itself refuse every write on this connection
+    conn = sqlite3.connect(f"file:{os.path.abspath(DB_PATH)}?mode=ro", uri=True, check_same_thread=False)
+    authorizer = scope_to_user(conn, user_id, tables) if tables else None
+    conn.execute("PRAGMA query_only = ON")
+    conn.execute(f"PRAGMA cache_size = -{SQL_CACHE_KIB}")
+    if authorizer:
+        conn.set_authorizer(authorizer)
+    return conn
+
+def add_default_limit(query, limit=None):
+    query = query.strip().rstrip(";").strip()
+    # A trailing comment would hide both an existing LIMIT and the one added here
+    while TRAILING_COMMENT.search(query):
+        query = TRAILING_COMMENT.sub("", query).strip().rstrip(";").strip()
+    if TRAILING_LIMIT.search(query):
+        return query
+    return f"{query}\nLIMIT {limit or SQL_MAX_ROWS + 1}"
+
+def _killed(reason, message, started):
+    record("sql_killed", reason, (time.perf_counter() - started) * 1000, error=True)
+    return QueryKilled(reason, message)
+
+def run_query(query, parameters=None, timeout_ms=None, user_id=None, tables=()):
+    """Run one read-only query under the sandbox limits.
+
+    With tables, the query can only read those tables, and only user_id's rows.
+    Returns (columns, rows, truncated). Raises QueryKilled when a limit stops the query
+    and sqlite3.Error for ordinary SQL errors.
+    """
+    started = time.perf_counter()
+    if not READ_ONLY_SQL.match(query):
+        raise _killed("not_read_only", "only SELECT queries are allowed", started)
+
+    deadline = time.monotonic() + (timeout_ms or SQL_TIMEOUT_MS) / 1000
+    conn = readonly_conn(user_id, tables)
+    # Returning non-zero from the progress handler interrupts the running statement
+    conn.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_STEPS)
+    try:
+        cur = conn.execute(add_default_limit(query), parameters or {})
+        columns = [column[0] for column in cur.description or []]
+        rows, size = [], 0
+        while len(rows) <= SQL_MAX_ROWS:
+            row = cur.fetchone()
+            if row is None:
+                break
+            size += len(repr(row))
+            if size > SQL_MAX_RESULT_CHARS:
+                raise _killed("result_size", f"the result is larger than {SQL_MAX_RESULT_CHARS} characters", started)
+            rows.append(row)
+    except sqlite3.DatabaseError as exc:
+        if "interrupted" in str(exc):
+            raise _killed("timeout", f"the query ran longer than {timeout_ms or SQL_TIMEOUT_MS} ms", started) from exc
+        if "prohibited" in str(exc) or "not authorized" in str(exc):
+            raise _killed("forbidden", "the query reads something outside the allowed tables", started) from exc
+        raise
+    finally:
+        conn.close()
+
+    record("sql", "sandbox", (time.perf_counter() - started) * 1000)
+    truncated = len(rows) > SQL_MAX_ROWS
+    return columns, rows[:SQL_MAX_ROWS], truncated
+
+def run_for_agent(query, parameters=None, user_id=None, tables=()):
+    """run_query with every outcome turned into text the SQL agent can act on"""
+    try:
+        _, rows, truncated = run_query(query, parameters, user_id=user_id, tables=tables)
+    except QueryKilled as exc:
+        if exc.reason == "not_read_only":
+            return f"Error: {exc}; the database cannot be modified from here."
+        if exc.reason == "forbidden":
+            return f"Error: only the tables {', '.join(tables)} can be queried, without a schema prefix."
+        return (f"Error: query stopped because {exc}. Write a cheaper query: select fewer columns, "
+                f"add WHERE filters, aggregate with SUM/COUNT/GROUP BY, or add a smaller LIMIT.")
+    except sqlite3.Error as exc:
+        return f"Error: {exc}"
+    if not rows:
+        return ""
+    result = str(rows)
+    if truncated:
+        result += f"\n(only the first {SQL_MAX_ROWS} rows are shown; aggregate or filter to see the rest)"
+    return result
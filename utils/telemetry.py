@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import inspect
+import functools
+import threading
+from contextlib import contextmanager
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Where to append one JSON line per recorded event (disabled when unset)
+TELEMETRY_LOG = os.getenv("TELEMETRY_LOG")
+# Default target of export_snapshot(): a file path or an http(s) endpoint
+TELEMETRY_EXPORT = os.getenv("TELEMETRY_EXPORT", "telemetry_snapshot.json")
+
+# USD per 1M tokens (input, output)
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gemini-1.5-flash": (0.075, 0.30),
+}
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+HISTOGRAM_BUCKETS_MS = [50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+_lock = threading.Lock()
+_aggregates = {}
+
+def estimate_cost(model, tokens_in, tokens_out):
+    # Longest matching prefix wins so "gpt-4o-mini" is not priced as "gpt-4o"
+    matches = [name for name in MODEL_PRICES if model and model.startswith(name)]
+    if not matches:
+        return 0.0
+    price_in, price_out = MODEL_PRICES[max(matches, key=len)]
+    return (tokens_in * price_in + tokens_out * price_out) / 1_000_000
+
+def record(kind, name, wall_ms, route=None, tokens_in=0, tokens_out=0, cost=0.0, error=False):
+    """Record one timed event (kind is node, router, llm, tool or sql)"""
+    event = {
+        "ts": time.time(), "kind": kind, "name": name, "wall_ms": round(wall_ms, 3),
+        "route": route, "tokens_in": tokens_in, "tokens_out": tokens_out,
+        "cost": cost, "error": error,
+    }
+    with _lock:
+        agg = _aggregates.setdefault((kind, name), {
+            "count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0,
+            "tokens_in": 0, "tokens_out": 0, "cost": 0.0, "routes": {},
+            "buckets": [0] * (len(HISTOGRAM_BUCKETS_MS) + 1),
+        })
+        agg["count"] += 1
+        agg["errors"] += int(error)
+        agg["total_ms"] += wall_ms
+        agg["max_ms"] = max(agg["max_ms"], wall_ms)
+        agg["tokens_in"] += tokens_in
+        agg["tokens_out"] += tokens_out
+        agg["cost"] += cost
+        if route:
+            agg["routes"][route] = agg["routes"].get(route, 0) + 1
+        bucket = next((i for i, bound in enumerate(HISTOGRAM_BUCKETS_MS) if wall_ms <= bound), len(HISTOGRAM_BUCKETS_MS))
+        agg["buckets"][bucket] += 1
+        if TELEMETRY_LOG:
+            with open(TELEMETRY_LOG, "a") as f:
+                f.write(json.dumps(event) + "\n")
+
+@contextmanager
+def span(kind, name, route=None):
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except Exception:
+        error = True
+        raise
+    finally:
+        record(kind, name, (time.perf_counter() - start) * 1000, route=route, error=error)
+
+def _route_of(result):
+    if isinstance(result, dict):
+        return result.get("current_agent") or result.get("route")
+    return result if isinstance(result, str) else None
+
+def instrument_node(name, kind="node"):
+    """Decorator timing a graph node (sync or async) and recording the route it produced"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    result = await func(*args, **kwargs)
+                except Exception:
+                    record(kind, name, (time.perf_counter() - start) * 1000, error=True)
+                    raise
+                record(kind, name, (time.perf_counter() - start) * 1000, route=_route_of(result))
+                return result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                record(kind, name, (time.perf_counter() - start) * 1000, error=True)
+                raise
+            record(kind, name, (time.perf_counter() - start) * 1000, route=_route_of(result))
+            return result
+        return wrapper
+    return decorator
+
+def _percentile(buckets, count, q):
+    # Upper bound of the bucket holding the q-th quantile
+    if not count:
+        return 0.0
+    target = q * count
+    seen = 0
+    for i, n in enumerate(buckets):
+        seen += n
+        if seen >= target:
+            return float(HISTOGRAM_BUCKETS_MS[i]) if i < len(HISTOGRAM_BUCKETS_MS) else float("inf")
+    return float("inf")
+
+def snapshot():
+    """Aggregated histograms, token counts and cost per (kind, name)"""
+    with _lock:
+        report = []
+        for (kind, name), agg in sorted(_aggregates.items()):
+            report.append(dict(
+                agg,
+                kind=kind,
+                name=name,
+                routes=dict(agg["routes"]),
+                buckets=list(agg["buckets"]),
+                bucket_bounds_ms=HISTOGRAM_BUCKETS_MS,
+                mean_ms=agg["total_ms"] / agg["count"] if agg["count"] else 0.0,
+                p50_ms=_percentile(agg["buckets"], agg["count"], 0.50),
+                p95_ms=_percentile(agg["buckets"], agg["count"], 0.95),
+                p99_ms=_percentile(agg["buckets"], agg["count"], 0.99),
+            ))
+        return report
+
+def export_snapshot(target=None):
+    """Write the snapshot to a JSON file, or POST it when target is an http(s) URL"""
+    target = target or TELEMETRY_EXPORT
+    payload = {"exported_at": time.time(), "metrics": snapshot()}
+    if target.startswith(("http://", "https://")):
+        import requests
+        requests.post(target, json=payload, timeout=5)
+    else:
+        with open(target, "w") as f:
+            json.dump(payload, f, indent=2, default=str)
+    return target
+
+def reset():
+    with _lock:
+        _aggregates.clear()
+
+class TelemetryCallbackHandler(BaseCallbackHandler):
+    """Records every LLM call (tokens and cost) and tool call made by the agents"""
+
+    def __init__(self):
+        self._starts = {}
+
+    def _start(self, run_id, name):
+        self._starts[run_id] = (time.perf_counter(), name)
+
+    def _finish(self, run_id, default):
+        # A run whose start was never seen (e.g. a handler added mid-run) is timed as 0 ms
+        start, name = self._starts.pop(run_id, (time.perf_counter(), default))
+        return (time.perf_counter() - start) * 1000, name
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model") or params.get("model_name") or "unknown"
+        agent = (metadata or {}).get("agent")
+        self._start(run_id, (model, agent))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self.on_chat_model_start(serialized, prompts, run_id=run_id, metadata=metadata, **kwargs)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        wall_ms, (model, agent) = self._finish(run_id, ("unknown", None))
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        tokens_in = usage.get("prompt_tokens", 0)
+        tokens_out = usage.get("completion_tokens", 0)
+        if not (tokens_in or tokens_out):
+            for generations in response.generations:
+                for generation in generations:
+                    usage_metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    tokens_in += usage_metadata.get("input_tokens", 0)
+                    tokens_out += usage_metadata.get("output_tokens", 0)
+        record("llm", f"{agent}:{model}" if agent else model, wall_ms, route=agent,
+               tokens_in=tokens_in, tokens_out=tokens_out,
+               cost=estimate_cost(model, tokens_in, tokens_out))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        wall_ms, (model, agent) = self._finish(run_id, ("unknown", None))
+        record("llm", f"{agent}:{model}" if agent else model, wall_ms, route=agent, error=True)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._start(run_id, (serialized or {}).get("name") or kwargs.get("name") or "tool")
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        wall_ms, name = self._finish(run_id, "tool")
+        record("sql" if name.startswith("sql_db") else "tool", name, wall_ms)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        wall_ms, name = self._finish(run_id, "tool")
+        record("sql" if name.startswith("sql_db") else "tool", name, wall_ms, error=True)
+
+telemetry_handler = TelemetryCallbackHandler()
+telemetry_callbacks = [telemetry_handler]
@@ -0,0 +1,60 @@
+import os
+import re
+from utils.telemetry import record
+
+# Tokens of tool output the model gets to see per call, by tool name
+TOOL_TOKEN_BUDGETS = {
+    "get_stock_data": int(os.getenv("TOOL_BUDGET_STOCK_DATA", "600")),
+    "get_finance_news": int(os.getenv("TOOL_BUDGET_FINANCE_NEWS", "700")),
+    "web_search": int(os.getenv("TOOL_BUDGET_WEB_SEARCH", "500")),
+    "search_travel_info": int(os.getenv("TOOL_BUDGET_TRAVEL_SEARCH", "500")),
+    "get_price_history": int(os.getenv("TOOL_BUDGET_PRICE_HISTORY", "400")),
+}
+DEFAULT_TOOL_TOKEN_BUDGET = 600
+# Rough size of a token in English text; good enough for budgeting
+CHARS_PER_TOKEN = 4
+
+BOILERPLATE = re.compile(
+    r"\b(cookies?|subscribe|sign up|sign in|log in|advertisement|all rights reserved|privacy policy|"
+    r"terms of (use|service)|enable javascript|newsletter|click here|read more)\b",
+    re.IGNORECASE,
+)
+# DuckDuckGo joins snippets with "...", news tools separate articles with blank lines
+SEGMENT_BREAK = re.compile(r"\n+|\.\.\.|(?<=[.!?])\s+(?=[A-Z])")
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def _segments(text):
+    for segment in SEGMENT_BREAK.split(text):
+        segment = " ".join(segment.split())
+        if segment:
+            yield segment
+
+def compact_tool_output(name, text, budget=None):
+    """Deduplicate, strip boilerplate and truncate one tool result to the tool's token budget"""
+    budget = budget or TOOL_TOKEN_BUDGETS.get(name, DEFAULT_TOOL_TOKEN_BUDGET)
+    max_chars = budget * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+
+    kept, seen, used = [], set(), 0
+    for segment in _segments(text):
+        fingerprint = re.sub(r"\W+", " ", segment.lower()).strip()
+        if not fingerprint or fingerprint in seen:
+            continue
+        # Short cookie banners and "read more" links, not sentences that merely mention them
+        if len(segment) < 160 and BOILERPLATE.search(segment):
+            continue
+        seen.add(fingerprint)
+        if used + len(segment) + 1 > max_chars:
+            break
+        kept.append(segment)
+        used += len(segment) + 1
+
+    compacted = "\n".join(kept)
+    if not compacted:
+        compacted = text[:max_chars]
+    compacted += f"\n[tool output compacted from ~{estimate_tokens(text)} to ~{estimate_tokens(compacted)} tokens]"
+    record("tool_compaction", name, 0.0, tokens_in=estimate_tokens(text), tokens_out=estimate_tokens(compacted))
+    return compacted
@@ -0,0 +1,147 @@
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from langchain_core.messages import ToolMessage
+from langchain_core.runnables import RunnableLambda
+from utils.telemetry import record
+from utils.tool_compaction import compact_tool_output
+
+# Seconds each tool may take before the turn continues without its result
+TOOL_TIMEOUTS = {
+    "get_stock_data": float(os.getenv("TOOL_TIMEOUT_STOCK_DATA", "10")),
+    "get_finance_news": float(os.getenv("TOOL_TIMEOUT_FINANCE_NEWS", "15")),
+    "web_search": float(os.getenv("TOOL_TIMEOUT_WEB_SEARCH", "15")),
+    "search_travel_info": float(os.getenv("TOOL_TIMEOUT_TRAVEL_SEARCH", "15")),
+}
+DEFAULT_TOOL_TIMEOUT = 20.0
+# Threads shared by every agent's tool calls
+TOOL_MAX_WORKERS = int(os.getenv("TOOL_MAX_WORKERS", "16"))
+# Calls of one tool that may hold a worker thread at once, counting timed-out calls
+# that are still running, so one hung service cannot take over the whole pool
+TOOL_MAX_IN_FLIGHT = int(os.getenv("TOOL_MAX_IN_FLIGHT", "4"))
+
+_pool = ThreadPoolExecutor(max_workers=TOOL_MAX_WORKERS, thread_name_prefix="tool")
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+def _claim(name):
+    with _in_flight_lock:
+        if _in_flight.get(name, 0) >= TOOL_MAX_IN_FLIGHT:
+            return False
+        _in_flight[name] = _in_flight.get(name, 0) + 1
+        return True
+
+def _release(name):
+    with _in_flight_lock:
+        _in_flight[name] -= 1
+
+def _submit(tool, args):
+    """Run tool.invoke on the shared pool, or return None when the tool has no free slot"""
+    if not _claim(tool.name):
+        return None
+    # Copy the context so contextvars (e.g. the current user) reach the worker thread
+    context = contextvars.copy_context()
+    future = _pool.submit(context.run, tool.invoke, args)
+    # The slot is freed when the call really ends (or is cancelled before starting), not at its deadline
+    future.add_done_callback(lambda _: _release(tool.name))
+    return future
+
+def in_flight():
+    """Calls per tool currently holding a worker thread"""
+    with _in_flight_lock:
+        return dict(_in_flight)
+
+def _pending_calls(state):
+    last_message = state["messages"][-1]
+    return getattr(last_message, "tool_calls", None) or []
+
+def _result_message(call, output):
+    # Only the compacted text is kept, so the raw output never reaches the checkpointed history
+    content = compact_tool_output(call["name"], str(output))
+    return ToolMessage(content=content, name=call["name"], tool_call_id=call["id"])
+
+def _error_message(call, error):
+    return ToolMessage(content=f"Error: {error}", name=call["name"], tool_call_id=call["id"], status="error")
+
+def _busy_message(call):
+    record("tool_busy", call["name"], 0, error=True)
+    return _error_message(call, f"{call['name']} is not responding to earlier requests yet. "
+                                "Answer with the other results and say this data is unavailable right now.")
+
+def _timeout_message(call, timeout, started):
+    record("tool_timeout", call["name"], (time.perf_counter() - started) * 1000, error=True)
+    return _error_message(call, f"{call['name']} did not respond within {timeout:g}s. "
+                                "Answer with the other results and say this data is unavailable right now.")
+
+def build_tool_executor(tools, timeouts=None):
+    """Graph node running every tool call of the last AI message concurrently.
+
+    Each call has its own deadline; a call that misses it is reported back to
+    the model as an error message so the turn continues with partial results.
+    A tool that already has TOOL_MAX_IN_FLIGHT calls running is not called again
+    until one of them ends. Results are compacted to the tool's token budget
+    before they are returned.
+    """
+    tools_by_name = {t.name: t for t in tools}
+    timeouts = dict(TOOL_TIMEOUTS, **(timeouts or {}))
+
+    def timeout_for(call):
+        return timeouts.get(call["name"], DEFAULT_TOOL_TIMEOUT)
+
+    def run_tools(state):
+        calls = _pending_calls(state)
+        started = time.perf_counter()
+        futures = []
+        for call in calls:
+            tool = tools_by_name.get(call["name"])
+            futures.append(_submit(tool, call["args"]) if tool is not None else None)
+
+        messages = []
+        for call, future in zip(calls, futures):
+            if call["name"] not in tools_by_name:
+                messages.append(_error_message(call, f"unknown tool {call['name']}"))
+                continue
+            if future is None:
+                messages.append(_busy_message(call))
+                continue
+            remaining = timeout_for(call) - (time.perf_counter() - started)
+            try:
+                messages.append(_result_message(call, future.result(timeout=max(remaining, 0))))
+            except FutureTimeout:
+                # The thread cannot be stopped; its late result is simply discarded
+                future.cancel()
+                messages.append(_timeout_message(call, timeout_for(call), started))
+            except Exception as exc:
+                messages.append(_error_message(call, exc))
+        return {"messages": messages}
+
+    async def arun_tools(state):
+        calls = _pending_calls(state)
+        started = time.perf_counter()
+
+        async def run_call(call):
+            tool = tools_by_name.get(call["name"])
+            if tool is None:
+                return _error_message(call, f"unknown tool {call['name']}")
+            if getattr(tool, "coroutine", None) is not None:
+                # Native async tools are cancelled at the deadline, so they hold no thread
+                pending = tool.ainvoke(call["args"])
+            else:
+                future = _submit(tool, call["args"])
+                if future is None:
+                    return _busy_message(call)
+                pending = asyncio.wrap_future(future)
+            try:
+                output = await asyncio.wait_for(pending, timeout_for(call))
+            except asyncio.TimeoutError:
+                return _timeout_message(call, timeout_for(call), started)
+            except Exception as exc:
+                return _error_message(call, exc)
+            return _result_message(call, output)
+
+        return {"messages": list(await asyncio.gather(*(run_call(call) for call in calls)))}
+
+    return RunnableLambda(run_tools, afunc=arun_tools)
@@ -0,0 +1,101 @@
+import os
+import time
+import threading
+from concurrent.futures import Future
+
+# Seconds a tool result stays valid: quotes move by the second, news and search results do not
+TOOL_TTLS = {
+    "stock_data": int(os.getenv("TOOL_TTL_STOCK_DATA", "30")),
+    "finance_news": int(os.getenv("TOOL_TTL_FINANCE_NEWS", "600")),
+    "web_search": int(os.getenv("TOOL_TTL_WEB_SEARCH", "900")),
+    "travel_search": int(os.getenv("TOOL_TTL_TRAVEL_SEARCH", str(24 * 3600))),
+}
+DEFAULT_TOOL_TTL = 60
+# Results kept per tool; the oldest entry is dropped first
+TOOL_CACHE_SIZE = int(os.getenv("TOOL_CACHE_SIZE", "512"))
+
+_lock = threading.Lock()
+_factories = {}
+_clients = {}
+_results = {}
+_inflight = {}
+_stats = {}
+
+def register_tool(name, factory):
+    """Register how to build the client behind a tool; it is built once, on first use"""
+    with _lock:
+        _factories[name] = factory
+        _clients.pop(name, None)
+        _results.pop(name, None)
+
+def set_client(name, client):
+    # Replace the client (e.g. with an offline stand-in) and forget its cached results
+    with _lock:
+        _clients[name] = client
+        _results.pop(name, None)
+
+def get_client(name):
+    with _lock:
+        if name not in _clients:
+            _clients[name] = _factories[name]()
+        return _clients[name]
+
+def _count(name, outcome):
+    tool_stats = _stats.setdefault(name, {"hits": 0, "misses": 0, "coalesced": 0})
+    tool_stats[outcome] += 1
+
+def cached_run(name, query):
+    """Run the tool's shared client on query, reusing fresh results.
+
+    Concurrent calls with the same query wait for the one fetch in flight
+    instead of starting their own.
+    """
+    key = " ".join(str(query).split()).lower()
+    with _lock:
+        results = _results.setdefault(name, {})
+        entry = results.get(key)
+        if entry and entry[0] > time.monotonic():
+            _count(name, "hits")
+            return entry[1]
+        future = _inflight.get((name, key))
+        leader = future is None
+        if leader:
+            future = _inflight[(name, key)] = Future()
+            _count(name, "misses")
+        else:
+            _count(name, "coalesced")
+
+    if not leader:
+        return future.result()
+
+    try:
+        value = get_client(name).run(query)
+    except Exception as exc:
+        with _lock:
+            _inflight.pop((name, key), None)
+        future.set_exception(exc)
+        raise
+
+    with _lock:
+        results = _results.setdefault(name, {})
+        results.pop(key, None)
+        results[key] = (time.monotonic() + TOOL_TTLS.get(name, DEFAULT_TOOL_TTL), value)
+        while len(results) > TOOL_CACHE_SIZE:
+            results.pop(next(iter(results)))
+        _inflight.pop((name, key), None)
+    future.set_result(value)
+    return value
+
+def clear_cache():
+    with _lock:
+        _results.clear()
+
+def tool_stats():
+    """Hit/miss/coalesced counters and hit rate per tool since process start"""
+    with _lock:
+        report = {}
+        for name, counts in _stats.items():
+            total = counts["hits"] + counts["misses"] + counts["coalesced"]
+            hit_rate = (counts["hits"] + counts["coalesced"]) / total if total else 0.0
+            report[name] = dict(counts, hit_rate=hit_rate)
+        return report